@@ -0,0 +1,108 @@
+"""Measure the cold start of the light toggl commands, which must not import pandas, against importing pandas.
+
+Every command runs in a fresh python process, so nothing is cached between runs except by the OS. The sync-state
+command reads a generated config and sync state file from a temp directory, so no config or network is needed.
+
+Usage:
+    python benchmarks/bench_cold_start.py --runs 20
+"""
+import argparse
+import json
+from os.path import abspath, dirname, join
+from statistics import median
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = dirname(dirname(abspath(__file__)))
+
+# heavy modules the light commands should never import
+HEAVY_MODULES = ["numpy", "pandas", "pyarrow", "sqlalchemy"]
+
+
+def build_commands(config_file, state_file):
+    """Build the commands to time
+
+    Args:
+        config_file (str): Full path to the generated config json file
+        state_file (str): Full path to the generated sync state json file
+
+    Returns:
+        command_list (list): List of (name, argument list) tuples
+
+    """
+    cli_file = join(REPO_DIR, "toggl_cli.py")
+    return [
+        ("python startup", [sys.executable, "-c", "pass"]),
+        ("import pandas", [sys.executable, "-c", "import pandas"]),
+        ("import toggl_extract", [sys.executable, "-c", "import toggl_extract"]),
+        ("toggl_cli.py --help", [sys.executable, cli_file, "--help"]),
+        ("toggl_cli.py sync-state", [sys.executable, cli_file, "sync-state", "--config-file", config_file,
+                                     "--state-file", state_file]),
+        ("import toggl_relational_extract", [sys.executable, "-c", "import toggl_relational_extract"]),
+    ]
+
+
+def time_command(argument_list, runs):
+    """Run a command in fresh processes
+
+    Args:
+        argument_list (list): Command and its arguments
+        runs (int): Number of runs
+
+    Returns:
+        secs_list (list): Wall time of every run in seconds
+
+    """
+    secs_list = []
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        subprocess.run(argument_list, cwd=REPO_DIR, check=True, stdout=subprocess.DEVNULL)
+        secs_list.append(time.perf_counter() - start_time)
+    return secs_list
+
+
+def imported_heavy_modules(module_name):
+    """Import a module in a fresh process and list the heavy modules it pulled in
+
+    Args:
+        module_name (str): Name of the module to import
+
+    Returns:
+        module_list (list): Names of the HEAVY_MODULES that were imported
+
+    """
+    code = (f"import sys, json, {module_name}; "
+            f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))")
+    output = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, check=True, capture_output=True, text=True)
+    return json.loads(output.stdout)
+
+
+def main(runs):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        config_file = join(temp_dir, "config.json")
+        state_file = join(temp_dir, "sync_state.json")
+        with open(config_file, "w") as json_data_file:
+            json.dump({"toggl_config": {"token": "bench", "user_agent": "bench", "workspace_id": "1"}}, json_data_file)
+        with open(state_file, "w") as json_data_file:
+            json.dump({"1": {str(project_id): {"updated": "2020-06-30T10:12:45+00:00", "synced_until": "2020-06-30"}
+                             for project_id in range(1000, 1100)}}, json_data_file)
+
+        print(f"{'command':>32} {'median secs':>12} {'min secs':>9}")
+        for name, argument_list in build_commands(config_file, state_file):
+            secs_list = time_command(argument_list, runs)
+            print(f"{name:>32} {median(secs_list):12.3f} {min(secs_list):9.3f}")
+
+    for module_name in ["toggl_extract", "toggl_cli", "toggl_sync_state"]:
+        module_list = imported_heavy_modules(module_name)
+        print(f"import {module_name} pulls in: {', '.join(module_list) or 'no heavy modules'}")
+        assert not module_list, f"{module_name} imports {module_list}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="Number of fresh processes per command")
+    args = parser.parse_args()
+
+    main(args.runs)
@@ -0,0 +1,77 @@
+"""Report the memory per entry of the raw entries frame against the compacted frame the relational pipeline uses.
+
+Entries are generated with the FakeWorkspace of benchmarks/fake_toggl_server.py, so no server or network is used.
+
+Usage:
+    python benchmarks/bench_entry_memory.py --entries 100000
+"""
+import argparse
+from os.path import abspath, dirname
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from fake_toggl_server import FakeWorkspace, PER_PAGE, add_workspace_arguments
+from toggl_relational_extract import RAW_ENTRY_COLUMNS
+from toggl_transform import compact_entries, convert_columns_to_utc, memory_bytes
+
+
+def build_raw_entry_df(workspace):
+    """Build the raw entries frame of a workspace, as iter_page_chunks builds it from the api pages
+
+    Args:
+        workspace (FakeWorkspace object): Workspace to take the entries from
+
+    Returns:
+        raw_entry_df (Pandas DataFrame object): Pandas DataFrame of raw toggl entries
+
+    """
+    since = workspace.start_datetime.date()
+    until = workspace.end_datetime.date()
+    row_list = []
+    for project in range(workspace.project_count):
+        page = 1
+        while True:
+            data = workspace.details(workspace.project_id(project), since, until, page)
+            row_list.extend(data["data"])
+            if page * PER_PAGE >= data["total_count"]:
+                break
+            page += 1
+    return pd.DataFrame(row_list)
+
+
+def main(args):
+    workspace = FakeWorkspace(entry_count=args.entries, project_count=args.projects, user_count=args.users,
+                              tag_count=args.tags, task_count=args.tasks)
+    raw_entry_df = build_raw_entry_df(workspace)
+    entry_count = len(raw_entry_df)
+
+    start_time = time.perf_counter()
+    compact_df = compact_entries(raw_entry_df)
+    compact_secs = time.perf_counter() - start_time
+    projected_df = convert_columns_to_utc(compact_entries(raw_entry_df, columns=RAW_ENTRY_COLUMNS),
+                                          ["start", "end", "updated"])
+
+    print(f"{entry_count} entries")
+    print(f"{'column':>18} {'raw bytes/entry':>16} {'compact bytes/entry':>20} {'compact dtype':>14}")
+    raw_usage = raw_entry_df.memory_usage(index=False, deep=True)
+    compact_usage = compact_df.memory_usage(index=False, deep=True)
+    for col in raw_entry_df.columns:
+        print(f"{col:>18} {raw_usage[col] / entry_count:16.1f} {compact_usage[col] / entry_count:20.1f} "
+              f"{str(compact_df[col].dtype):>14}")
+
+    for name, dataframe_name in [("raw", raw_entry_df), ("compact, all columns", compact_df),
+                                 ("compact, pipeline columns", projected_df)]:
+        print(f"{name:>26}: {memory_bytes(dataframe_name) / entry_count:8.1f} bytes per entry")
+    print(f"compact_entries took {compact_secs:.3f} secs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_workspace_arguments(parser)
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,125 @@
+"""Count the detailed report requests of a full pull per project against one for the whole workspace.
+
+Entries are pulled from benchmarks/fake_toggl_server.py through TogglApi.iter_toggl_log_data_windows, once with
+fetch_mode "project" and once with fetch_mode "workspace", both with the date ranges of archived projects skipped,
+and once per project without skipping them like before. Every mode must return the same entries. The archived
+projects only come from the projects request with active=both, the default active projects request has none.
+
+Usage:
+    python benchmarks/bench_fetch_mode.py --entries 100000 --projects 200 --archived-projects 800 --max-workers 8
+"""
+import argparse
+from contextlib import redirect_stdout
+from io import StringIO
+import json
+from os.path import abspath, dirname, join
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from fake_toggl_server import add_workspace_arguments, build_server
+import toggl_extract as te
+from toggl_sync_state import build_date_range_list
+
+# (name, fetch_mode, skip_dormant_projects) of every run
+MODES = [("project", "project", False), ("project, skip archived", "project", True),
+         ("workspace, skip archived", "workspace", True)]
+
+
+def run_mode(fake_server, work_dir, max_workers, fetch_mode, skip_dormant):
+    """Pull every project and yearly date range of the fake workspace
+
+    Args:
+        fake_server (FakeTogglServer object): Running fake server
+        work_dir (str): Directory to write the config json file to
+        max_workers (int): Number of concurrent requests
+        fetch_mode (str): One of te.FETCH_MODES
+        skip_dormant (bool): Leave out the date ranges of archived projects
+
+    Returns:
+        result (dict): Requests, secs and the ids of the entries pulled
+
+    """
+    config_file = join(work_dir, "config.json")
+    with open(config_file, "w") as json_data_file:
+        json.dump({"toggl_config": {"token": "benchmark", "user_agent": "benchmark",
+                                    "workspace_id": str(fake_server.workspace.workspace_id),
+                                    "max_workers": max_workers, "requests_per_second": 100000,
+                                    "rate_limit_burst": max_workers, "fetch_mode": fetch_mode,
+                                    "skip_dormant_projects": skip_dormant}}, json_data_file)
+    toggl_client = te.TogglApi(config_file=config_file)
+    fake_server.point_client(toggl_client.client)
+
+    start_requests = fake_server.stats["requests"]
+    start_time = time.perf_counter()
+    # the pipelines read the project ids from the projects table, filled from the same projects response
+    project_id_list = [project["id"] for project in toggl_client.get_toggl_projects()]
+    work_list = [(project, date_range) for project in project_id_list for date_range in build_date_range_list()]
+    entry_id_set = set()
+    with redirect_stdout(StringIO()):
+        for page_data in toggl_client.iter_toggl_log_data_windows(work_list):
+            entry_id_set.update(entry["id"] for entry in page_data)
+    return {"requests": fake_server.stats["requests"] - start_requests, "secs": time.perf_counter() - start_time,
+            "entry_ids": entry_id_set}
+
+
+def check_archived_projects(fake_server, work_dir):
+    """Check that TogglApi sees the archived projects, which the projects request only returns with active=false or
+    active=both
+
+    Args:
+        fake_server (FakeTogglServer object): Running fake server
+        work_dir (str): Directory to write the config json file to
+
+    Returns:
+        archived_count (int): Number of archived projects TogglApi got
+
+    """
+    config_file = join(work_dir, "config.json")
+    with open(config_file, "w") as json_data_file:
+        # same token and rate limit as run_mode - the rate limiter of a token is shared by every TogglApi
+        json.dump({"toggl_config": {"token": "benchmark", "user_agent": "benchmark",
+                                    "workspace_id": str(fake_server.workspace.workspace_id),
+                                    "requests_per_second": 100000}}, json_data_file)
+    toggl_client = te.TogglApi(config_file=config_file)
+    fake_server.point_client(toggl_client.client)
+
+    active_data = toggl_client.client.get_projects().json()
+    assert all(project["active"] for project in active_data), "the active projects request returned archived projects"
+    archived_count = sum(not project["active"] for project in toggl_client.get_toggl_projects())
+    expected_count = len(toggl_client.client.get_projects(active="false").json())
+    assert archived_count == expected_count, f"TogglApi got {archived_count} of {expected_count} archived projects"
+    return archived_count
+
+
+def main(args):
+    fake_server = build_server(args).start()
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            archived_count = check_archived_projects(fake_server, work_dir)
+            result_dict = {name: run_mode(fake_server, work_dir, args.max_workers, fetch_mode, skip_dormant)
+                           for name, fetch_mode, skip_dormant in MODES}
+    finally:
+        fake_server.stop()
+
+    print(f"{args.entries} entries, {args.projects} projects, {args.archived_projects} archived projects, "
+          f"{archived_count} projects archived in all")
+    print(f"{'mode':>26} {'requests':>9} {'secs':>8} {'entries':>8}")
+    for name, result in result_dict.items():
+        print(f"{name:>26} {result['requests']:9d} {result['secs']:8.2f} {len(result['entry_ids']):8d}")
+
+    expected_id_set = result_dict[MODES[0][0]]["entry_ids"]
+    for name, result in result_dict.items():
+        assert result["entry_ids"] == expected_id_set, f"{name} pulled different entries"
+    if archived_count:
+        assert result_dict[MODES[1][0]]["requests"] < result_dict[MODES[0][0]]["requests"], \
+            "no date ranges of archived projects were skipped"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_workspace_arguments(parser)
+    parser.add_argument("--max-workers", type=int, default=8, help="Number of concurrent requests")
+    main(parser.parse_args())
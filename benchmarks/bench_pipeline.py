@@ -0,0 +1,221 @@
+"""Time each stage of the toggl pipelines end to end against a local fake Toggl api.
+
+Entries are pulled from benchmarks/fake_toggl_server.py through TogglApi in chunks, like the pipelines do, and every
+chunk is loaded by the production code of each pipeline: toggl_data_pull.clean_entries and toggl_sqlite.upsert_rows
+into the toggl_data table of a fresh SQLite database and, if --postgres-url is given,
+toggl_relational_extract.transform_and_load_entries into the toggl_* tables of the toggl_bench schema of a postgres
+database, in one transaction like a run. The pull is shared, so the load times can be compared side by side.
+
+After the run the first chunk is loaded again - it must not add or change any rows.
+
+Usage:
+    python benchmarks/bench_pipeline.py --entries 100000 --max-workers 8
+    python benchmarks/bench_pipeline.py --entries 1000000 --postgres-url postgresql://user@localhost/toggl
+"""
+import argparse
+from contextlib import nullcontext, redirect_stdout
+from datetime import date
+from io import StringIO
+import json
+from os.path import abspath, dirname, join
+import sys
+import tempfile
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from fake_toggl_server import add_workspace_arguments, build_server
+from toggl_data_pull import clean_entries
+from toggl_dimension_cache import DimensionCache
+import toggl_extract as te
+from toggl_load import COPY_CHUNK_SIZE, defer_foreign_keys
+from toggl_metrics import RunMetrics
+from toggl_projects_data_pull import clean_projects
+from toggl_query import QueryCache
+import toggl_relational_extract as tre
+from toggl_scheduler import DEFAULT_STAGE_WORKERS
+from toggl_sqlite import connect_sqlite, upsert_rows
+from toggl_transform import ENTRY_CHUNK_SIZE, iter_page_chunks
+
+REPO_DIR = dirname(dirname(abspath(__file__)))
+
+# schema the postgres benchmark tables are created in, so existing toggl_* tables are never touched
+POSTGRES_SCHEMA = "toggl_bench"
+
+
+class SqliteSink():
+    def __init__(self, db_file):
+        """Load into the toggl_projects and toggl_data tables like toggl_projects_data_pull.py and
+        toggl_data_pull.py
+        """
+        self.name = "sqlite"
+        self.conn = connect_sqlite(db_file)
+        self.metrics = RunMetrics(pipeline="toggl_data_pull")
+
+    def load_projects(self, projects_data_list):
+        with self.metrics.stage("projects load", rows_in=len(projects_data_list)) as stage:
+            row_count = upsert_rows(self.conn, "toggl_projects", clean_projects(projects_data_list))
+            stage.add(rows_written=row_count)
+
+    def load_chunk(self, toggl_data_raw_df):
+        with self.metrics.stage("entry transform", rows_in=len(toggl_data_raw_df)) as stage:
+            entry_df = clean_entries(toggl_data_raw_df.copy())
+            stage.add(rows_out=len(entry_df))
+        with self.metrics.stage("entry load", rows_in=len(entry_df)) as stage:
+            row_count = upsert_rows(self.conn, "toggl_data", entry_df)
+            stage.add(rows_written=row_count)
+
+    def finish(self):
+        pass
+
+    def row_counts(self):
+        return {table_name: self.conn.execute(f'SELECT COUNT(*) FROM "{table_name}";').fetchone()[0]
+                for table_name in ["toggl_projects", "toggl_data"]}
+
+
+class PostgresSink():
+    def __init__(self, postgres_url, toggl_client, work_dir, stage_workers):
+        """Load into the toggl_* tables like toggl_relational_extract.py, every chunk in the one transaction of the
+        run. The toggl_data.sql tables are created from scratch in POSTGRES_SCHEMA.
+        """
+        self.name = "postgres"
+        self.toggl_client = toggl_client
+        self.workspace_id = int(toggl_client.settings["workspace_id"])
+        self.stage_workers = stage_workers
+        setup_engine = create_engine(postgres_url)
+        with setup_engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {POSTGRES_SCHEMA} CASCADE;"))
+            conn.execute(text(f"CREATE SCHEMA {POSTGRES_SCHEMA};"))
+        setup_engine.dispose()
+
+        self.engine = create_engine(postgres_url, connect_args={"options": f"-csearch_path={POSTGRES_SCHEMA}"})
+        with open(join(REPO_DIR, "toggl_data.sql")) as sql_file:
+            schema_sql = sql_file.read()
+        with self.engine.begin() as conn:
+            conn.execute(text(schema_sql))
+        tre.prepare_schema(self.engine, self.workspace_id, QueryCache(join(work_dir, "query_cache.json")))
+        self.dimension_cache = DimensionCache(engine=self.engine, workspace_id=self.workspace_id)
+        self.metrics = RunMetrics(pipeline="toggl_relational_extract")
+        self._begin()
+
+    def load_projects(self, projects_data_list):
+        # load_projects pulls the projects itself - the pull is counted in the projects pull stage
+        tre.load_projects(self.toggl_client, None, self.engine, self.conn, self.workspace_id, self.dimension_cache,
+                          COPY_CHUNK_SIZE, self.metrics)
+
+    def load_chunk(self, toggl_data_raw_df):
+        tre.transform_and_load_entries(toggl_data_raw_df, self.engine, self.conn, self.workspace_id,
+                                       self.dimension_cache, COPY_CHUNK_SIZE, self.metrics,
+                                       stage_workers=self.stage_workers)
+
+    def finish(self):
+        with self.metrics.stage("commit"):
+            self.transaction.commit()
+        self.conn.close()
+        # loads after the run, like the check of the first chunk, get a transaction of their own
+        self._begin()
+
+    def row_counts(self):
+        return {table_name: self.conn.execute(text(f"SELECT COUNT(*) FROM {table_name};")).scalar()
+                for table_name in ["toggl_user", "toggl_project", "toggl_task", "toggl_tag", "toggl_entry",
+                                   "toggl_entry_tag", "toggl_daily_project_user"]}
+
+    def _begin(self):
+        self.conn = self.engine.connect()
+        self.transaction = self.conn.begin()
+        defer_foreign_keys(self.conn, tre.LOADED_TABLES)
+
+
+def build_toggl_client(fake_server, work_dir, max_workers):
+    """Build a TogglApi pointed at the fake server, with a rate limit high enough not to be the bottleneck"""
+    config_file = join(work_dir, "config.json")
+    with open(config_file, "w") as json_data_file:
+        json.dump({"toggl_config": {"token": "benchmark", "user_agent": "benchmark",
+                                    "workspace_id": str(fake_server.workspace.workspace_id),
+                                    "max_workers": max_workers, "requests_per_second": 100000,
+                                    "rate_limit_burst": max_workers}}, json_data_file)
+    toggl_client = te.TogglApi(config_file=config_file)
+    fake_server.point_client(toggl_client.client)
+    return toggl_client
+
+
+def run_pipeline(toggl_client, sink_list, chunk_size):
+    """Pull every entry of the fake workspace and load each chunk into every sink
+
+    Returns:
+        pull_metrics (RunMetrics object): Metrics of the pull shared by every sink
+        first_chunk_df (Pandas DataFrame object): First chunk of raw entries, None if there were no entries
+
+    """
+    pull_metrics = RunMetrics(pipeline="bench_pipeline", http=toggl_client.http)
+    with pull_metrics.stage("projects pull", api=True) as stage:
+        projects_data_list = toggl_client.get_toggl_projects()
+        stage.add(rows_out=len(projects_data_list))
+    for sink in sink_list:
+        sink.load_projects(projects_data_list)
+
+    # every project over yearly date ranges, same as a full pull
+    work_list = [(project["id"], [date(year, 1, 1), date(year, 12, 31)]) for project in projects_data_list
+                 for year in range(2019, 2022)]
+    page_iter = pull_metrics.timed_iter("entry pull", toggl_client.iter_toggl_log_data_windows(work_list))
+    first_chunk_df = None
+    for toggl_data_raw_df in iter_page_chunks(page_iter, chunk_size=chunk_size):
+        if first_chunk_df is None:
+            first_chunk_df = toggl_data_raw_df.copy()
+        for sink in sink_list:
+            sink.load_chunk(toggl_data_raw_df)
+    for sink in sink_list:
+        sink.finish()
+    return pull_metrics, first_chunk_df
+
+
+def check_reload(sink_list, first_chunk_df):
+    """Load the first chunk again into every sink and check no rows were added, for example another task for the
+    entries without a description"""
+    if first_chunk_df is None:
+        return
+    for sink in sink_list:
+        count_dict = sink.row_counts()
+        # keep the reload out of the metrics of the run
+        sink.metrics = RunMetrics(pipeline="check_reload")
+        sink.load_chunk(first_chunk_df.copy())
+        sink.finish()
+        assert sink.row_counts() == count_dict, f"loading a chunk again changed the {sink.name} tables"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_workspace_arguments(parser)
+    parser.add_argument("--max-workers", type=int, default=4, help="Number of concurrent requests")
+    parser.add_argument("--chunk-size", type=int, default=ENTRY_CHUNK_SIZE,
+                        help="Number of entries transformed and loaded at once")
+    parser.add_argument("--stage-workers", type=int, default=DEFAULT_STAGE_WORKERS,
+                        help="Number of transform and load stages of toggl_relational_extract.py run at once")
+    parser.add_argument("--postgres-url", default=None,
+                        help=f"Also load into postgres, in the {POSTGRES_SCHEMA} schema which is dropped first")
+    parser.add_argument("--verbose", action="store_true", help="Show the progress output of the pipeline")
+    args = parser.parse_args()
+
+    fake_server = build_server(args).start()
+    work_dir = tempfile.mkdtemp(prefix="toggl_bench_")
+    try:
+        toggl_client = build_toggl_client(fake_server, work_dir, args.max_workers)
+        sink_list = [SqliteSink(join(work_dir, "toggl_bench.sqlite"))]
+        if args.postgres_url:
+            sink_list.append(PostgresSink(args.postgres_url, toggl_client, work_dir, args.stage_workers))
+        # the per page and per table progress output would drown the results
+        with nullcontext() if args.verbose else redirect_stdout(StringIO()):
+            pull_metrics, first_chunk_df = run_pipeline(toggl_client, sink_list, args.chunk_size)
+            metrics_dict = {sink.name: sink.metrics for sink in sink_list}
+            check_reload(sink_list, first_chunk_df)
+    finally:
+        fake_server.stop()
+
+    print("pull")
+    pull_metrics.print_summary()
+    for sink_name, metrics in metrics_dict.items():
+        print(f"\n{sink_name}")
+        metrics.print_summary()
+    print(f"\n{fake_server.stats['requests']} requests, {fake_server.stats['throttled']} throttled, "
+          f"client {toggl_client.http.connection_stats()}")
@@ -0,0 +1,120 @@
+"""Count the requests of a reconciliation against a full pull, for stored entries that drifted from the api.
+
+Every entry of benchmarks/fake_toggl_server.py is pulled once through TogglApi, like a full pull. Then a few stored
+entries are deleted, added or changed, and toggl_reconcile.py finds the (project, month) partitions that differ
+with the summary and probe methods. The months it finds are pulled again, as the pipelines do with --reconcile.
+
+Usage:
+    python benchmarks/bench_reconcile.py --entries 100000 --projects 50 --drift 20
+"""
+import argparse
+from contextlib import redirect_stdout
+from io import StringIO
+import json
+from os.path import abspath, dirname, join
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from fake_toggl_server import add_workspace_arguments, build_server
+import toggl_extract as te
+import toggl_reconcile as tr
+from toggl_sync_state import build_date_range_list
+
+# the fake workspace tracks every entry at UTC+1
+TIMEZONE = "Etc/GMT-1"
+
+
+def count_requests(fake_server, func):
+    """Run a function and count the requests it sent to the fake server
+
+    Args:
+        fake_server (FakeTogglServer object): Running fake server
+        func (function): Function to run
+
+    Returns:
+        result (tuple): (return value, requests, secs)
+
+    """
+    start_requests = fake_server.stats["requests"]
+    start_time = time.perf_counter()
+    with redirect_stdout(StringIO()):
+        value = func()
+    return value, fake_server.stats["requests"] - start_requests, time.perf_counter() - start_time
+
+
+def drift_entries(entry_df, drift_count, seed=0):
+    """Delete, add and change a few stored entries
+
+    Args:
+        entry_df (Pandas DataFrame object): Stored entries
+        drift_count (int): Number of entries to delete, to add and to change
+        seed (int, optional): Seed of the entries picked
+
+    Returns:
+        entry_df (Pandas DataFrame object): Stored entries that differ from the api in a few partitions
+
+    """
+    rnd = random.Random(seed)
+    picked_list = rnd.sample(range(len(entry_df)), drift_count * 3)
+    deleted_index = entry_df.index[picked_list[:drift_count]]
+    added_df = entry_df.iloc[picked_list[drift_count:drift_count * 2]].copy()
+    added_df["id"] = added_df["id"] + 10 ** 9
+    entry_df = pd.concat([entry_df, added_df], ignore_index=False)
+    entry_df.loc[entry_df.index[picked_list[drift_count * 2:]], "duration_secs"] += 60
+    return entry_df.drop(index=deleted_index).reset_index(drop=True)
+
+
+def main(args):
+    fake_server = build_server(args).start()
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            config_file = join(work_dir, "config.json")
+            with open(config_file, "w") as json_data_file:
+                json.dump({"toggl_config": {"token": "benchmark", "user_agent": "benchmark",
+                                            "workspace_id": str(fake_server.workspace.workspace_id),
+                                            "max_workers": args.max_workers, "requests_per_second": 100000,
+                                            "rate_limit_burst": args.max_workers, "timezone": TIMEZONE}},
+                          json_data_file)
+            toggl_client = te.TogglApi(config_file=config_file)
+            fake_server.point_client(toggl_client.client)
+
+            date_range_list = build_date_range_list()
+            project_id_list = [project["id"] for project in toggl_client.get_toggl_projects()]
+            work_list = [(project, date_range) for project in project_id_list for date_range in date_range_list]
+            page_list, full_requests, full_secs = count_requests(
+                fake_server, lambda: list(toggl_client.iter_toggl_log_data_windows(work_list)))
+
+            # the stored entries, in the columns toggl_reconcile.py reads from the tables
+            raw_df = pd.DataFrame([entry for page_data in page_list for entry in page_data])
+            entry_df = pd.DataFrame({"id": raw_df["id"], "pid": raw_df["pid"],
+                                     "start": pd.to_datetime(raw_df["start"], utc=True).dt.tz_localize(None),
+                                     "duration_secs": raw_df["dur"] / 1000, "updated": raw_df["updated"]})
+            entry_df = drift_entries(entry_df, args.drift)
+
+            print(f"{args.entries} entries, {args.projects} projects, {args.drift} entries deleted, added and "
+                  f"changed")
+            print(f"{'run':>24} {'requests':>9} {'secs':>8} {'months':>7}")
+            print(f"{'full pull':>24} {full_requests:9d} {full_secs:8.2f}")
+            for method in tr.RECONCILE_METHODS:
+                partition_list, requests, secs = count_requests(fake_server, lambda: tr.find_changed_partitions(
+                    toggl_client, entry_df, date_range_list, method=method, timezone=TIMEZONE))
+                _, refetch_requests, refetch_secs = count_requests(fake_server, lambda: list(
+                    toggl_client.iter_toggl_log_data_windows(tr.refetch_work_list(partition_list), skip_dormant=False)))
+                print(f"{'reconcile ' + method:>24} {requests:9d} {secs:8.2f} {len(partition_list):7d}")
+                print(f"{'pull differing months':>24} {refetch_requests:9d} {refetch_secs:8.2f}")
+    finally:
+        fake_server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_workspace_arguments(parser)
+    parser.add_argument("--max-workers", type=int, default=8, help="Number of concurrent requests")
+    parser.add_argument("--drift", type=int, default=20, help="Number of stored entries deleted, added and changed")
+    main(parser.parse_args())
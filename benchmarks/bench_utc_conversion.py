@@ -0,0 +1,75 @@
+"""Benchmark the vectorized UTC conversion against the original row by row convert_to_utc loop.
+
+Usage:
+    python benchmarks/bench_utc_conversion.py --rows 1000000
+"""
+import argparse
+from os.path import abspath, dirname
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from toggl_transform import convert_columns_to_utc, convert_to_utc
+
+DATE_COLUMNS = ["start_date", "end_date", "update_date"]
+
+
+def build_entry_df(row_count):
+    """Build an entry dataframe with api style ISO timestamps, half in winter time and half in summer time
+
+    Args:
+        row_count (int): Number of rows
+
+    Returns:
+        entry_df (Pandas DataFrame object): Pandas DataFrame with string date columns
+
+    """
+    start_series = pd.Series(pd.date_range("2019-01-01", periods=row_count, freq="17min"))
+    offset_series = np.where(start_series.dt.month.between(4, 9), "+02:00", "+01:00")
+    entry_df = pd.DataFrame({"id": np.arange(row_count)})
+    for minutes, col in zip([0, 45, 50], DATE_COLUMNS):
+        date_series = start_series + pd.Timedelta(minutes=minutes)
+        entry_df[col] = date_series.dt.strftime("%Y-%m-%dT%H:%M:%S") + offset_series
+    return entry_df
+
+
+def loop_conversion(entry_df):
+    """Original conversion - parse the columns to local time, then convert each cell with convert_to_utc"""
+    for col in DATE_COLUMNS:
+        entry_df[col] = pd.to_datetime(entry_df[col], utc=True).dt.tz_convert("Europe/Berlin")
+    utc_lists = [[], [], []]
+    for row in entry_df.values.tolist():
+        for i in range(len(DATE_COLUMNS)):
+            utc_lists[i].append(convert_to_utc(row[i + 1]))
+    for col, utc_list in zip(DATE_COLUMNS, utc_lists):
+        entry_df[col] = utc_list
+    return entry_df
+
+
+def vectorized_conversion(entry_df):
+    """New conversion - whole column conversion with convert_columns_to_utc"""
+    return convert_columns_to_utc(entry_df, DATE_COLUMNS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000, help="Number of entries to convert")
+    args = parser.parse_args()
+
+    entry_df = build_entry_df(args.rows)
+
+    results = {}
+    for name, conversion in [("loop", loop_conversion), ("vectorized", vectorized_conversion)]:
+        start_time = time.perf_counter()
+        results[name] = conversion(entry_df.copy())
+        elapsed_secs = time.perf_counter() - start_time
+        print(f"{name:>10}: {elapsed_secs:8.3f}s ({args.rows / elapsed_secs:,.0f} rows/sec)")
+
+    # both conversions must give the same timestamps
+    for col in DATE_COLUMNS:
+        pd.testing.assert_series_equal(pd.to_datetime(results["loop"][col]), results["vectorized"][col])
+    print("Results match")
@@ -0,0 +1,149 @@
+"""Time a full pull of several workspaces one after another against toggl_workspaces.py pulling them at once.
+
+Each workspace is served by its own benchmarks/fake_toggl_server.py with its own ids, and has its own token and
+rate limit in a "workspaces" config. The workspaces are first pulled one after another with
+toggl_relational_extract.py --workspace-id, then all at once with toggl_workspaces.py, each time into freshly created
+toggl_* tables in the toggl_bench_workspaces schema of the postgres database. Both must load the same rows.
+
+Usage:
+    python benchmarks/bench_workspaces.py --postgres-url postgresql://user@localhost/toggl --workspace-count 4 \\
+        --entries 20000 --latency-ms 20 --requests-per-second 20
+"""
+import argparse
+import json
+from os.path import abspath, dirname, join
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine.url import make_url
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from fake_toggl_server import FakeTogglServer, FakeWorkspace, add_workspace_arguments
+
+REPO_DIR = dirname(dirname(abspath(__file__)))
+
+# schema the benchmark tables are created in, so existing toggl_* tables are never touched
+POSTGRES_SCHEMA = "toggl_bench_workspaces"
+
+# ids of each workspace start this far apart
+WORKSPACE_ID_OFFSET = 10 ** 8
+
+
+def reset_schema(postgres_url):
+    """Create the toggl_data.sql tables from scratch in POSTGRES_SCHEMA"""
+    engine = create_engine(postgres_url)
+    with open(join(REPO_DIR, "toggl_data.sql")) as sql_file:
+        schema_sql = sql_file.read()
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {POSTGRES_SCHEMA} CASCADE;"))
+        conn.execute(text(f"CREATE SCHEMA {POSTGRES_SCHEMA};"))
+        conn.execute(text(f"SET search_path TO {POSTGRES_SCHEMA};"))
+        conn.execute(text(schema_sql))
+    engine.dispose()
+
+
+def count_rows(postgres_url):
+    """Count the rows of every workspace in the tables
+
+    Returns:
+        count_dict (dict): Table name -> sorted list of (workspace_id, row count)
+
+    """
+    engine = create_engine(postgres_url, connect_args={"options": f"-csearch_path={POSTGRES_SCHEMA}"})
+    with engine.connect() as conn:
+        count_dict = {table_name: sorted(tuple(row) for row in conn.execute(text(
+            f"SELECT workspace_id, COUNT(*) FROM {table_name} GROUP BY workspace_id;")))
+            for table_name in ["toggl_project", "toggl_task", "toggl_tag", "toggl_entry", "toggl_daily_project_user"]}
+    engine.dispose()
+    return count_dict
+
+
+def write_config(work_dir, fake_server_list, postgres_url, args):
+    """Write a config with one workspace per fake server, each with its own token and rate limit"""
+    url = make_url(postgres_url)
+    connection = f"{url.host or ''}{f':{url.port}' if url.port else ''}"
+    database = url.database + (f"?{urlencode(dict(url.query))}" if url.query else "")
+    config_file = join(work_dir, "config.json")
+    with open(config_file, "w") as json_data_file:
+        json.dump({
+            "toggl_config": {
+                "user_agent": "benchmark", "max_workers": args.max_workers,
+                "requests_per_second": args.requests_per_second, "rate_limit_burst": args.max_workers,
+                "query_cache_file": join(work_dir, "query_cache.json"),
+                "workspaces": [{"workspace_id": str(fake_server.workspace.workspace_id),
+                                "token": f"benchmark_{fake_server.workspace.workspace_id}",
+                                "api_base_url": f"{fake_server.base_url}/api/v9",
+                                "api_report_base_url": f"{fake_server.base_url}/reports/api/v2"}
+                               for fake_server in fake_server_list],
+            },
+            "database_config": {"user": url.username, "connection": connection, "database": database,
+                                "schema": POSTGRES_SCHEMA, "key_cache_file": join(work_dir, "key_cache.json")},
+        }, json_data_file)
+    return config_file
+
+
+def run_command(command):
+    """Run a pipeline in a fresh interpreter and time it"""
+    start_time = time.perf_counter()
+    result = subprocess.run([sys.executable] + command, cwd=REPO_DIR, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"{' '.join(command)} failed:\n{result.stdout[-2000:]}{result.stderr[-2000:]}")
+    return time.perf_counter() - start_time
+
+
+def main(args):
+    fake_server_list = [FakeTogglServer(FakeWorkspace(entry_count=args.entries, project_count=args.projects,
+                                                      user_count=args.users, tag_count=args.tags,
+                                                      task_count=args.tasks, workspace_id=workspace + 1,
+                                                      archived_project_count=args.archived_projects,
+                                                      id_offset=workspace * WORKSPACE_ID_OFFSET),
+                                        latency_ms=args.latency_ms, throttle_rate=args.throttle_rate).start()
+                        for workspace in range(args.workspace_count)]
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            config_file = write_config(work_dir, fake_server_list, args.postgres_url, args)
+            state_file = join(work_dir, "sync_state.json")
+
+            reset_schema(args.postgres_url)
+            serial_secs_list = [run_command(["toggl_relational_extract.py", "--config-file", config_file, "--full",
+                                             "--state-file", state_file, "--workspace-id",
+                                             str(fake_server.workspace.workspace_id)])
+                                for fake_server in fake_server_list]
+            serial_count_dict = count_rows(args.postgres_url)
+
+            reset_schema(args.postgres_url)
+            parallel_secs = run_command(["toggl_workspaces.py", "--config-file", config_file, "--full",
+                                         "--state-file", state_file])
+            parallel_count_dict = count_rows(args.postgres_url)
+    finally:
+        for fake_server in fake_server_list:
+            fake_server.stop()
+
+    print(f"{args.workspace_count} workspaces of {args.entries} entries, {args.latency_ms:.0f} ms latency, "
+          f"{args.requests_per_second} requests/sec per workspace")
+    print(f"{'run':>28} {'secs':>8}")
+    for workspace, secs in enumerate(serial_secs_list):
+        print(f"{'workspace ' + str(workspace + 1):>28} {secs:8.2f}")
+    print(f"{'one after another':>28} {sum(serial_secs_list):8.2f}")
+    print(f"{'toggl_workspaces.py':>28} {parallel_secs:8.2f}")
+    print(f"{'slowest workspace':>28} {max(serial_secs_list):8.2f}")
+
+    assert parallel_count_dict == serial_count_dict, "the runs loaded different rows"
+    assert len(parallel_count_dict["toggl_entry"]) == args.workspace_count, "a workspace loaded no entries"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_workspace_arguments(parser)
+    parser.add_argument("--postgres-url", required=True,
+                        help=f"Database to load into, in the {POSTGRES_SCHEMA} schema which is dropped first")
+    parser.add_argument("--workspace-count", type=int, default=4, help="Number of workspaces")
+    parser.add_argument("--max-workers", type=int, default=4, help="Number of concurrent requests per workspace")
+    parser.add_argument("--requests-per-second", type=float, default=20,
+                        help="Rate limit of each workspace's token")
+    main(parser.parse_args())
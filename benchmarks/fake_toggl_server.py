@@ -0,0 +1,354 @@
+"""Local stand-in for the Toggl projects, detailed report and summary report endpoints, serving a synthetic workspace.
+
+Entries are worked out from their position in the workspace instead of being stored, so a workspace of 5M entries
+costs no more memory than one of 10k. Every page is the same for the same scale.
+
+Usage:
+    python benchmarks/fake_toggl_server.py --entries 100000 --port 8080 --latency-ms 50 --throttle-rate 0.01
+
+    then point a TogglClientApi at it with point_client, or set api_base_url and api_report_base_url to the
+    printed urls.
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from math import ceil, floor
+import random
+import re
+from threading import Lock, Thread
+import time
+from urllib.parse import parse_qs, urlparse
+
+# entries per page of the detailed report, same as the real api
+PER_PAGE = 50
+
+# all entries are in this timezone, the same offset the api returns for a workspace in central europe
+ENTRY_TIMEZONE = timezone(timedelta(hours=1))
+
+PROJECTS_PATH = re.compile(r"^/api/v9/workspaces/(\d+)/projects$")
+DETAILS_PATH = "/reports/api/v2/details"
+SUMMARY_PATH = "/reports/api/v2/summary"
+
+
+class FakeWorkspace():
+    def __init__(self, entry_count=10000, project_count=10, user_count=5, tag_count=20, task_count=200,
+                 start_date="2019-01-01", end_date="2021-12-31", workspace_id=1, archived_project_count=0,
+                 id_offset=0):
+        """Synthetic workspace with its entries spread evenly over the projects and over the date range
+
+        Args:
+            entry_count (int, optional): Number of entries in the workspace
+            project_count (int, optional): Number of projects
+            user_count (int, optional): Number of users
+            tag_count (int, optional): Number of distinct tags
+            task_count (int, optional): Number of distinct descriptions, the first one is entries without one
+            start_date (str, optional): First day with entries
+            end_date (str, optional): Last day with entries
+            workspace_id (int, optional): Workspace id
+            archived_project_count (int, optional): Number of extra projects without entries, archived on
+                start_date
+            id_offset (int, optional): Added to every project and entry id, so several workspaces served at once
+                have ids of their own, like in toggl
+
+        Returns:
+
+        """
+        self.workspace_id = workspace_id
+        self.entry_count = entry_count
+        self.project_count = project_count
+        self.user_count = user_count
+        self.tag_count = tag_count
+        self.task_count = task_count
+        self.archived_project_count = archived_project_count
+        self.id_offset = id_offset
+        self.start_datetime = datetime.strptime(start_date, "%Y-%m-%d").replace(tzinfo=ENTRY_TIMEZONE)
+        self.end_datetime = (datetime.strptime(end_date, "%Y-%m-%d").replace(tzinfo=ENTRY_TIMEZONE)
+                             + timedelta(days=1))
+
+        # entries of each project and the entry id before the first one
+        self.project_entry_counts = [entry_count // project_count + (1 if project < entry_count % project_count
+                                                                     else 0) for project in range(project_count)]
+        self.project_id_offsets = [sum(self.project_entry_counts[:project]) for project in range(project_count)]
+
+    def project_id(self, project):
+        return 1000 + self.id_offset + project
+
+    def projects(self, active="true"):
+        """Projects as returned by GET /workspaces/{workspace_id}/projects
+
+        Args:
+            active (str, optional): "true" for the active projects, like the api without the active parameter,
+                "false" for the archived projects and "both" for all of them
+
+        Returns:
+            projects_data (list): List of project dictionaries
+
+        """
+        created_at = self.start_datetime.isoformat()
+        # inactive projects with entries were archived after their last entry
+        archived_at = self.end_datetime.isoformat()
+        projects_data = [
+            {"id": self.project_id(project), "wid": self.workspace_id, "name": f"Project {project:04d}",
+             "billable": project % 2 == 0, "is_private": False, "active": project % 5 != 4,
+             "template": False, "at": created_at if project % 5 != 4 else archived_at,
+             "created_at": created_at, "auto_estimates": False}
+            for project in range(self.project_count)] + [
+            {"id": self.project_id(project), "wid": self.workspace_id, "name": f"Archived {project:04d}",
+             "billable": False, "is_private": False, "active": False, "template": False, "at": created_at,
+             "created_at": created_at, "auto_estimates": False}
+            for project in range(self.project_count, self.project_count + self.archived_project_count)]
+        if active.lower() == "both":
+            return projects_data
+        return [project for project in projects_data if project["active"] == (active.lower() == "true")]
+
+    def details(self, project_id, since, until, page):
+        """Detailed report page for a project and date range
+
+        Args:
+            project_id (int): Project id, None for every project in the workspace
+            since (date): First day of the date range
+            until (date): Last day of the date range
+            page (int): Page number, starting at 1
+
+        Returns:
+            data (dict): Json response with total_count, per_page and data
+
+        """
+        if project_id is None:
+            project_list = list(range(self.project_count))
+        else:
+            project = project_id - self.project_id(0)
+            project_list = [project] if 0 <= project < self.project_count else []
+
+        # (project, first index, last index, step secs) of the entries in the date range, one project after another
+        slice_list = [(project,) + self.entry_slice(project, since, until) for project in project_list]
+        total_count = sum(last_index - first_index for _, first_index, last_index, _ in slice_list)
+
+        # walk the projects to the entries of the page
+        skip_count = (page - 1) * PER_PAGE
+        data = []
+        for project, first_index, last_index, step_secs in slice_list:
+            page_start = first_index + min(skip_count, last_index - first_index)
+            skip_count -= page_start - first_index
+            page_end = min(last_index, page_start + PER_PAGE - len(data))
+            data.extend(self.entry(project, index, step_secs) for index in range(page_start, page_end))
+        return {"total_count": total_count, "per_page": PER_PAGE, "data": data}
+
+    def summary(self, since, until):
+        """Summary report of the time tracked on every project in a date range
+
+        Args:
+            since (date): First day of the date range
+            until (date): Last day of the date range
+
+        Returns:
+            data (dict): Json response with total_grand and one data item per project with entries
+
+        """
+        data = []
+        for project in range(self.project_count):
+            first_index, last_index, step_secs = self.entry_slice(project, since, until)
+            if last_index > first_index:
+                data.append({"id": self.project_id(project), "time": sum(
+                    self.entry(project, index, step_secs)["dur"] for index in range(first_index, last_index))})
+        return {"total_grand": sum(item["time"] for item in data), "data": data}
+
+    def entry_slice(self, project, since, until):
+        """Find the entries of a project in a date range
+
+        Args:
+            project (int): Position of the project in the workspace
+            since (date): First day of the date range
+            until (date): Last day of the date range
+
+        Returns:
+            entry_slice (tuple): (first index, last index, step secs) - the entries from first index up to but not
+                including last index start in the date range
+
+        """
+        # entries are evenly spaced, so the entries in the date range are a slice of the project's entries
+        entry_count = self.project_entry_counts[project]
+        step_secs = (self.end_datetime - self.start_datetime).total_seconds() / max(entry_count, 1)
+        since_secs = (datetime(since.year, since.month, since.day, tzinfo=ENTRY_TIMEZONE)
+                      - self.start_datetime).total_seconds()
+        until_secs = (datetime(until.year, until.month, until.day, tzinfo=ENTRY_TIMEZONE) + timedelta(days=1)
+                      - self.start_datetime).total_seconds()
+        first_index = max(0, ceil(since_secs / step_secs))
+        last_index = max(first_index, min(entry_count, ceil(until_secs / step_secs)))
+        return first_index, last_index, step_secs
+
+    def entry(self, project, index, step_secs):
+        """Build one entry of a project
+
+        Args:
+            project (int): Position of the project in the workspace
+            index (int): Position of the entry in the project, in start order
+            step_secs (float): Seconds between the starts of two entries of the project
+
+        Returns:
+            entry (dict): Entry as returned in the detailed report data
+
+        """
+        start = self.start_datetime + timedelta(seconds=floor(index * step_secs))
+        # 15 to 120 minutes, never running into the next entry
+        dur_secs = min(900 * (1 + (index + project) % 8), max(60, floor(step_secs)))
+        end = start + timedelta(seconds=dur_secs)
+        user = (index * 7 + project) % self.user_count
+        task = (index * 13 + project) % self.task_count
+        tag_list = [f"tag {(index * 5 + project + i * 3) % self.tag_count:03d}" for i in range(index % 3)]
+        # the first task stands for the entries tracked without a description
+        return {"id": self.id_offset + self.project_id_offsets[project] + index + 1, "pid": self.project_id(project),
+                "tid": None, "uid": 100 + user, "description": f"Task {task:05d}" if task else None,
+                "start": start.isoformat(),
+                "end": end.isoformat(), "updated": (end + timedelta(hours=1)).isoformat(), "dur": dur_secs * 1000,
+                "user": f"User {user:03d}", "use_stop": True, "client": None, "project": f"Project {project:04d}",
+                "project_color": "0", "project_hex_color": "#06aaf5", "task": None, "billable": None,
+                "is_billable": project % 2 == 0, "cur": None, "tags": tag_list}
+
+
+class FakeTogglServer():
+    def __init__(self, workspace, host="127.0.0.1", port=0, latency_ms=0, throttle_rate=0.0, retry_after_secs=0.1,
+                 seed=0):
+        """Http server for a FakeWorkspace, run in a background thread
+
+        Args:
+            workspace (FakeWorkspace object): Workspace to serve
+            host (str, optional): Host to listen on
+            port (int, optional): Port to listen on, 0 picks a free port
+            latency_ms (float, optional): Delay added to every response
+            throttle_rate (float, optional): Share of requests answered with 429 Too Many Requests
+            retry_after_secs (float, optional): Retry-After header sent with the 429 responses
+            seed (int, optional): Seed of the random 429 responses
+
+        Returns:
+
+        """
+        self.workspace = workspace
+        self.latency_secs = latency_ms / 1000
+        self.throttle_rate = throttle_rate
+        self.retry_after_secs = retry_after_secs
+        self.random = random.Random(seed)
+        self.stats = {"requests": 0, "throttled": 0}
+        self.lock = Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def point_client(self, client):
+        """Send the requests of a TogglClientApi to this server
+
+        Args:
+            client (TogglClientApi object): Client to point at the server, for example TogglApi().client
+
+        Returns:
+
+        """
+        client.api_base_url = f"{self.base_url}/api/v9"
+        client.api_report_base_url = f"{self.base_url}/reports/api/v2"
+        client.workspace_id = self.workspace.workspace_id
+
+    def _handler_class(self):
+        server = self
+
+        class FakeTogglHandler(BaseHTTPRequestHandler):
+            # keep connections alive, like the real api
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with server.lock:
+                    server.stats["requests"] += 1
+                    throttled = server.throttle_rate and server.random.random() < server.throttle_rate
+                    if throttled:
+                        server.stats["throttled"] += 1
+                if server.latency_secs:
+                    time.sleep(server.latency_secs)
+                if throttled:
+                    self._send(429, {"error": "Too Many Requests"},
+                               headers={"Retry-After": str(server.retry_after_secs)})
+                    return
+
+                url = urlparse(self.path)
+                params = {key: value[0] for key, value in parse_qs(url.query).items()}
+                if PROJECTS_PATH.match(url.path):
+                    self._send(200, server.workspace.projects(active=params.get("active", "true")))
+                elif url.path == DETAILS_PATH:
+                    self._send(200, server.workspace.details(
+                        project_id=int(params["project_ids"]) if params.get("project_ids") else None,
+                        since=datetime.strptime(params["since"], "%Y-%m-%d").date(),
+                        until=datetime.strptime(params["until"], "%Y-%m-%d").date(),
+                        page=int(params.get("page", 1))))
+                elif url.path == SUMMARY_PATH:
+                    self._send(200, server.workspace.summary(
+                        since=datetime.strptime(params["since"], "%Y-%m-%d").date(),
+                        until=datetime.strptime(params["until"], "%Y-%m-%d").date()))
+                else:
+                    self._send(404, {"error": f"Unknown path {url.path}"})
+
+            def _send(self, status_code, data, headers=None):
+                body = json.dumps(data).encode()
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                # keep the benchmark output readable
+                pass
+
+        return FakeTogglHandler
+
+
+def add_workspace_arguments(parser):
+    """Add the workspace scale and fault injection arguments to an argument parser"""
+    parser.add_argument("--entries", type=int, default=10000, help="Number of entries in the workspace")
+    parser.add_argument("--projects", type=int, default=10, help="Number of projects")
+    parser.add_argument("--users", type=int, default=5, help="Number of users")
+    parser.add_argument("--tags", type=int, default=20, help="Number of distinct tags")
+    parser.add_argument("--tasks", type=int, default=200, help="Number of distinct descriptions")
+    parser.add_argument("--archived-projects", type=int, default=0,
+                        help="Number of archived projects without entries")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay added to every response")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="Share of requests answered with 429 Too Many Requests")
+
+
+def build_server(args, port=0):
+    """Build a FakeTogglServer from parsed add_workspace_arguments arguments"""
+    workspace = FakeWorkspace(entry_count=args.entries, project_count=args.projects, user_count=args.users,
+                              tag_count=args.tags, task_count=args.tasks,
+                              archived_project_count=args.archived_projects)
+    return FakeTogglServer(workspace, port=port, latency_ms=args.latency_ms, throttle_rate=args.throttle_rate)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_workspace_arguments(parser)
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    args = parser.parse_args()
+
+    fake_server = build_server(args, port=args.port)
+    print(f"Serving {args.entries} entries in {args.projects} projects")
+    print(f"api_base_url: {fake_server.base_url}/api/v9")
+    print(f"api_report_base_url: {fake_server.base_url}/reports/api/v2")
+    try:
+        fake_server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        fake_server.stop()
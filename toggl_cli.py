@@ -0,0 +1,182 @@
+import argparse
+from importlib import import_module
+import sys
+
+# pipeline commands -> module with add_arguments, run and DESCRIPTION. The modules import pandas, sqlalchemy and
+# pyarrow, so they are only imported when their command runs
+PIPELINE_COMMANDS = {
+    "relational": "toggl_relational_extract",
+    "pull": "toggl_data_pull",
+    "pull-projects": "toggl_projects_data_pull",
+    "workspaces": "toggl_workspaces",
+}
+
+# commands run by toggl_cli.py itself - projects and sync-state only need TogglApi or the sync state file and are
+# kept free of pandas for a fast start
+LIGHT_COMMANDS = {
+    "projects": "List the toggl projects of the workspace",
+    "sync-state": "Show the watermark and date range granularity of every project in the sync state",
+    "totals": "Show the hours per project, user, task or tag over a date range",
+}
+
+
+def list_projects(args):
+    """Print the id and name of every project in the workspace
+
+    Args:
+        args (Namespace object): Parsed command line arguments
+
+    Returns:
+
+    """
+    import toggl_extract as te
+
+    toggl_client = te.TogglApi(config_file=args.config_file, workspace_id=args.workspace_id)
+    for project in toggl_client.get_toggl_projects():
+        print(f"{project['id']:>12} {project['name']}")
+
+
+def show_sync_state(args):
+    """Print the watermark, synced until date and granularity of every project in the sync state of a pipeline
+
+    Args:
+        args (Namespace object): Parsed command line arguments
+
+    Returns:
+
+    """
+    from toggl_config import load_config, select_workspace
+    from toggl_sync_state import SyncState
+
+    toggl_config = select_workspace(load_config(args.config_file), args.workspace_id)["toggl_config"]
+    sync_state = SyncState(workspace_id=toggl_config["workspace_id"], pipeline=PIPELINE_COMMANDS[args.pipeline],
+                           state_file=args.state_file)
+    if not sync_state.projects:
+        print("No projects synced yet")
+        return
+    print(f"{'project':>12} {'updated watermark':>32} {'synced until':>12} {'granularity':>11}")
+    for project, project_state in sorted(sync_state.projects.items(), key=lambda item: int(item[0])):
+        # the date ranges of the workspace fetch_mode are remembered under project 0
+        project = "workspace" if project == "0" else project
+        print(f"{project:>12} {str(project_state.get('updated')):>32} {str(project_state.get('synced_until')):>12} "
+              f"{project_state.get('granularity', 'year'):>11}")
+
+
+def show_totals(args):
+    """Print the hours per project, user, task or tag over a date range, from the postgres tables, the sqlite
+    toggl_data table or the parquet landing zone
+
+    Args:
+        args (Namespace object): Parsed command line arguments
+
+    Returns:
+        totals_df (Pandas DataFrame object): Pandas DataFrame with name, hours and entry_count columns
+
+    """
+    from datetime import date
+    import time
+
+    from toggl_config import load_config
+    import toggl_query as tq
+
+    config = load_config(args.config_file)
+    if args.store == "postgres":
+        from toggl_relational_extract import build_engine
+        store = tq.PostgresStore(build_engine(config["database_config"]), workspace_id=args.workspace_id)
+    elif args.store == "sqlite":
+        from toggl_sqlite import SQLITE_FILE, connect_sqlite
+        sqlite_file = args.sqlite_file or SQLITE_FILE
+        store = tq.SqliteStore(connect_sqlite(sqlite_file), sqlite_file)
+    else:
+        store = tq.LandingStore(config["toggl_config"]["landing_dir"])
+    cache = None if args.no_cache else tq.QueryCache(config["toggl_config"].get("query_cache_file"))
+
+    end_date = date.fromisoformat(args.end) if args.end else date.today()
+    start_date = date.fromisoformat(args.start) if args.start else date(end_date.year, 1, 1)
+    start_time = time.perf_counter()
+    totals_df = tq.TimeQuery(store, cache=cache).totals(args.by, start_date, end_date)
+    query_secs = time.perf_counter() - start_time
+
+    print(f"{args.by:>40} {'hours':>10} {'entries':>8}")
+    for name, hours, entry_count in zip(totals_df["name"], totals_df["hours"], totals_df["entry_count"]):
+        print(f"{name or '(none)':>40} {hours:10.2f} {entry_count:8d}")
+    print(f"{start_date} to {end_date}, {totals_df['hours'].sum():.2f} hours ({query_secs * 1000:.0f} ms)")
+    return totals_df
+
+
+def build_parser():
+    """Build the argument parser of the toggl command line
+
+    Args:
+
+    Returns:
+        parser (ArgumentParser object): Parser with one subcommand per pipeline and light command
+
+    """
+    parser = argparse.ArgumentParser(description="Toggl extract pipelines and tools")
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    subparsers.required = True
+
+    for command in PIPELINE_COMMANDS:
+        # the arguments of a pipeline are parsed by the pipeline itself, so --help does not import it
+        subparsers.add_parser(command, add_help=False, help=f"Run {PIPELINE_COMMANDS[command]}.py, see "
+                                                            f"'{command} --help'")
+
+    projects_parser = subparsers.add_parser("projects", help=LIGHT_COMMANDS["projects"])
+    projects_parser.add_argument("--config-file", default=None, help="Full path to the config json file")
+    projects_parser.add_argument("--workspace-id", default=None, help="Workspace of the config, defaults to the first")
+    projects_parser.set_defaults(func=list_projects)
+
+    sync_state_parser = subparsers.add_parser("sync-state", help=LIGHT_COMMANDS["sync-state"])
+    sync_state_parser.add_argument("--config-file", default=None, help="Full path to the config json file")
+    sync_state_parser.add_argument("--state-file", default=None, help="Full path to the sync state json file")
+    sync_state_parser.add_argument("--pipeline", choices=["relational", "pull"], default="relational",
+                                   help="Pipeline whose sync state to show, each keeps its own watermarks")
+    sync_state_parser.add_argument("--workspace-id", default=None,
+                                   help="Workspace of the config, defaults to the first")
+    sync_state_parser.set_defaults(func=show_sync_state)
+
+    totals_parser = subparsers.add_parser("totals", help=LIGHT_COMMANDS["totals"])
+    totals_parser.add_argument("--by", choices=["project", "user", "task", "tag"], default="project",
+                               help="Dimension to total the hours by")
+    totals_parser.add_argument("--start", default=None, help="First day, for example 2020-01-01. Defaults to the "
+                                                             "first day of the year of --end")
+    totals_parser.add_argument("--end", default=None, help="Last day, for example 2020-12-31. Defaults to today")
+    totals_parser.add_argument("--store", choices=["postgres", "sqlite", "landing"], default="postgres",
+                               help="Tables to total: the postgres toggl_* tables, the sqlite toggl_data table or "
+                                    "the parquet landing zone")
+    totals_parser.add_argument("--no-cache", action="store_true", help="Compute every day instead of using the "
+                                                                       "query cache")
+    totals_parser.add_argument("--config-file", default=None, help="Full path to the config json file")
+    totals_parser.add_argument("--sqlite-file", default=None, help="Full path to the sqlite database file")
+    totals_parser.add_argument("--workspace-id", default=None,
+                               help="Only total the entries of this workspace in postgres, defaults to every workspace")
+    totals_parser.set_defaults(func=show_totals)
+    return parser
+
+
+def main(argv=None):
+    """Run a command of the toggl command line, for example:
+        python toggl_cli.py relational --full
+        python toggl_cli.py sync-state
+
+    Args:
+        argv (list, optional): Command line arguments, defaults to sys.argv
+
+    Returns:
+
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in PIPELINE_COMMANDS:
+        # hand the rest of the arguments to the pipeline, only now importing it
+        pipeline = import_module(PIPELINE_COMMANDS[argv[0]])
+        pipeline_parser = argparse.ArgumentParser(prog=f"toggl_cli.py {argv[0]}", description=pipeline.DESCRIPTION)
+        pipeline.add_arguments(pipeline_parser)
+        return pipeline.run(pipeline_parser.parse_args(argv[1:]))
+
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+from contextlib import contextmanager
+import json
+from os import environ
+from os.path import join, splitext
+
+try:
+    import fcntl
+except ImportError:
+    # no file locks on windows - only one process at a time may save the shared files there
+    fcntl = None
+
+# default location of the config file
+CONFIG_FILE = join(environ["HOME"], "repos/toggl_api/config.json")
+
+
+def load_config(config_file=None):
+    """Read the config json file
+
+    Args:
+        config_file (str, optional): Full path to config json file, defaults to CONFIG_FILE
+
+    Returns:
+        data (dict): Config with a "toggl_config" and, for the database pipelines, a "database_config" section
+
+    """
+    with open(config_file or CONFIG_FILE) as json_data_file:
+        return json.load(json_data_file)
+
+
+def workspace_configs(config):
+    """Get the toggl_config of every workspace in the config. The toggl_config can list several workspaces, each
+    with its own token and settings, in "workspaces". The keys of a workspace override the shared keys:
+        "toggl_config": {
+            "user_agent": "toggl_login",
+            "max_workers": 4,
+            "workspaces": [
+                {"workspace_id": "123", "token": "first_token"},
+                {"workspace_id": "456", "token": "second_token", "requests_per_second": 2}
+            ]
+        }
+
+    Args:
+        config (dict): Config, see load_config
+
+    Returns:
+        toggl_config_list (list): One toggl_config dictionary per workspace, without "workspaces". A config without
+            "workspaces" has its toggl_config as the only workspace
+
+    """
+    shared_settings = {key: value for key, value in config["toggl_config"].items() if key != "workspaces"}
+    workspace_list = config["toggl_config"].get("workspaces")
+    if not workspace_list:
+        return [shared_settings]
+    return [{**shared_settings, **workspace_settings} for workspace_settings in workspace_list]
+
+
+def select_workspace(config, workspace_id=None):
+    """Narrow the toggl_config of a config down to one workspace
+
+    Args:
+        config (dict): Config, see load_config
+        workspace_id (str, optional): Workspace id, defaults to the first workspace of the config
+
+    Returns:
+        config (dict): Copy of the config whose toggl_config holds the settings of the workspace
+
+    """
+    toggl_config_list = workspace_configs(config)
+    if workspace_id is None:
+        return {**config, "toggl_config": toggl_config_list[0]}
+    for toggl_config in toggl_config_list:
+        if str(toggl_config["workspace_id"]) == str(workspace_id):
+            return {**config, "toggl_config": toggl_config}
+    raise ValueError(f"Workspace {workspace_id} is not in the config")
+
+
+def workspace_file(file_name, workspace_id):
+    """Give a file shared by every workspace a name of its own per workspace, for example
+    /home/user/key_cache.json -> /home/user/key_cache.123.json
+
+    Args:
+        file_name (str): Full path to the file, None is passed through
+        workspace_id (str): Workspace id
+
+    Returns:
+        file_name (str): Full path to the file of the workspace
+
+    """
+    if not file_name:
+        return file_name
+    root, ext = splitext(file_name)
+    return f"{root}.{workspace_id}{ext}"
+
+
+@contextmanager
+def locked_file(file_name):
+    """Hold an exclusive lock for a file shared by processes, around reading, changing and replacing it. The lock is
+    taken on a separate .lock file, as replacing the file gives it a new inode
+
+    Args:
+        file_name (str): Full path to the shared file
+
+    Yields:
+
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(f"{file_name}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -1,18 +1,24 @@
 CREATE TABLE "toggl_project" (
   "id" SERIAL PRIMARY KEY,
-  "project_name" varchar UNIQUE,
+  "workspace_id" bigint,
+  "project_name" varchar,
   "created_at_date" timestamp,
-  "active" boolean
+  "active" boolean,
+  UNIQUE ("workspace_id", "project_name")
 );
 
 CREATE TABLE "toggl_task" (
   "id" SERIAL PRIMARY KEY,
-  "task_name" varchar UNIQUE
+  "workspace_id" bigint,
+  "task_name" varchar,
+  UNIQUE ("workspace_id", "task_name")
 );
 
 CREATE TABLE "toggl_tag" (
   "id" SERIAL PRIMARY KEY,
-  "tag_name" varchar UNIQUE
+  "workspace_id" bigint,
+  "tag_name" varchar,
+  UNIQUE ("workspace_id", "tag_name")
 );
 
 CREATE TABLE "toggl_user" (
@@ -23,11 +29,13 @@ CREATE TABLE "toggl_user" (
 CREATE TABLE "toggl_entry_tag" (
   "id" SERIAL PRIMARY KEY,
   "toggl_entry_id" int,
-  "toggl_tag_id" int
+  "toggl_tag_id" int,
+  UNIQUE ("toggl_entry_id", "toggl_tag_id")
 );
 
 CREATE TABLE "toggl_entry" (
   "id" SERIAL PRIMARY KEY,
+  "workspace_id" bigint,
   "toggl_project_id" int,
   "toggl_task_id" int,
   "toggl_user_id" int,
@@ -36,12 +44,43 @@ CREATE TABLE "toggl_entry" (
   "update_date" timestamp
 );
 
-ALTER TABLE "toggl_entry" ADD FOREIGN KEY ("toggl_task_id") REFERENCES "toggl_task" ("id");
+ALTER TABLE "toggl_entry" ADD FOREIGN KEY ("toggl_task_id") REFERENCES "toggl_task" ("id") DEFERRABLE INITIALLY IMMEDIATE;
 
-ALTER TABLE "toggl_entry" ADD FOREIGN KEY ("toggl_user_id") REFERENCES "toggl_user" ("id");
+ALTER TABLE "toggl_entry" ADD FOREIGN KEY ("toggl_user_id") REFERENCES "toggl_user" ("id") DEFERRABLE INITIALLY IMMEDIATE;
 
-ALTER TABLE "toggl_entry" ADD FOREIGN KEY ("toggl_project_id") REFERENCES "toggl_project" ("id");
+ALTER TABLE "toggl_entry" ADD FOREIGN KEY ("toggl_project_id") REFERENCES "toggl_project" ("id") DEFERRABLE INITIALLY IMMEDIATE;
 
-ALTER TABLE "toggl_entry_tag" ADD FOREIGN KEY ("toggl_entry_id") REFERENCES "toggl_entry" ("id");
+ALTER TABLE "toggl_entry_tag" ADD FOREIGN KEY ("toggl_entry_id") REFERENCES "toggl_entry" ("id") DEFERRABLE INITIALLY IMMEDIATE;
 
-ALTER TABLE "toggl_entry_tag" ADD FOREIGN KEY ("toggl_tag_id") REFERENCES "toggl_tag" ("id");
+ALTER TABLE "toggl_entry_tag" ADD FOREIGN KEY ("toggl_tag_id") REFERENCES "toggl_tag" ("id") DEFERRABLE INITIALLY IMMEDIATE;
+
+CREATE INDEX "ix_toggl_entry_start_date" ON "toggl_entry" ("start_date");
+
+CREATE INDEX "ix_toggl_entry_project_start_date" ON "toggl_entry" ("toggl_project_id", "start_date");
+
+CREATE INDEX "ix_toggl_entry_user_start_date" ON "toggl_entry" ("toggl_user_id", "start_date");
+
+CREATE INDEX "ix_toggl_entry_task" ON "toggl_entry" ("toggl_task_id");
+
+CREATE INDEX "ix_toggl_entry_tag_tag" ON "toggl_entry_tag" ("toggl_tag_id");
+
+CREATE TABLE "toggl_daily_project_user" (
+  "day" date,
+  "workspace_id" bigint,
+  "toggl_project_id" int,
+  "toggl_user_id" int,
+  "entry_count" int,
+  "duration_secs" bigint
+);
+
+CREATE TABLE "toggl_daily_tag" (
+  "day" date,
+  "workspace_id" bigint,
+  "toggl_tag_id" int,
+  "entry_count" int,
+  "duration_secs" bigint
+);
+
+CREATE INDEX "ix_toggl_daily_project_user_day" ON "toggl_daily_project_user" ("day", "toggl_project_id", "toggl_user_id");
+
+CREATE INDEX "ix_toggl_daily_tag_day" ON "toggl_daily_tag" ("day", "toggl_tag_id");
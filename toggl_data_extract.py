@@ -1,14 +1,15 @@
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 import json
 from os import environ
 from os.path import join
-import sqlite3
 
-import numpy as np
 import pandas as pd
 
 from toggl.api_client import TogglClientApi
 
+from toggl_sqlite import SQLITE_FILE, connect_sqlite, delete_entries, upsert_rows
+from toggl_transform import convert_columns_to_utc, iter_page_chunks, join_tags
+
 # api documentaion: https://github.com/toggl/toggl_api_docs/blob/master/reports.md#request-parameters
 # data documentation: https://github.com/toggl/toggl_api_docs/blob/master/reports/detailed.md#data-array
 
@@ -50,51 +51,64 @@ date_range_list = []
 for i in range(0, datetime.today().year - base_start_date.year + 1):
     date_range_list.append([addYears(base_start_date, i), addYears(base_end_date, i)])
 
-# connect to sqlite database
-conn = sqlite3.connect(join(environ["HOME"], "repos/toggl_api/toggl_api.sqlite"))
+# connect to sqlite database - creates the toggl_data table with its primary key and indexes if they are missing
+conn = connect_sqlite(SQLITE_FILE)
 # query toggl_projects table in sqlite database to grab all project id's
 projects_id_df = pd.read_sql("select distinct id from toggl_projects", conn)
 # pull list of project id's from toggl_projects table in sqlite database
 projects_id_list = projects_id_df.id.tolist()
 
-df_list = []
-# loop through each project_id
-for project in projects_id_list:
-    # loop through each year date range to pull data
-    for date_range in date_range_list:
-        # api seems to only pull one page at a time - this loops through each page for each project to get results
-        for page in range(1, 100):
-            # grab data from api
-            data = client.get_project_times(str(project), date_range[0], date_range[1], extra_params={"page": page})
-            # check if data was pulled
-            if len(data["data"]) > 0:
-                print("Data found!")
-                # add data to dataframe
-                df = pd.DataFrame(data["data"])
-                # append dataframe to df_list to concat down below
-                df_list.append(df)
-            # if no data found, then break loop
-            else:
-                break
-
-# concatenate all the dataframes in the df_list into one dataframe
-df_final = pd.concat(df_list)
-# data cleaning
-df_final["start"] = pd.to_datetime(df_final["start"])
-df_final["end"] = pd.to_datetime(df_final["end"])
-
-# convert columns to string
-string_convert_list = ["use_stop", "is_billable", "tags"]
-for col in string_convert_list:
-    df_final[col] = df_final[col].astype(str)
-
-# the "tags" data comes in as a list - convert to just a comma separated string
-df_final["tags"] = df_final["tags"].str.replace("[", "").str.replace("]", "").str.replace("'", "")
-df_final.loc[df_final.tags == "", "tags"] = np.nan
-
-# create dur_secs column as the number of seconds between the start and end
-df_final["dur_secs"] = (df_final["end"] - df_final["start"]).astype("timedelta64[s]")
-
-# write the data to the table in sqlite database
-df_final.to_sql("toggl_data", conn, if_exists="replace", index=False)
+def pull_pages(projects_id_list, date_range_list):
+    """Pull toggl data from api, one page at a time
+
+    Args:
+        projects_id_list (list): List of project id's to pull data from
+        date_range_list (list): Nested list of date ranges
+
+    Yields:
+        page_data (list): List of toggl entries of one page
+    """
+    # loop through each project_id
+    for project in projects_id_list:
+        # loop through each year date range to pull data
+        for date_range in date_range_list:
+            # api seems to only pull one page at a time - this loops through each page for each project to get results
+            for page in range(1, 100):
+                # grab data from api
+                data = client.get_project_times(str(project), date_range[0], date_range[1], extra_params={"page": page})
+                # check if data was pulled
+                if len(data["data"]) > 0:
+                    print("Data found!")
+                    # hand the page over before pulling the next one
+                    yield data["data"]
+                # if no data found, then break loop
+                else:
+                    break
+
+# ids of every entry pulled - stored entries not among them were deleted in toggl
+pulled_id_set = set()
+# clean and write the data in chunks, so only one chunk is held in memory at a time
+for df_final in iter_page_chunks(pull_pages(projects_id_list, date_range_list)):
+    # data cleaning
+    # convert the date columns to UTC
+    df_final = convert_columns_to_utc(df_final, ["start", "end"])
+
+    # convert columns to string
+    string_convert_list = ["use_stop", "is_billable"]
+    for col in string_convert_list:
+        df_final[col] = df_final[col].astype(str)
+
+    # the "tags" data comes in as a list - convert to just a comma separated string
+    df_final["tags"] = join_tags(df_final["tags"])
+
+    # create dur_secs column as the number of seconds between the start and end
+    df_final["dur_secs"] = (df_final["end"] - df_final["start"]).astype("timedelta64[s]")
+
+    # write the data to the table in sqlite database - only new and changed entries are written. Replacing the table
+    # would drop the primary key the upserts of toggl_data_pull.py need
+    upsert_rows(conn, "toggl_data", df_final)
+    pulled_id_set.update(int(entry_id) for entry_id in df_final["id"])
+
+# every entry is pulled, so the stored entries that were not are gone from toggl
+delete_entries(conn, [row[0] for row in conn.execute("SELECT id FROM toggl_data;") if row[0] not in pulled_id_set])
 # pd.read_sql("select * from toggl_data", conn)
\ No newline at end of file
@@ -1,83 +1,265 @@
-from datetime import date, datetime, timedelta
-from os import environ
-from os.path import join
-import sqlite3
+import argparse
 
-import numpy as np
 import pandas as pd
 
 import toggl_extract as te
+from toggl_landing import LandingZone
+from toggl_metrics import RunMetrics
+from toggl_query import QueryCache
+from toggl_reconcile import (RECONCILE_METHODS, find_changed_partitions, refetch_work_list, sqlite_entry_frame,
+                             stale_entry_ids)
+from toggl_sqlite import SQLITE_FILE, connect_sqlite, delete_entries, stored_entries, upsert_rows
+from toggl_sync_state import SyncState, build_date_range_list
+from toggl_transform import ENTRY_CHUNK_SIZE, convert_columns_to_utc, iter_page_chunks, join_tags
 
-toggl_client = te.TogglApi()
+DESCRIPTION = "Pull toggl data into the toggl_data table in sqlite"
+
+
+def add_arguments(parser):
+    """Add the command line arguments of the pipeline to an argument parser
+
+    Args:
+        parser (ArgumentParser object): Parser of the pipeline or of its toggl_cli.py subcommand
+
+    Returns:
+
+    """
+    parser.add_argument("--config-file", default=None, help="Full path to the config json file")
+    parser.add_argument("--sqlite-file", default=SQLITE_FILE, help="Full path to the sqlite database file")
+    parser.add_argument("--full", action="store_true",
+                        help="Pull every entry since the base year and delete entries from the toggl_data table "
+                             "that are no longer returned")
+    parser.add_argument("--state-file", default=None, help="Full path to the sync state json file")
+    parser.add_argument("--lookback-days", type=int, default=7,
+                        help="Number of days before the last synced date to pull again in incremental mode")
+    parser.add_argument("--chunk-size", type=int, default=ENTRY_CHUNK_SIZE,
+                        help="Number of entries cleaned and written at once")
+    parser.add_argument("--replay", action="store_true",
+                        help="Rebuild from the raw responses in the response cache without calling the api. "
+                             "Implies --full and leaves the sync state untouched")
+    parser.add_argument("--reconcile", choices=RECONCILE_METHODS, default=None,
+                        help="Compare a digest of every stored (project, month) with the api and pull again only the "
+                             "months that differ, deleting the entries removed in toggl. Leaves the sync state "
+                             "untouched")
+    parser.add_argument("--fetch-mode", choices=te.FETCH_MODES, default=None,
+                        help="Pull the detailed report per project or once for the whole workspace, overrides "
+                             "fetch_mode in the toggl_config")
+    parser.add_argument("--metrics-file", default=None, help="Full path to write the json run report to")
+    parser.add_argument("--prometheus-file", default=None,
+                        help="Full path to write the run metrics to in the prometheus text format")
+
+
+def clean_entries(df_final):
+    """Clean a chunk of raw toggl entries for the toggl_data table
+
+    Args:
+        df_final (Pandas DataFrame object): Pandas DataFrame of raw toggl entries from the api
+
+    Returns:
+        df_final (Pandas DataFrame object): Pandas DataFrame of the cleaned entries
+
+    """
+    # convert the date columns to UTC
+    df_final = convert_columns_to_utc(df_final, ["start", "end"])
+
+    # convert columns to string
+    string_convert_list = ["use_stop", "is_billable"]
+    for col in string_convert_list:
+        df_final[col] = df_final[col].astype(str)
+
+    # the "tags" data comes in as a list - convert to just a comma separated string
+    df_final["tags"] = join_tags(df_final["tags"])
+
+    # create dur_secs column as the number of seconds between the start and end
+    df_final["dur_secs"] = (df_final["end"] - df_final["start"]).astype("timedelta64[s]")
+    return df_final
+
+
+def run(args):
+    """Pull the toggl entries of every project in the toggl_projects table into the toggl_data table
+
+    Args:
+        args (Namespace object): Parsed command line arguments, see add_arguments
+
+    Returns:
+        entry_count (int): Number of new or changed entries pulled
+
+    """
+    if args.reconcile and args.replay:
+        raise ValueError("--reconcile compares the stored entries with the api, it can not read the response cache")
+    # replaying the cache pulls every cached date range, same as a full pull. Reconciling pulls whole months again
+    full_pull = args.full or args.replay or bool(args.reconcile)
+
+    toggl_client = te.TogglApi(config_file=args.config_file, replay=args.replay, fetch_mode=args.fetch_mode)
+    # wall time, rows, api calls and memory of every stage of the run
+    metrics = RunMetrics(pipeline="toggl_data_pull", http=toggl_client.http)
+    # raw entries are also written to the parquet landing zone if landing_dir is set in the toggl_config
+    landing_dir = toggl_client.settings.get("landing_dir")
+    landing_zone = LandingZone(landing_dir) if landing_dir else None
+
+    # create list of yearly date ranges for each year up until current year
+    date_range_list = build_date_range_list()
+
+    # connect to sqlite database - creates the toggl_data table and its indexes if they are missing
+    conn = connect_sqlite(args.sqlite_file)
+    # query toggl_projects table in sqlite database to grab all project id's
+    projects_id_df = pd.read_sql("SELECT DISTINCT ID FROM TOGGL_PROJECTS;", conn)
+    # pull list of project id's from toggl_projects table in sqlite database
+    projects_id_list = projects_id_df.id.tolist()
+
+    # load the sync state - the full pull ignores it but still moves the watermarks forward
+    sync_state = SyncState(workspace_id=toggl_client.settings["workspace_id"], pipeline="toggl_data_pull",
+                           state_file=args.state_file, lookback_days=args.lookback_days)
+    # watermarks from the previous run - used to drop entries that were already loaded
+    previous_watermarks = sync_state.watermarks()
+    # start each project at the date range granularity it needed last time
+    toggl_client.window_granularity.update(sync_state.granularities())
+
+    # timezone the api splits months in, the stored entries are in UTC
+    timezone = toggl_client.settings.get("timezone", "UTC")
+    if args.reconcile:
+        # pull again only the (project, month) partitions whose stored entries differ from the api
+        with metrics.stage("reconcile", api=True) as stage:
+            stored_entry_df = sqlite_entry_frame(conn)
+            partition_list = find_changed_partitions(toggl_client, stored_entry_df, date_range_list,
+                                                     method=args.reconcile, timezone=timezone)
+            stage.add(rows_in=len(stored_entry_df), rows_out=len(partition_list))
+        print(f"{len(partition_list)} project months differ from the api")
+        work_list = refetch_work_list(partition_list)
+    else:
+        # pick the date ranges to pull for each project - only the days since the last sync in incremental mode
+        work_list = []
+        for project in projects_id_list:
+            project_date_range_list = (date_range_list if full_pull
+                                       else sync_state.date_range_list(project, date_range_list))
+            for date_range in project_date_range_list:
+                work_list.append((project, date_range))
+
+    # a full pull from the api keeps track of every entry id it wrote, to delete the entries that were removed
+    delete_missing = args.full and not (args.replay or args.reconcile)
+    if delete_missing:
+        conn.execute("CREATE TEMP TABLE pulled_entry (id INTEGER PRIMARY KEY);")
+
+    entry_count = 0
+    # days with new, changed or deleted entries - their cached query totals are dropped at the end of the run
+    touched_day_set = set()
+    # ids of every entry pulled when reconciling - stored entries of the pulled months not among them are deleted
+    pulled_id_set = set()
+    # pull every project and date range - concurrently if max_workers is set in the config. Every month a reconcile
+    # picked is pulled, also of archived projects - the stored entries of a month that comes back empty are deleted
+    page_iter = metrics.timed_iter("entry pull", toggl_client.iter_toggl_log_data_windows(
+        work_list, skip_dormant=False if args.reconcile else None))
+    # clean and write the entries in chunks, so only one chunk is held in memory at a time
+    for df_final in iter_page_chunks(page_iter, chunk_size=args.chunk_size):
+        # move the watermark of each project forward to its newest updated timestamp
+        updated_utc_series = pd.to_datetime(df_final["updated"], utc=True)
+        latest_updated_series = updated_utc_series.groupby(df_final["pid"]).max()
+        for project, latest_updated in latest_updated_series.items():
+            sync_state.update(project, updated=latest_updated.isoformat())
+        if args.reconcile:
+            pulled_id_set.update(int(entry_id) for entry_id in df_final["id"])
+
+        if not full_pull:
+            # keep only the entries changed since the last sync - projects never synced have no watermark
+            watermark_series = pd.to_datetime(df_final["pid"].map(previous_watermarks), utc=True)
+            df_final = df_final[watermark_series.isnull() |
+                                (updated_utc_series > watermark_series)].reset_index(drop=True)
+
+        if df_final.empty:
+            continue
+        entry_count += len(df_final)
+
+        if landing_zone is not None:
+            # land the raw entries before cleaning - only the partitions with changed entries are rewritten
+            with metrics.stage("landing write", rows_in=len(df_final)) as stage:
+                partition_count = landing_zone.write_entries(df_final)
+                print(f"Rewrote {partition_count} landing zone partitions")
+                stage.add(rows_written=len(df_final))
+
+        # data cleaning
+        with metrics.stage("entry transform", rows_in=len(df_final)) as stage:
+            df_final = clean_entries(df_final)
+            stage.add(rows_out=len(df_final))
+
+        print("Writing data to sqlite table")
+        with metrics.stage("entry load", rows_in=len(df_final)) as stage:
+            # the days the new and changed entries start on before and after the write - an entry can move to
+            # another day
+            stored_entry_dict = stored_entries(conn, df_final["id"].tolist())
+            changed_series = pd.Series([stored_entry_dict.get(entry_id, (None, None))[1] != updated
+                                        for entry_id, updated in zip(df_final["id"], df_final["updated"])],
+                                       index=df_final.index)
+            touched_day_set |= {stored_entry_dict[entry_id][0] for entry_id in df_final["id"][changed_series]
+                                if entry_id in stored_entry_dict}
+            touched_day_set |= set(df_final["start"][changed_series].dropna().dt.strftime("%Y-%m-%d"))
+            # insert new entries and update changed entries - unchanged entries are not rewritten
+            row_count = upsert_rows(conn, "toggl_data", df_final)
+            print(f"Added or updated {row_count} rows in toggl_data table")
+            if delete_missing:
+                with conn:
+                    conn.executemany("INSERT OR IGNORE INTO pulled_entry (id) VALUES (?);",
+                                     [(int(entry_id),) for entry_id in df_final["id"]])
+            stage.add(rows_out=row_count, rows_written=row_count)
+
+    if delete_missing:
+        # entries deleted in toggl are not returned by a full pull any more
+        with conn:
+            touched_day_set |= {row[0] for row in conn.execute(
+                'SELECT DISTINCT substr("start", 1, 10) FROM toggl_data WHERE id NOT IN (SELECT id FROM pulled_entry);')
+                if row[0] is not None}
+            deleted_count = conn.execute(
+                "DELETE FROM toggl_data WHERE id NOT IN (SELECT id FROM pulled_entry);").rowcount
+        print(f"Deleted {deleted_count} rows from toggl_data table")
+
+    if args.reconcile:
+        # entries of the pulled months that the api no longer returns were deleted in toggl
+        stale_id_list = stale_entry_ids(stored_entry_df, partition_list, pulled_id_set, timezone=timezone)
+        with metrics.stage("entry delete", rows_in=len(stale_id_list)) as stage:
+            touched_day_set |= delete_entries(conn, stale_id_list)
+            stage.add(rows_written=len(stale_id_list))
+
+    # projects without new entries are still synced up to today
+    for project in projects_id_list:
+        sync_state.update(project)
+    # remember how finely each project's date ranges had to be split
+    for project, granularity in toggl_client.window_granularity.items():
+        sync_state.set_granularity(project, granularity)
+
+    if entry_count == 0:
+        print("No new toggl data found")
+
+    # everything written - save the sync state for the next run
+    # the cache only holds what earlier runs pulled - a replay does not move the sync state forward. Reconciling pulls
+    # old months, not the days since the last sync, so it leaves the watermarks to incremental runs
+    if not (args.replay or args.reconcile):
+        sync_state.save()
+    # the cached totals of the other days are still right
+    query_cache = QueryCache(toggl_client.settings.get("query_cache_file"))
+    print(f"Dropped {query_cache.invalidate(touched_day_set)} cached query days")
+
+    # report where the time went
+    metrics.print_summary()
+    if args.metrics_file:
+        metrics.write_json(args.metrics_file)
+    if args.prometheus_file:
+        metrics.write_prometheus(args.prometheus_file)
+
+    return entry_count
+
+
+def main(argv=None):
+    """Run the pipeline from the command line
 
-# helper functions
-def add_years(dt, years):
-    """Takes date and adds years to it
-    
     Args:
-        dt (datetime): Date to increment years
-        years (int): How many years to increment the date
-    
+        argv (list, optional): Command line arguments, defaults to sys.argv
+
     Returns:
-        Date plus how many years you want to increment
+
     """
-    try:
-    #Return same day of the current year        
-        return dt.replace(year=dt.year + years)
-    except ValueError:
-        #If not same day, it will return other, i.e.  February 29 to March 1 etc.        
-        return dt + (date(dt.year + years, 1, 1) - date(dt.year, 1, 1))
-
-# establish the base year to pull data from
-base_year = 2019
-# create base_start_date as Jan 1st from base year
-base_start_date = date(base_year, 1, 1)
-# create base_end_date as Dec 31st from base year
-base_end_date = date(base_year, 12, 31)
-
-# create list of yearly date ranges for each year up until current year
-# for example: [[datetime.date(2019, 1, 1), datetime.date(2019, 12, 31)]]
-date_range_list = []
-for i in range(0, datetime.today().year - base_start_date.year + 1):
-    date_range_list.append([add_years(base_start_date, i), add_years(base_end_date, i)])
-
-# connect to sqlite database
-conn = sqlite3.connect(join(environ["HOME"], "repos/toggl_api/toggl_api.sqlite"))
-# query toggl_projects table in sqlite database to grab all project id's
-projects_id_df = pd.read_sql("SELECT DISTINCT ID FROM TOGGL_PROJECTS;", conn)
-# pull list of project id's from toggl_projects table in sqlite database
-projects_id_list = projects_id_df.id.tolist()
-
-df_list = []
-# loop through each project_id
-for project in projects_id_list:
-    # loop through each year date range to pull data
-    for date_range in date_range_list:
-        toggl_api_data = toggl_client.get_toggl_log_data(project_id=project, date_range_list=date_range)
-        # iterate through the toggl_api_data to get data into a dataframe
-        for row in toggl_api_data:
-            df = pd.DataFrame(row)
-            df_list.append(df)
-
-# concatenate all the dataframes in the df_list into one dataframe
-df_final = pd.concat(df_list)
-
-# data cleaning
-df_final["start"] = pd.to_datetime(df_final["start"])
-df_final["end"] = pd.to_datetime(df_final["end"])
-
-# convert columns to string
-string_convert_list = ["use_stop", "is_billable", "tags"]
-for col in string_convert_list:
-    df_final[col] = df_final[col].astype(str)
-
-# the "tags" data comes in as a list - convert to just a comma separated string
-df_final["tags"] = df_final["tags"].str.replace("[", "").str.replace("]", "").str.replace("'", "")
-df_final.loc[df_final.tags == "", "tags"] = np.nan
-
-# create dur_secs column as the number of seconds between the start and end
-df_final["dur_secs"] = (df_final["end"] - df_final["start"]).astype("timedelta64[s]")
-
-print("Writing data to sqlite table")
-# write the data to the table in sqlite database
-df_final.to_sql("toggl_data", conn, if_exists="replace", index=False)
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
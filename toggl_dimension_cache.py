@@ -0,0 +1,190 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
+from os.path import exists
+from threading import Lock
+
+from sqlalchemy import text
+
+# name column of each dimension table
+DIMENSION_COLUMNS = {
+    "toggl_project": "project_name",
+    "toggl_task": "task_name",
+    "toggl_tag": "tag_name",
+    "toggl_user": "name",
+}
+
+# dimension tables with a row per workspace and name. toggl_user is keyed by the toggl user id, which is the same in
+# every workspace
+WORKSPACE_TABLES = {"toggl_project", "toggl_task", "toggl_tag"}
+
+# default number of name -> id pairs kept in memory across all dimension tables
+MAX_CACHE_ENTRIES = 1000000
+
+
+class DimensionCache():
+    def __init__(self, engine, max_entries=MAX_CACHE_ENTRIES, cache_file=None, workspace_id=None):
+        """Cache of name -> id maps for the dimension tables, so foreign keys are resolved with a dictionary lookup
+        instead of reading the whole table for every stage.
+
+        Args:
+            engine (SQLAlchemy engine object): SQLAlchemy engine object
+            max_entries (int, optional): Maximum number of name -> id pairs kept across all tables. The least
+                recently used pairs of the largest table are evicted first
+            cache_file (str, optional): Full path to a json file to persist the cache between runs
+            workspace_id (int, optional): Workspace whose rows of the WORKSPACE_TABLES are cached. Defaults to the
+                rows of every workspace
+
+        Returns:
+
+        """
+        self.engine = engine
+        self.max_entries = max_entries
+        self.cache_file = cache_file
+        self.workspace_id = workspace_id
+        self.entry_count = 0
+        # the dimension loads run at the same time - the maps and entry_count are only changed holding the lock
+        self.lock = Lock()
+        # table_name -> OrderedDict of name -> id, ordered from least to most recently used
+        self.tables = {table_name: OrderedDict() for table_name in DIMENSION_COLUMNS}
+
+        if self.cache_file and exists(self.cache_file):
+            self._load_file()
+
+    def lookup(self, table_name, names, conn=None):
+        """Get the ids of the names in a dimension table. Names missing from the cache are read from the table.
+
+        Args:
+            table_name (str): Name of the dimension table
+            names (iterable): Names to look up
+            conn (SQLAlchemy connection object, optional): Open connection to read the missing names with
+
+        Returns:
+            id_dict (dict): Name -> id for every name found
+
+        """
+        table_cache = self.tables[table_name]
+        id_dict = {}
+        missing_names = []
+        with self.lock:
+            for name in names:
+                if name in table_cache:
+                    table_cache.move_to_end(name)
+                    id_dict[name] = table_cache[name]
+                else:
+                    missing_names.append(name)
+
+        if missing_names:
+            column_name = DIMENSION_COLUMNS[table_name]
+            with self._connect(conn) as conn:
+                rows = conn.execute(text(f"SELECT ID, {column_name} FROM {table_name} "
+                                         f"{self._workspace_filter(table_name)} AND {column_name} = ANY(:names);"),
+                                    {"names": missing_names, "workspace_id": self.workspace_id}).fetchall()
+            found_dict = {name: table_id for table_id, name in rows}
+            self.update(table_name, found_dict)
+            id_dict.update(found_dict)
+
+        return id_dict
+
+    def update(self, table_name, id_dict):
+        """Add name -> id pairs to the cache, for example the ids assigned by an insert
+
+        Args:
+            table_name (str): Name of the dimension table
+            id_dict (dict): Name -> id
+
+        Returns:
+
+        """
+        table_cache = self.tables[table_name]
+        with self.lock:
+            for name, table_id in id_dict.items():
+                if name not in table_cache:
+                    self.entry_count += 1
+                table_cache[name] = int(table_id)
+                table_cache.move_to_end(name)
+            self._evict()
+
+    def save(self):
+        """Write the cache to the cache file, along with the highest id of each table
+
+        Args:
+
+        Returns:
+
+        """
+        if not self.cache_file:
+            return
+        data = {"workspace_id": self.workspace_id}
+        for table_name, table_cache in self.tables.items():
+            data[table_name] = {"max_id": max(table_cache.values(), default=0), "ids": list(table_cache.items())}
+        with open(self.cache_file, "w") as json_data_file:
+            json.dump(data, json_data_file)
+
+    def _load_file(self):
+        """Load the cache file. Tables whose highest id went down since the file was written were rebuilt, so their
+        cached ids are dropped. A file written for another workspace is not used.
+
+        Args:
+
+        Returns:
+
+        """
+        with open(self.cache_file) as json_data_file:
+            data = json.load(json_data_file)
+        if data.pop("workspace_id", None) != self.workspace_id:
+            return
+
+        with self.engine.connect() as conn:
+            for table_name, table_data in data.items():
+                if table_name not in self.tables:
+                    continue
+                max_id = conn.execute(text(f"SELECT COALESCE(MAX(ID), 0) FROM {table_name};")).scalar()
+                if max_id < table_data["max_id"]:
+                    continue
+                self.update(table_name, dict(table_data["ids"]))
+
+    def _workspace_filter(self, table_name):
+        """WHERE clause keeping the rows of the workspace, for the :workspace_id parameter
+
+        Args:
+            table_name (str): Name of the dimension table
+
+        Returns:
+            where_clause (str): WHERE clause, always true for toggl_user or without a workspace
+
+        """
+        if self.workspace_id is None or table_name not in WORKSPACE_TABLES:
+            return "WHERE TRUE"
+        return "WHERE workspace_id = :workspace_id"
+
+    @contextmanager
+    def _connect(self, conn=None):
+        """Use the given connection, or a pooled connection of the engine if none is given
+
+        Args:
+            conn (SQLAlchemy connection object, optional): Open connection
+
+        Yields:
+            conn (SQLAlchemy connection object): Connection to read with
+
+        """
+        if conn is not None:
+            yield conn
+            return
+        with self.engine.connect() as own_conn:
+            yield own_conn
+
+    def _evict(self):
+        """Drop the least recently used pairs until the cache is within max_entries
+
+        Args:
+
+        Returns:
+
+        """
+        while self.entry_count > self.max_entries:
+            # evict from the largest table first
+            table_cache = max(self.tables.values(), key=len)
+            table_cache.popitem(last=False)
+            self.entry_count -= 1
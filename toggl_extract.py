@@ -1,16 +1,36 @@
-from datetime import date, datetime, timedelta
-import json
-from os import environ
-from os.path import join
-import sqlite3
-
-import numpy as np
-import pandas as pd
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from math import ceil
+from threading import Lock
 
 from toggl.api_client import TogglClientApi
 
+from toggl_config import CONFIG_FILE, load_config, select_workspace
+from toggl_http import DEFAULT_BURST, DEFAULT_MAX_RETRIES, DEFAULT_REQUESTS_PER_SECOND, TogglHttp, get_rate_limiter
+from toggl_response_cache import RESPONSE_CACHE_MAX_MB, RESPONSE_CACHE_TTL_HOURS, ResponseCache
+from toggl_sync_state import MAX_WINDOW_DAYS, _parse_timestamp, split_date_range
+
+# the serial page loop stops at page 99 - keep the same ceiling for every fetch mode
+MAX_PAGES = 99
+
+# date range sizes used to split a window with too many pages, from coarsest to finest
+WINDOW_GRANULARITIES = ["year", "half", "month", "week", "day"]
+
+# number of entries per page yielded when replaying the response cache, same as the detailed report
+REPLAY_PAGE_SIZE = 50
+
+# "project" pulls the detailed report once per project and date range, "workspace" pulls it once per date range for
+# the whole workspace and splits the entries by project
+FETCH_MODES = ["project", "workspace"]
+
+# project id the workspace wide date ranges are remembered under in window_granularity, the sync state and the
+# response cache - toggl ids start at 1
+WORKSPACE_PROJECT_ID = 0
+
+
 class TogglApi():
-    def __init__(self, config_file=None):
+    def __init__(self, config_file=None, max_workers=None, replay=False, fetch_mode=None, workspace_id=None):
         """Instantiate TogglApi class and connect to toggl api
     
         Args:
@@ -19,22 +39,100 @@ class TogglApi():
                     "toggl_config":{
                         "token": "some_token_string",
                         "user_agent": "toggl_login",
-                        "workspace_id": "workspace_id"
+                        "workspace_id": "workspace_id",
+                        "max_workers": 8,
+                        "fetch_mode": "workspace",
+                        "skip_dormant_projects": true,
+                        "timezone": "Europe/Berlin",
+                        "window_page_limit": 99,
+                        "requests_per_second": 1,
+                        "rate_limit_burst": 1,
+                        "max_retries": 5,
+                        "response_cache_dir": "/home/user/repos/toggl_api/response_cache",
+                        "response_cache_ttl_hours": 720,
+                        "response_cache_max_mb": 1024,
+                        "api_base_url": "https://api.track.toggl.com/api/v9",
+                        "api_report_base_url": "https://api.track.toggl.com/reports/api/v2"
                     }
                 }
+                The token, workspace_id and any other key can also be set per workspace in a "workspaces" list, see
+                toggl_config.workspace_configs.
+                "max_workers" is optional and defaults to 1 (serial fetching).
+                "fetch_mode" is optional and defaults to "project", see iter_toggl_log_data_windows.
+                "skip_dormant_projects" is optional and defaults to true, see skip_dormant_projects.
+                "timezone" is optional and defaults to "UTC". It is the timezone of the api user, which the reports
+                split days and months in, used by toggl_reconcile.py.
+                "window_page_limit" is optional and defaults to MAX_PAGES. Date ranges with more pages than this are
+                split into halves, months, weeks or days.
+                "requests_per_second" and "rate_limit_burst" set the token bucket shared by every TogglApi using the
+                same token in the process. "max_retries" is the number of retries for 429/5xx responses.
+                "response_cache_dir" is optional. If set, the raw projects and detailed report responses are
+                written to a compressed cache there, see ResponseCache.
+                "api_base_url" and "api_report_base_url" are optional and default to the urls of the toggl library,
+                for example to point every process of a run at a local stand-in of the api.
+            max_workers (int, optional): Number of concurrent requests used by get_toggl_log_data_many.
+                Overrides "max_workers" in the config file.
+            replay (bool, optional): Read the responses from the response cache instead of the api, see
+                iter_cached_log_data. No network calls are made.
+            fetch_mode (str, optional): One of FETCH_MODES. Overrides "fetch_mode" in the config file.
+            workspace_id (str, optional): Workspace of the config to connect to, defaults to the first
     
         Returns:
 
         """
-        self.config_file = config_file
-        if not self.config_file:
-            self.config_file = join(environ["HOME"], "repos/toggl_api/config.json")
-        with open(self.config_file) as json_data_file:
-            data = json.load(json_data_file)
+        self.config_file = config_file or CONFIG_FILE
+        data = select_workspace(load_config(self.config_file), workspace_id)
 
         self.settings = data["toggl_config"]
 
+        # number of concurrent requests - 1 keeps the original serial behaviour
+        self.max_workers = max_workers or int(self.settings.get("max_workers", 1))
+        # most pages pulled for one date range before it is split into smaller date ranges
+        self.window_page_limit = min(int(self.settings.get("window_page_limit", MAX_PAGES)), MAX_PAGES)
+        # project id -> finest granularity its date ranges had to be split into. Seed it from a previous run so
+        # date ranges start out at the right size
+        self.window_granularity = {}
+        self._window_granularity_lock = Lock()
+
+        # pull the detailed report per project or for the whole workspace at once
+        self.fetch_mode = fetch_mode or self.settings.get("fetch_mode", FETCH_MODES[0])
+        if self.fetch_mode not in FETCH_MODES:
+            raise ValueError(f"Unknown fetch_mode {self.fetch_mode}, expected one of {', '.join(FETCH_MODES)}")
+        # leave out the date ranges of archived projects that start after the project was archived
+        self.skip_dormant = bool(self.settings.get("skip_dormant_projects", True))
+        # projects data of the last get_toggl_projects call, reused to find the dormant projects
+        self.projects_data = None
+
         self.client = TogglClientApi(self.settings)
+        if self.settings.get("api_base_url"):
+            self.client.api_base_url = self.settings["api_base_url"]
+        if self.settings.get("api_report_base_url"):
+            self.client.api_report_base_url = self.settings["api_report_base_url"]
+
+        # send every request through a pooled keep-alive session, the shared rate limiter and retries
+        requests_per_second = float(self.settings.get("requests_per_second", DEFAULT_REQUESTS_PER_SECOND))
+        rate_limiter = get_rate_limiter(self.settings["token"], rate=requests_per_second,
+                                        burst=int(self.settings.get("rate_limit_burst", DEFAULT_BURST)))
+        self.http = TogglHttp(rate_limiter=rate_limiter, pool_size=self.max_workers,
+                              max_retries=int(self.settings.get("max_retries", DEFAULT_MAX_RETRIES)))
+        self.client._do_get_query = self.http.get
+        self.client._do_post_query = self.http.post
+
+        # raw responses cached on disk, keyed by workspace, project, date range and page
+        self.replay = replay
+        self.response_cache = None
+        if self.settings.get("response_cache_dir"):
+            self.response_cache = ResponseCache(
+                self.settings["response_cache_dir"],
+                ttl_hours=float(self.settings.get("response_cache_ttl_hours", RESPONSE_CACHE_TTL_HOURS)),
+                max_mb=float(self.settings.get("response_cache_max_mb", RESPONSE_CACHE_MAX_MB)))
+        if self.replay:
+            if self.response_cache is None:
+                raise ValueError("replay needs response_cache_dir in the toggl_config")
+            # make sure nothing reaches the api
+            self.client._do_get_query = self.client._do_post_query = _no_network_query
+        elif self.response_cache is not None:
+            self.response_cache.evict()
 
     def get_toggl_projects(self):
         """Get projects data from toggl api
@@ -45,32 +143,496 @@ class TogglApi():
             projects_data (list): List of dictionaries containing projects data
         
         """
-        projects_data = self.client.get_projects().json()
+        cache_key = (self.settings["workspace_id"], "projects")
+        if self.replay:
+            return self.response_cache.get(cache_key) or []
+
+        # get_projects only asks for the active projects by default - the archived ones are needed to skip their
+        # date ranges, see skip_dormant_projects
+        projects_data = self.client.get_projects(active="both").json()
+        if self.response_cache is not None:
+            self.response_cache.put(cache_key, projects_data)
+        self.projects_data = projects_data
         return projects_data
 
+    def skip_dormant_projects(self, work_list):
+        """Leave out the (project, date range) pairs that can not have entries. Archived projects can not be tracked
+        to, so an archived project has no entries in date ranges that start after it was last changed ("at").
+        Projects that are not in the projects data, for example deleted projects, are kept.
+
+        Args:
+            work_list (list): List of (project_id, date_range_list) tuples, for example:
+                [(123, [datetime.date(2019, 1, 1), datetime.date(2019, 12, 31)])]
+
+        Returns:
+            work_list (list): List of the (project_id, date_range_list) tuples to pull
+
+        """
+        if self.projects_data is None:
+            self.get_toggl_projects()
+        # project id -> last day an archived project was changed
+        archived_dict = {project["id"]: _parse_timestamp(project["at"]).date() for project in self.projects_data
+                         if not project.get("active", True) and project.get("at")}
+
+        live_work_list = [(project, date_range) for project, date_range in work_list
+                          if project not in archived_dict or date_range[0] <= archived_dict[project]]
+        live_project_set = {project for project, _ in live_work_list}
+        skipped_project_count = len({project for project, _ in work_list if project not in live_project_set})
+        print(f"Skipping {len(work_list) - len(live_work_list)} date ranges of archived projects, "
+              f"{skipped_project_count} projects entirely")
+        return live_work_list
+
     def get_toggl_log_data(self, project_id, date_range_list):
-        """Pull toggl data from api
+        """Pull toggl data from api, one page at a time. Date ranges with more pages than window_page_limit are
+        split into smaller date ranges, see split_window.
         
         Args:
             project_id (int): List of project id's to pull data from
             date_range_list (list): List of date range, each item in list is a datetime object.
                 For example: [datetime.date(2019, 1, 1), datetime.date(2019, 12, 31)]
         
-        Returns:
-            data_list (list): Nested list containing toggl data
+        Yields:
+            page_data (list): List of toggl entries of one page
 
         """         
-        data_list = []
+        for window, granularity in self.split_window(project_id, date_range_list):
+            yield from self._get_window_data(project_id, window, granularity)
+
+    def split_window(self, project_id, date_range_list):
+        """Split a date range by the granularity remembered for the project
+
+        Args:
+            project_id (int): Project id
+            date_range_list (list): List of date range, each item in list is a datetime object.
+
+        Returns:
+            window_list (list): List of (date_range_list, granularity) tuples
+
+        """
+        granularity = self.window_granularity.get(project_id, WINDOW_GRANULARITIES[0])
+        return [(window, granularity) for window in split_date_range_by(date_range_list, granularity)]
+
+    def _split_large_window(self, project_id, date_range_list, granularity, data):
+        """Split a date range into the next finer granularity if its first page shows too many pages
+
+        Args:
+            project_id (int): Project id
+            date_range_list (list): List of date range, each item in list is a datetime object.
+            granularity (str): Granularity the date range was made with
+            data (dict): Json response of the first page of the date range
+
+        Returns:
+            window_list (list): List of (date_range_list, granularity) tuples, empty if the date range is small enough
+
+        """
+        if "total_count" not in data or self._page_count(data) <= self.window_page_limit:
+            return []
+        if date_range_list[0] >= date_range_list[1] or granularity == WINDOW_GRANULARITIES[-1]:
+            print(f"Project {project_id} has more than {self.window_page_limit} pages on {date_range_list[0]}")
+            return []
+
+        finer_granularity = WINDOW_GRANULARITIES[WINDOW_GRANULARITIES.index(granularity) + 1]
+        with self._window_granularity_lock:
+            # remember the finest granularity needed for the project
+            current_granularity = self.window_granularity.get(project_id, WINDOW_GRANULARITIES[0])
+            if WINDOW_GRANULARITIES.index(finer_granularity) > WINDOW_GRANULARITIES.index(current_granularity):
+                self.window_granularity[project_id] = finer_granularity
+        return [(window, finer_granularity) for window in split_date_range_by(date_range_list, finer_granularity)]
+
+    def _get_window_data(self, project_id, date_range_list, granularity):
+        """Pull toggl data for a single date range, splitting it further if it has too many pages
+
+        Args:
+            project_id (int): Project id
+            date_range_list (list): List of date range, each item in list is a datetime object.
+            granularity (str): Granularity the date range was made with
+
+        Yields:
+            page_data (list): List of toggl entries of one page
+
+        """
         # api seems to only pull one page at a time - this loops through each page for each project to get results
-        for page in range(1, 100):
+        for page in range(1, MAX_PAGES + 1):
             # grab data from api
-            data = self.client.get_project_times(str(project_id), date_range_list[0], date_range_list[1], extra_params={"page": page})
+            data = self.get_toggl_log_page(project_id, date_range_list, page)
+            if page == 1:
+                sub_window_list = self._split_large_window(project_id, date_range_list, granularity, data)
+                if sub_window_list:
+                    for sub_window, sub_granularity in sub_window_list:
+                        yield from self._get_window_data(project_id, sub_window, sub_granularity)
+                    return
             # check if data was pulled
             if len(data["data"]) > 0:
                 print("Data found!")
-                # append dataframe to df_list to concat down below
-                data_list.append(data["data"])
+                # hand the page to the caller before pulling the next one
+                yield data["data"]
             # if no data found, then break loop
             else:
                 break
-        return data_list
+
+    def get_toggl_log_page(self, project_id, date_range_list, page):
+        """Pull a single page of toggl data from api
+
+        Args:
+            project_id (int): Project id to pull data from, WORKSPACE_PROJECT_ID for every project
+            date_range_list (list): List of date range, each item in list is a datetime object.
+            page (int): Page number to pull, starting at 1
+
+        Returns:
+            data (dict): Json response of the detailed report for the page
+
+        """
+        cache_key = (self.settings["workspace_id"], project_id, date_range_list[0].isoformat(),
+                     date_range_list[1].isoformat(), f"page{page}")
+        if project_id == WORKSPACE_PROJECT_ID:
+            data = self.get_workspace_times(date_range_list[0], date_range_list[1], page)
+        else:
+            data = self.client.get_project_times(str(project_id), date_range_list[0], date_range_list[1],
+                                                 extra_params={"page": page})
+        # only cache successful responses
+        if self.response_cache is not None and "data" in data:
+            self.response_cache.put(cache_key, data)
+        return data
+
+    def get_workspace_times(self, start_date, end_date, page):
+        """Pull a single page of the detailed report of every project in the workspace. Same request as
+        TogglClientApi.get_project_times, without the project_ids filter.
+
+        Args:
+            start_date (date): First day of the date range
+            end_date (date): Last day of the date range
+            page (int): Page number to pull, starting at 1
+
+        Returns:
+            data (dict): Json response of the detailed report for the page
+
+        """
+        params = {
+            "workspace_id": self.client.workspace_id,
+            "since": start_date.strftime("%Y-%m-%d"),
+            "until": end_date.strftime("%Y-%m-%d"),
+            "user_agent": self.client.user_agent,
+            "grouping": "users",
+            "subgrouping": "projects",
+            "page": page,
+        }
+        response = self.client.query_report("/details", params)
+        response.raise_for_status()
+        return response.json()
+
+    def get_toggl_summary(self, date_range_list):
+        """Pull the summary report of the workspace, the time tracked on each project in a date range
+
+        Args:
+            date_range_list (list): List of date range, each item in list is a datetime object.
+
+        Returns:
+            data (dict): Json response of the summary report, "data" holds one item per project with its "id" and
+                "time" in milliseconds
+
+        """
+        params = {
+            "workspace_id": self.client.workspace_id,
+            "since": date_range_list[0].strftime("%Y-%m-%d"),
+            "until": date_range_list[1].strftime("%Y-%m-%d"),
+            "user_agent": self.client.user_agent,
+            "grouping": "projects",
+            "subgrouping": "users",
+        }
+        response = self.client.query_report("/summary", params)
+        response.raise_for_status()
+        return response.json()
+
+    def get_toggl_log_data_many(self, project_id_list, date_range_list):
+        """Pull toggl data from api for every project and date range
+
+        With max_workers above 1, the (project, date range, page) requests are fanned out over a thread pool.
+        See iter_toggl_log_data_windows. The pages are returned in the same order as the serial loop.
+
+        Args:
+            project_id_list (list): List of project id's to pull data from
+            date_range_list (list): Nested list of date ranges, for example:
+                [[datetime.date(2019, 1, 1), datetime.date(2019, 12, 31)]]
+
+        Returns:
+            data_list (list): Nested list containing toggl data, one item per page
+
+        """
+        work_list = [(project, date_range) for project in project_id_list for date_range in date_range_list]
+        return self.get_toggl_log_data_windows(work_list)
+
+    def get_toggl_log_data_windows(self, work_list):
+        """Pull toggl data from api for a list of (project, date range) pairs. See iter_toggl_log_data_windows.
+
+        Args:
+            work_list (list): List of (project_id, date_range_list) tuples, for example:
+                [(123, [datetime.date(2019, 1, 1), datetime.date(2019, 12, 31)])]
+
+        Returns:
+            data_list (list): Nested list containing toggl data, one item per page
+
+        """
+        return list(self.iter_toggl_log_data_windows(work_list))
+
+    def iter_toggl_log_data_windows(self, work_list, skip_dormant=None):
+        """Pull toggl data from api for a list of (project, date range) pairs, yielding one page at a time in the
+        same order as the serial loop.
+
+        With max_workers above 1, the (project, date range, page) requests are fanned out over a thread pool.
+        The first page of the next few project/date ranges is pulled ahead, and its total_count and per_page are
+        used to queue the remaining pages. Only max_workers * 2 project/date ranges are in flight at once, so
+        memory stays bounded however long the work list is.
+
+        In the "workspace" fetch_mode, see iter_workspace_log_data, the detailed report is pulled once per date range
+        for every project at once. With skip_dormant_projects, the date ranges of archived projects are left out.
+
+        Args:
+            work_list (list): List of (project_id, date_range_list) tuples, for example:
+                [(123, [datetime.date(2019, 1, 1), datetime.date(2019, 12, 31)])]
+            skip_dormant (bool, optional): Leave out the date ranges of archived projects, defaults to
+                skip_dormant_projects of the toggl_config. A reconcile pulls every partition it picked, since it
+                deletes the stored entries of the partitions that come back without them
+
+        Yields:
+            page_data (list): List of toggl entries of one page
+
+        """
+        # replay mode - read the pages from the response cache
+        if self.replay:
+            yield from self.iter_cached_log_data(work_list)
+            return
+
+        if self.skip_dormant if skip_dormant is None else skip_dormant:
+            work_list = self.skip_dormant_projects(work_list)
+        if self.fetch_mode == "workspace":
+            yield from self.iter_workspace_log_data(work_list)
+        else:
+            yield from self._iter_window_pages(work_list)
+
+    def iter_workspace_log_data(self, work_list):
+        """Pull toggl data from api for a list of (project, date range) pairs with one detailed report for the
+        whole workspace per date range, instead of one per project. The date ranges of every project are merged,
+        pulled like a single project (split if they have too many pages, concurrent with max_workers above 1) and
+        only the entries of the requested projects and date ranges are kept. Entries without a project are left
+        out, same as the per project pulls.
+
+        Args:
+            work_list (list): List of (project_id, date_range_list) tuples, for example:
+                [(123, [datetime.date(2019, 1, 1), datetime.date(2019, 12, 31)])]
+
+        Yields:
+            page_data (list): List of toggl entries of one page, of any of the projects
+
+        """
+        # project id -> list of (first day, last day) ISO strings, compared with the day the entry starts on
+        project_date_ranges = {}
+        for project, date_range in work_list:
+            project_date_ranges.setdefault(project, []).append((date_range[0].isoformat(),
+                                                                date_range[1].isoformat()))
+
+        workspace_work_list = [(WORKSPACE_PROJECT_ID, date_range)
+                               for date_range in merge_date_ranges([date_range for _, date_range in work_list])]
+        print(f"Pulling {len(project_date_ranges)} projects with {len(workspace_work_list)} workspace date ranges")
+        for page_data in self._iter_window_pages(workspace_work_list):
+            page_data = [entry for entry in page_data if entry.get("pid") in project_date_ranges and any(
+                range_start <= entry["start"][:10] <= range_end
+                for range_start, range_end in project_date_ranges[entry["pid"]])]
+            if page_data:
+                yield page_data
+
+    def _iter_window_pages(self, work_list):
+        """Pull the pages of every (project, date range) pair, see iter_toggl_log_data_windows"""
+        # serial path - one request at a time
+        if self.max_workers <= 1:
+            for project, date_range in work_list:
+                yield from self.get_toggl_log_data(project_id=project, date_range_list=date_range)
+            return
+
+        # split the date ranges by the granularity remembered for each project
+        window_iter = ((project, window, granularity) for project, date_range in work_list
+                       for window, granularity in self.split_window(project, date_range))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+
+            def submit_next():
+                # pull the first page of the next project and date range
+                for project, date_range, granularity in window_iter:
+                    first_future = executor.submit(self.get_toggl_log_page, project, date_range, 1)
+                    pending.append((project, date_range, granularity, first_future))
+                    break
+
+            for _ in range(self.max_workers * 2):
+                submit_next()
+
+            while pending:
+                project, date_range, granularity, first_future = pending.popleft()
+                data = first_future.result()
+                submit_next()
+
+                if "total_count" not in data:
+                    # no page counts in the response - page through this project and date range serially
+                    yield from self._get_window_data(project, date_range, granularity)
+                    continue
+                if len(data["data"]) == 0:
+                    continue
+
+                # too many pages - pull the smaller date ranges next, their first pages in parallel
+                sub_window_list = self._split_large_window(project, date_range, granularity, data)
+                if sub_window_list:
+                    sub_items = [(project, sub_window, sub_granularity,
+                                  executor.submit(self.get_toggl_log_page, project, sub_window, 1))
+                                 for sub_window, sub_granularity in sub_window_list]
+                    pending.extendleft(reversed(sub_items))
+                    continue
+
+                # queue the remaining pages based on the counts returned with the first page
+                futures = [executor.submit(self.get_toggl_log_page, project, date_range, page)
+                           for page in range(2, min(self._page_count(data), MAX_PAGES) + 1)]
+                print("Data found!")
+                yield data["data"]
+                for future in futures:
+                    page_data = future.result()
+                    # stop at the first empty page, same as the serial loop
+                    if len(page_data["data"]) == 0:
+                        break
+                    print("Data found!")
+                    yield page_data["data"]
+
+    def iter_cached_log_data(self, work_list):
+        """Read toggl data from the response cache for a list of (project, date range) pairs. Every cached page of
+        a project whose date range overlaps the requested date ranges is read, whichever run cached it. An entry
+        cached more than once is only yielded once, in its latest "updated" version. The entries of the requested
+        projects in pages cached by the "workspace" fetch_mode are read up front and held until their project is
+        yielded.
+
+        Args:
+            work_list (list): List of (project_id, date_range_list) tuples, for example:
+                [(123, [datetime.date(2019, 1, 1), datetime.date(2019, 12, 31)])]
+
+        Yields:
+            page_data (list): List of toggl entries of one page
+
+        """
+        project_date_ranges = {}
+        for project, date_range in work_list:
+            project_date_ranges.setdefault(project, []).append([date_range[0].isoformat(),
+                                                                date_range[1].isoformat()])
+
+        workspace_id = self.settings["workspace_id"]
+        # project id -> entry id -> entry of the pages cached by the "workspace" fetch_mode, only for the requested
+        # projects and date ranges
+        workspace_entry_dict = {}
+        for cache_key in self.response_cache.keys((workspace_id, WORKSPACE_PROJECT_ID)):
+            if len(cache_key) != 5:
+                continue
+            for entry in self.response_cache.get(cache_key)["data"]:
+                if entry.get("pid") in project_date_ranges and any(
+                        range_start <= entry["start"][:10] <= range_end
+                        for range_start, range_end in project_date_ranges[entry["pid"]]):
+                    _keep_latest(workspace_entry_dict.setdefault(entry["pid"], {}), entry)
+
+        for project, date_range_list in project_date_ranges.items():
+            # entry id -> entry, only kept for one project at a time
+            entry_dict = workspace_entry_dict.pop(project, {})
+            for cache_key in self.response_cache.keys((workspace_id, project)):
+                if len(cache_key) != 5:
+                    continue
+                start_date, end_date = cache_key[2], cache_key[3]
+                if not any(start_date <= range_end and end_date >= range_start
+                           for range_start, range_end in date_range_list):
+                    continue
+                for entry in self.response_cache.get(cache_key)["data"]:
+                    _keep_latest(entry_dict, entry)
+
+            if not entry_dict:
+                print(f"No cached data for project {project}")
+                continue
+            print("Data found!")
+            entry_list = list(entry_dict.values())
+            for page_start in range(0, len(entry_list), REPLAY_PAGE_SIZE):
+                yield entry_list[page_start:page_start + REPLAY_PAGE_SIZE]
+
+    @staticmethod
+    def _page_count(data):
+        """Work out how many pages a detailed report has from its first page
+
+        Args:
+            data (dict): Json response of the first page of the detailed report
+
+        Returns:
+            page_count (int): Number of pages
+
+        """
+        if not data.get("per_page"):
+            return 1
+        return ceil(data["total_count"] / data["per_page"])
+
+
+def _keep_latest(entry_dict, entry):
+    """Add an entry to an entry id -> entry dict, unless the dict has a version with a later "updated" timestamp"""
+    cached_entry = entry_dict.get(entry["id"])
+    if cached_entry is None or _parse_timestamp(entry["updated"]) >= _parse_timestamp(cached_entry["updated"]):
+        entry_dict[entry["id"]] = entry
+
+
+def _no_network_query(*args, **kwargs):
+    """Stand in for TogglClientApi._do_get_query and _do_post_query in replay mode"""
+    raise RuntimeError("Network calls are disabled in replay mode")
+
+
+def split_date_range_by(date_range_list, granularity):
+    """Split a date range into consecutive smaller date ranges
+
+    Args:
+        date_range_list (list): List of date range, each item in list is a datetime object.
+        granularity (str): One of WINDOW_GRANULARITIES. "year" keeps the date range as is, "half" splits it in two,
+            "month" and "week" split it on calendar months and 7 day blocks, "day" gives one date range per day
+
+    Returns:
+        window_list (list): Nested list of date ranges covering the same days
+
+    """
+    start_date, end_date = date_range_list
+    if granularity == "year" or start_date >= end_date:
+        return [[start_date, end_date]]
+    if granularity == "half":
+        middle_date = start_date + (end_date - start_date) // 2
+        return [[start_date, middle_date], [middle_date + timedelta(days=1), end_date]]
+
+    window_list = []
+    window_start_date = start_date
+    while window_start_date <= end_date:
+        if granularity == "month":
+            # first day of the next month
+            next_start_date = (window_start_date.replace(day=1) + timedelta(days=32)).replace(day=1)
+        elif granularity == "week":
+            next_start_date = window_start_date + timedelta(days=7)
+        else:
+            next_start_date = window_start_date + timedelta(days=1)
+        window_end_date = min(next_start_date - timedelta(days=1), end_date)
+        window_list.append([window_start_date, window_end_date])
+        window_start_date = next_start_date
+    return window_list
+
+
+def merge_date_ranges(date_range_list):
+    """Merge overlapping date ranges, for example the date ranges of many projects pulled for the whole workspace.
+    Merged date ranges longer than a year are split again, see split_date_range.
+
+    Args:
+        date_range_list (list): Nested list of date ranges, in any order
+
+    Returns:
+        merged_date_range_list (list): Nested list of date ranges in date order, covering the same days once
+
+    """
+    merged_date_range_list = []
+    for start_date, end_date in sorted(tuple(date_range) for date_range in date_range_list):
+        if merged_date_range_list and start_date <= merged_date_range_list[-1][1]:
+            merged_date_range_list[-1][1] = max(merged_date_range_list[-1][1], end_date)
+        else:
+            merged_date_range_list.append([start_date, end_date])
+    return [window for start_date, end_date in merged_date_range_list
+            for window in (split_date_range(start_date, end_date)
+                           if (end_date - start_date).days > MAX_WINDOW_DAYS else [[start_date, end_date]])]
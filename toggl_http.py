@@ -0,0 +1,251 @@
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import random
+from threading import Lock
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# toggl documents a limit of about 1 request per second per api token
+DEFAULT_REQUESTS_PER_SECOND = 1.0
+DEFAULT_BURST = 1
+
+# retry settings for 429 and 5xx responses and connection errors
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_SECS = 1.0
+MAX_BACKOFF_SECS = 60.0
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# methods safe to send twice - other methods, like POST, are only retried when the request was not handled: a 429
+# response, or a connection error before the request was sent
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+NOT_HANDLED_STATUS_CODES = {429}
+
+# rate limiters shared by every TogglApi in the process, keyed by api token
+_rate_limiters = {}
+_rate_limiters_lock = Lock()
+
+
+class TokenBucket():
+    def __init__(self, rate, burst=DEFAULT_BURST):
+        """Token bucket rate limiter, safe to share between threads
+
+        Args:
+            rate (float): Tokens added per second
+            burst (int, optional): Most tokens the bucket holds, the number of requests allowed back to back
+
+        Returns:
+
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is available
+
+        Args:
+
+        Returns:
+            wait_secs (float): Number of seconds spent waiting for the token
+
+        """
+        wait_secs = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return wait_secs
+                sleep_secs = (1 - self.tokens) / self.rate
+            time.sleep(sleep_secs)
+            wait_secs += sleep_secs
+
+
+def get_rate_limiter(key, rate=DEFAULT_REQUESTS_PER_SECOND, burst=DEFAULT_BURST):
+    """Get the rate limiter shared by every caller in the process using the same key
+
+    Args:
+        key (str): Key of the rate budget, for example the api token
+        rate (float, optional): Requests per second, only used when the limiter is created
+        burst (int, optional): Requests allowed back to back, only used when the limiter is created
+
+    Returns:
+        rate_limiter (TokenBucket object): Shared rate limiter
+
+    """
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = TokenBucket(rate=rate, burst=burst)
+        return _rate_limiters[key]
+
+
+def build_session(pool_size):
+    """Build a requests session that keeps connections alive and pools them
+
+    Args:
+        pool_size (int): Number of connections kept per host, at least the number of concurrent requests
+
+    Returns:
+        session (requests Session object): Session with a pooled adapter for http and https
+
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _not_sent(error):
+    """Tell if a connection error happened before the request was sent, so the server never saw it
+
+    Args:
+        error (requests RequestException object): Connection error or timeout of requests
+
+    Returns:
+        not_sent (bool): True for connect timeouts and failures to open the connection
+
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # requests wraps the urllib3 error - MaxRetryError.reason holds the error of the connection
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class TogglHttp():
+    def __init__(self, rate_limiter, pool_size=1, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_secs=DEFAULT_BACKOFF_SECS):
+        """Send requests for TogglClientApi through a pooled session, the shared rate limiter and retries with
+        jittered exponential backoff. get and post match TogglClientApi._do_get_query and _do_post_query.
+
+        Args:
+            rate_limiter (TokenBucket object): Rate limiter every request waits on
+            pool_size (int, optional): Number of pooled keep-alive connections
+            max_retries (int, optional): Number of retries for 429/5xx responses and connection errors, see request
+            backoff_secs (float, optional): Base of the exponential backoff
+
+        Returns:
+
+        """
+        self.rate_limiter = rate_limiter
+        self.session = build_session(pool_size)
+        self.max_retries = max_retries
+        self.backoff_secs = backoff_secs
+        self.stats = {"requests": 0, "retries": 0, "throttle_wait_secs": 0.0, "bytes_received": 0}
+        self.stats_lock = Lock()
+
+    def get(self, url, headers, auth, params, timeout):
+        """Send a GET request - drop in for TogglClientApi._do_get_query"""
+        return self.request("GET", url, headers=headers, auth=auth, params=params, timeout=timeout)
+
+    def post(self, url, headers, auth, params, timeout, json_data):
+        """Send a POST request - drop in for TogglClientApi._do_post_query"""
+        return self.request("POST", url, headers=headers, auth=auth, params=params, timeout=timeout, json=json_data)
+
+    def request(self, method, url, **kwargs):
+        """Send a request, retrying 429/5xx responses and connection errors. Requests that are not idempotent, like
+        POST, are only retried on 429 responses and connection errors before the request was sent, so a write is
+        never sent twice.
+
+        Args:
+            method (str): Http method
+            url (str): Full url
+            **kwargs: Passed on to requests Session.request
+
+        Returns:
+            response (requests Response object): Last response. Still a 429/5xx if every retry failed
+
+        """
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_status_codes = RETRY_STATUS_CODES if idempotent else NOT_HANDLED_STATUS_CODES
+        for attempt in range(self.max_retries + 1):
+            wait_secs = self.rate_limiter.acquire()
+            self._add_stats(requests=1, throttle_wait_secs=wait_secs)
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                if attempt == self.max_retries or not (idempotent or _not_sent(error)):
+                    raise
+                self._add_stats(retries=1)
+                time.sleep(self._backoff(attempt))
+                continue
+
+            self._add_stats(bytes_received=len(response.content))
+            if response.status_code not in retry_status_codes or attempt == self.max_retries:
+                return response
+            self._add_stats(retries=1)
+            retry_after_secs = self._retry_after(response)
+            time.sleep(retry_after_secs if retry_after_secs is not None else self._backoff(attempt))
+        return response
+
+    def connection_stats(self):
+        """Count the connections opened and requests sent over the pooled connections
+
+        Args:
+
+        Returns:
+            stats (dict): Request, retry and throttling counts plus "connections_opened". Fewer connections than
+                requests means keep-alive connections were reused
+
+        """
+        connections_opened = 0
+        for adapter in set(self.session.adapters.values()):
+            for key in adapter.poolmanager.pools.keys():
+                connections_opened += adapter.poolmanager.pools[key].num_connections
+        with self.stats_lock:
+            return dict(self.stats, connections_opened=connections_opened)
+
+    def _add_stats(self, **counts):
+        with self.stats_lock:
+            for name, count in counts.items():
+                self.stats[name] += count
+
+    def _backoff(self, attempt):
+        """Full jitter exponential backoff
+
+        Args:
+            attempt (int): Number of the failed attempt, starting at 0
+
+        Returns:
+            sleep_secs (float): Number of seconds to sleep
+
+        """
+        return random.uniform(0, min(MAX_BACKOFF_SECS, self.backoff_secs * 2 ** attempt))
+
+    @staticmethod
+    def _retry_after(response):
+        """Read the Retry-After header of a response
+
+        Args:
+            response (requests Response object): 429/5xx response
+
+        Returns:
+            sleep_secs (float): Number of seconds to wait, None if the header is missing or invalid
+
+        """
+        retry_after = response.headers.get("Retry-After")
+        if not retry_after:
+            return None
+        try:
+            return min(MAX_BACKOFF_SECS, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+        try:
+            retry_date = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        # dates in the -0000 zone are parsed without a timezone - they are in UTC all the same
+        if retry_date.tzinfo is None:
+            retry_date = retry_date.replace(tzinfo=timezone.utc)
+        try:
+            return min(MAX_BACKOFF_SECS, max(0.0, (retry_date - datetime.now(timezone.utc)).total_seconds()))
+        except TypeError:
+            return None
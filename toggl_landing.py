@@ -0,0 +1,272 @@
+from os import listdir, makedirs, remove, replace, rmdir
+from os.path import exists, isdir, join
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from toggl_transform import ENTRY_CHUNK_SIZE
+
+# columns of the detailed report entries kept in the landing zone, other columns are dropped
+ENTRY_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("pid", pa.int64()),
+    ("tid", pa.int64()),
+    ("uid", pa.int64()),
+    ("description", pa.string()),
+    ("start", pa.timestamp("us", tz="UTC")),
+    ("end", pa.timestamp("us", tz="UTC")),
+    ("updated", pa.timestamp("us", tz="UTC")),
+    ("dur", pa.int64()),
+    ("user", pa.string()),
+    ("use_stop", pa.bool_()),
+    ("client", pa.string()),
+    ("project", pa.string()),
+    ("project_color", pa.string()),
+    ("project_hex_color", pa.string()),
+    ("task", pa.string()),
+    ("billable", pa.float64()),
+    ("is_billable", pa.bool_()),
+    ("cur", pa.string()),
+    ("tags", pa.list_(pa.string())),
+])
+
+# date columns of the entries, stored as UTC timestamps
+ENTRY_DATE_COLUMNS = ["start", "end", "updated"]
+
+PARTITION_FILE_NAME = "part-0.parquet"
+
+
+class LandingZone():
+    def __init__(self, landing_dir):
+        """Raw toggl data stored as parquet. Entries are partitioned by project and by the month they start in,
+        with a snapshot of the projects alongside:
+            landing_dir/projects.parquet
+            landing_dir/entries/project_id=123/month=2020-06/part-0.parquet
+
+        The entries can be read back with pyarrow or pandas.read_parquet on landing_dir/entries, using filters on
+        project_id and month to skip partitions.
+
+        Args:
+            landing_dir (str): Full path to the landing zone directory
+
+        Returns:
+
+        """
+        self.landing_dir = landing_dir
+        self.entries_dir = join(landing_dir, "entries")
+        self.projects_file = join(landing_dir, "projects.parquet")
+        makedirs(self.entries_dir, exist_ok=True)
+
+    def write_projects(self, projects_data_list):
+        """Replace the projects snapshot, unless the projects have not changed
+
+        Args:
+            projects_data_list (list): List of dictionaries containing projects data, as returned by the api
+
+        Returns:
+            written (bool): True if the snapshot was rewritten
+
+        """
+        projects_df = pd.DataFrame(projects_data_list)
+        if exists(self.projects_file) and pq.read_table(self.projects_file).to_pandas().equals(projects_df):
+            return False
+        _write_parquet(pa.Table.from_pandas(projects_df, preserve_index=False), self.projects_file)
+        return True
+
+    def read_projects(self, columns=None):
+        """Read the projects snapshot
+
+        Args:
+            columns (list, optional): Columns to read, all columns if not given
+
+        Returns:
+            projects_df (Pandas DataFrame object): Pandas DataFrame of projects, empty if there is no snapshot
+
+        """
+        if not exists(self.projects_file):
+            return pd.DataFrame(columns=columns)
+        return pq.read_table(self.projects_file, columns=columns).to_pandas()
+
+    def write_entries(self, entries):
+        """Merge entries into their partitions. Only the partitions with new or changed entries are rewritten, and
+        entries that moved to another month or project are removed from their old partition.
+
+        Args:
+            entries (list or Pandas DataFrame object): Toggl entries from the detailed report, as a list of
+                dictionaries or a Pandas DataFrame of them
+
+        Returns:
+            partition_count (int): Number of partitions rewritten
+
+        """
+        entry_df = conform_entries(pd.DataFrame(entries) if isinstance(entries, list) else entries)
+        if entry_df.empty:
+            return 0
+        month_series = entry_df["start"].dt.strftime("%Y-%m")
+
+        # drop entries that moved to another month or project from their old partition. Any partition can hold
+        # them, so the id column of every partition is read
+        partition_dict = dict(zip(entry_df["id"], zip(entry_df["pid"], month_series)))
+        entry_id_index = pd.Index(entry_df["id"].unique())
+        partition_count = 0
+        for project_id in self.project_ids():
+            for month, path in self.partitions(project_ids=[project_id]):
+                id_series = pq.read_table(path, columns=["id"]).column("id").to_pandas()
+                moved_id_set = {entry_id for entry_id in id_series[entry_id_index.get_indexer(id_series) >= 0]
+                                if partition_dict[entry_id] != (project_id, month)}
+                if moved_id_set:
+                    old_df = pq.read_table(path).to_pandas()
+                    self._write_partition(project_id, month, old_df[~old_df["id"].isin(moved_id_set)])
+                    partition_count += 1
+
+        for project_id, project_df in entry_df.groupby("pid"):
+            project_month_series = month_series[project_df.index]
+            for month, month_df in project_df.groupby(project_month_series):
+                path = self.partition_path(project_id, month)
+                if exists(path):
+                    old_df = pq.read_table(path).to_pandas()
+                    # every entry is already stored with the same updated timestamp - leave the partition alone
+                    old_key_set = set(zip(old_df["id"], old_df["updated"]))
+                    if all(key in old_key_set for key in zip(month_df["id"], month_df["updated"])):
+                        continue
+                    month_df = pd.concat([old_df[~old_df["id"].isin(month_df["id"])], month_df])
+                self._write_partition(project_id, month, month_df)
+                partition_count += 1
+        return partition_count
+
+    def read_entries(self, columns=None, project_ids=None, start_month=None, end_month=None):
+        """Read entries, only opening the partitions of the given projects and months
+
+        Args:
+            columns (list, optional): Columns to read, all columns if not given
+            project_ids (list, optional): Project ids to read, all projects if not given
+            start_month (str, optional): First month to read, for example "2020-01"
+            end_month (str, optional): Last month to read, for example "2020-12"
+
+        Returns:
+            entry_df (Pandas DataFrame object): Pandas DataFrame of entries
+
+        """
+        path_list = [path for _, path in self.partitions(project_ids, start_month, end_month)]
+        if not path_list:
+            return pd.DataFrame(columns=columns or ENTRY_SCHEMA.names)
+        return pd.concat([pq.read_table(path, columns=columns).to_pandas() for path in path_list],
+                         ignore_index=True)
+
+    def iter_entry_chunks(self, work_list, columns=None, chunk_size=ENTRY_CHUNK_SIZE):
+        """Read the entries of a list of (project, date range) pairs in chunks, the landing zone counterpart of
+        TogglApi.iter_toggl_log_data_windows. Whole partitions are read, so a chunk holds every entry of the
+        months overlapping the date ranges.
+
+        Args:
+            work_list (list): List of (project_id, date_range_list) tuples, for example:
+                [(123, [datetime.date(2019, 1, 1), datetime.date(2019, 12, 31)])]
+            columns (list, optional): Columns to read, all columns if not given
+            chunk_size (int, optional): Number of entries per chunk. Partitions are never split, so a chunk can
+                go over chunk_size by up to one partition
+
+        Yields:
+            chunk_df (Pandas DataFrame object): Pandas DataFrame of entries
+
+        """
+        path_list = []
+        for project, date_range in work_list:
+            for _, path in self.partitions([project], date_range[0].strftime("%Y-%m"),
+                                           date_range[1].strftime("%Y-%m")):
+                path_list.append(path)
+        # date ranges of the same project can share a month
+        path_list = list(dict.fromkeys(path_list))
+
+        frame_list = []
+        row_count = 0
+        for path in path_list:
+            frame_list.append(pq.read_table(path, columns=columns).to_pandas())
+            row_count += len(frame_list[-1])
+            if row_count >= chunk_size:
+                yield pd.concat(frame_list, ignore_index=True)
+                frame_list = []
+                row_count = 0
+        if row_count:
+            yield pd.concat(frame_list, ignore_index=True)
+
+    def partitions(self, project_ids=None, start_month=None, end_month=None):
+        """List the entry partitions from the directory names, without opening any file
+
+        Args:
+            project_ids (list, optional): Project ids to list, all projects if not given
+            start_month (str, optional): First month to list, for example "2020-01"
+            end_month (str, optional): Last month to list, for example "2020-12"
+
+        Returns:
+            partition_list (list): List of (month, path) tuples, ordered by project and month
+
+        """
+        if project_ids is None:
+            project_ids = self.project_ids()
+        partition_list = []
+        for project_id in project_ids:
+            project_dir = join(self.entries_dir, f"project_id={project_id}")
+            if not isdir(project_dir):
+                continue
+            for name in sorted(listdir(project_dir)):
+                month = name.split("=", 1)[1]
+                if (start_month and month < start_month) or (end_month and month > end_month):
+                    continue
+                path = join(project_dir, name, PARTITION_FILE_NAME)
+                if exists(path):
+                    partition_list.append((month, path))
+        return partition_list
+
+    def project_ids(self):
+        """List the ids of the projects with entry partitions from the directory names
+
+        Args:
+
+        Returns:
+            project_id_list (list): Sorted project ids
+
+        """
+        return sorted(int(name.split("=", 1)[1]) for name in listdir(self.entries_dir)
+                      if name.startswith("project_id="))
+
+    def partition_path(self, project_id, month):
+        return join(self.entries_dir, f"project_id={project_id}", f"month={month}", PARTITION_FILE_NAME)
+
+    def _write_partition(self, project_id, month, partition_df):
+        """Replace a partition file, or remove it if no entries are left"""
+        path = self.partition_path(project_id, month)
+        if partition_df.empty:
+            if exists(path):
+                remove(path)
+                rmdir(join(self.entries_dir, f"project_id={project_id}", f"month={month}"))
+            return
+        makedirs(join(self.entries_dir, f"project_id={project_id}", f"month={month}"), exist_ok=True)
+        # entries in start order, so row group statistics can skip rows when filtering on start
+        partition_df = partition_df.sort_values(["start", "id"])
+        _write_parquet(pa.Table.from_pandas(partition_df[ENTRY_SCHEMA.names], schema=ENTRY_SCHEMA,
+                                            preserve_index=False), path)
+
+
+def conform_entries(entry_df):
+    """Fit a Pandas DataFrame of toggl entries to ENTRY_SCHEMA - missing columns are added as nulls, other columns
+    are dropped and the date columns are converted to UTC timestamps
+
+    Args:
+        entry_df (Pandas DataFrame object): Pandas DataFrame of toggl entries
+
+    Returns:
+        entry_df (Pandas DataFrame object): Pandas DataFrame with the ENTRY_SCHEMA columns
+
+    """
+    entry_df = entry_df.reindex(columns=ENTRY_SCHEMA.names).reset_index(drop=True)
+    for col in ENTRY_DATE_COLUMNS:
+        entry_df[col] = pd.to_datetime(entry_df[col], utc=True)
+    return entry_df
+
+
+def _write_parquet(table, path):
+    """Write a parquet file through a temp file, so readers never see a half written file"""
+    temp_path = path + ".tmp"
+    pq.write_table(table, temp_path)
+    replace(temp_path, path)
@@ -0,0 +1,251 @@
+from contextlib import contextmanager
+from io import StringIO
+import time
+
+from sqlalchemy import text
+
+# number of rows sent per COPY FROM STDIN call
+COPY_CHUNK_SIZE = 50000
+
+
+@contextmanager
+def begin(engine, conn=None):
+    """Run a block in the caller's transaction if a connection is given, otherwise in a transaction of its own
+
+    Args:
+        engine (SQLAlchemy engine object): SQLAlchemy engine object
+        conn (SQLAlchemy connection object, optional): Open connection inside the caller's transaction, the caller
+            commits
+
+    Yields:
+        conn (SQLAlchemy connection object): Connection to run the block on
+
+    """
+    if conn is not None:
+        yield conn
+        return
+    with engine.begin() as own_conn:
+        yield own_conn
+
+
+def defer_foreign_keys(conn, table_names):
+    """Defer the foreign key checks of the tables to the commit of the current transaction, so the tables can be
+    loaded in any order. Foreign keys of databases created from an older toggl_data.sql are made deferrable first.
+
+    Args:
+        conn (SQLAlchemy connection object): Open connection inside the transaction to defer the checks of
+        table_names (list): Names of the tables whose foreign keys are deferred
+
+    Returns:
+
+    """
+    rows = conn.execute(text("SELECT conrelid::regclass::text, conname FROM pg_constraint "
+                             "WHERE contype = 'f' AND NOT condeferrable AND conrelid::regclass::text = ANY(:tables);"),
+                        {"tables": list(table_names)}).fetchall()
+    for table_name, constraint_name in rows:
+        conn.execute(text(f'ALTER TABLE {table_name} ALTER CONSTRAINT "{constraint_name}" '
+                          f'DEFERRABLE INITIALLY IMMEDIATE;'))
+    conn.execute(text("SET CONSTRAINTS ALL DEFERRED;"))
+
+
+def sync_id_sequence(conn, table_name):
+    """Move the id sequence of a table past the highest id in it. Rows written with explicit ids, for example by
+    older versions that assigned ids from the highest id, leave the sequence behind. The sequence never moves back.
+
+    Args:
+        conn (SQLAlchemy connection object): Open connection
+        table_name (str): Name of a table with a SERIAL id column
+
+    Returns:
+
+    """
+    conn.execute(text(f"SELECT setval(seq, GREATEST(max_id, pg_sequence_last_value(seq))) "
+                      f"FROM (SELECT CAST(pg_get_serial_sequence('{table_name}', 'id') AS regclass) AS seq, "
+                      f"(SELECT MAX(id) FROM {table_name}) AS max_id) AS sequence_ids "
+                      f"WHERE GREATEST(max_id, pg_sequence_last_value(seq)) IS NOT NULL;"))
+
+
+def add_data_to_table(dataframe_name, engine, table_name, chunk_size=COPY_CHUNK_SIZE):
+    """Append data to table if any exists in dataframe. Postgres tables are written with COPY FROM STDIN,
+    other databases fall back to DataFrame.to_sql.
+
+    Args:
+        dataframe_name (Pandas DataFrame object): Pandas DataFrame containing data to write to table
+        engine (SQLAlchemy engine object): SQLAlchemy engine object
+        table_name (str): Name of the table
+        chunk_size (int, optional): Number of rows written per COPY/INSERT batch
+
+    Returns:
+        row_count (int): Number of rows written
+
+    """
+    if dataframe_name.empty:
+        print(f"No new data to add to {table_name}")
+        return 0
+
+    start_time = time.perf_counter()
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            copy_data_to_table(dataframe_name=dataframe_name, conn=conn, table_name=table_name,
+                               chunk_size=chunk_size)
+    else:
+        dataframe_name.to_sql(table_name, engine, if_exists="append", index=False, chunksize=chunk_size)
+    elapsed_secs = time.perf_counter() - start_time
+
+    row_count = len(dataframe_name)
+    print(f"Added {row_count} rows to {table_name} table ({row_count / max(elapsed_secs, 1e-9):.0f} rows/sec)")
+    return row_count
+
+
+def copy_data_to_table(dataframe_name, conn, table_name, chunk_size=COPY_CHUNK_SIZE):
+    """Stream the dataframe into a postgres table with COPY FROM STDIN in csv format
+
+    Args:
+        dataframe_name (Pandas DataFrame object): Pandas DataFrame containing data to write to table
+        conn (SQLAlchemy connection object): Open connection to a postgres database, the caller commits
+        table_name (str): Name of the table
+        chunk_size (int, optional): Number of rows sent per COPY call
+
+    Returns:
+
+    """
+    column_list = ", ".join(dataframe_name.columns)
+    copy_sql = f"COPY {table_name} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N');"
+
+    # float columns holding whole numbers are ids that picked up NaN from a merge - write them as integers
+    dataframe_name = dataframe_name.copy()
+    for col in dataframe_name.columns:
+        if dataframe_name[col].dtype.kind == "f" and (dataframe_name[col].dropna() % 1 == 0).all():
+            dataframe_name[col] = dataframe_name[col].astype("Int64")
+
+    cursor = conn.connection.cursor()
+    for chunk_start in range(0, len(dataframe_name), chunk_size):
+        buffer = StringIO()
+        dataframe_name.iloc[chunk_start:chunk_start + chunk_size].to_csv(buffer, index=False, header=False,
+                                                                         na_rep="\\N")
+        buffer.seek(0)
+        cursor.copy_expert(copy_sql, buffer)
+
+
+def upsert_data_to_table(dataframe_name, engine, table_name, conflict_columns, update_columns=None,
+                         change_column=None, assign_id=False, replace_column=None, replace_values=None,
+                         chunk_size=COPY_CHUNK_SIZE, returning=None, return_existing=False, conn=None):
+    """Stage the dataframe into a temp table and merge it into the table inside postgres with
+    INSERT ... ON CONFLICT, so the table never has to be read back into pandas.
+
+    Args:
+        dataframe_name (Pandas DataFrame object): Pandas DataFrame containing data to write to table
+        engine (SQLAlchemy engine object): SQLAlchemy engine object
+        table_name (str): Name of the table
+        conflict_columns (list): Natural key columns of the table - must be covered by a unique constraint. A NULL
+            key never matches an existing row, fill missing names first, see toggl_transform.fill_missing_names
+        update_columns (list, optional): Columns to update when a row with the same natural key already exists.
+            Rows that already exist are left alone if not given
+        change_column (str, optional): Only update existing rows when this column has changed, for example
+            "update_date"
+        assign_id (bool, optional): Assign the id column in the database for new rows from the id sequence of the
+            table, so runs loading the table at the same time never hand out the same id. The dataframe must not
+            contain an id column, see sync_id_sequence
+        replace_column (str, optional): Column of the table to replace rows by, for example "toggl_entry_id".
+            Rows of the table with a replace_column value in replace_values that are not in the dataframe are
+            deleted
+        replace_values (list, optional): Values of replace_column whose rows are replaced by the dataframe
+        chunk_size (int, optional): Number of rows sent per COPY call when staging
+        returning (list, optional): Columns to return for the rows inserted or updated, for example
+            ["id", "task_name"] to learn the ids assigned to new names
+        return_existing (bool, optional): Also return the columns of the rows of the table the staged rows matched
+            and left alone, in the same statement - for example the ids of every name of the dataframe, new or not
+        conn (SQLAlchemy connection object, optional): Open connection to merge on inside the caller's transaction,
+            the caller commits. Defaults to a transaction of its own
+
+    Returns:
+        row_count (int): Number of rows inserted or updated. If returning is given, a list of tuples with the
+            returning columns of each row inserted or updated instead. If return_existing is also given, a tuple of
+            the list of tuples for every staged row and the number of rows inserted or updated
+
+    """
+    stage_table_name = f"stage_{table_name}"
+    columns = list(dataframe_name.columns)
+    column_list = ", ".join(columns)
+    conflict_list = ", ".join(conflict_columns)
+    # condition matching a staged row to a table row on the natural key
+    key_match = " AND ".join(f"{table_name}.{col} = {stage_table_name}.{col}" for col in conflict_columns)
+
+    start_time = time.perf_counter()
+    with begin(engine, conn) as conn:
+        # Create the staging table with the same column types as the table - dropped after the merge
+        conn.execute(text(f"CREATE TEMP TABLE {stage_table_name} ON COMMIT DROP AS "
+                          f"SELECT {column_list} FROM {table_name} WITH NO DATA;"))
+        copy_data_to_table(dataframe_name=dataframe_name, conn=conn, table_name=stage_table_name,
+                           chunk_size=chunk_size)
+
+        # Delete rows of the replaced parents that are no longer in the data
+        if replace_column and replace_values:
+            conn.execute(text(f"DELETE FROM {table_name} WHERE {replace_column} = ANY(:replace_values) "
+                              f"AND NOT EXISTS (SELECT 1 FROM {stage_table_name} WHERE {key_match});"),
+                         {"replace_values": list(replace_values)})
+
+        if assign_id:
+            # New rows get their ids from the sequence of the id column
+            insert_list = f"id, {column_list}"
+            select_list = (f"nextval(pg_get_serial_sequence('{table_name}', 'id')), "
+                           + ", ".join(f"{stage_table_name}.{col}" for col in columns))
+            where_clause = f"WHERE NOT EXISTS (SELECT 1 FROM {table_name} WHERE {key_match})"
+        else:
+            insert_list = column_list
+            select_list = column_list
+            where_clause = ""
+            if update_columns and change_column:
+                # Leave out the rows whose change column did not change - ON CONFLICT DO UPDATE locks the existing
+                # row until the transaction commits even if it is not updated, which would make other transactions
+                # loading the same rows wait
+                change_match = f"{table_name}.{change_column} IS NOT DISTINCT FROM {stage_table_name}.{change_column}"
+                where_clause = f"WHERE NOT EXISTS (SELECT 1 FROM {table_name} WHERE {key_match} AND {change_match})"
+
+        if update_columns:
+            set_list = ", ".join(f"{col} = EXCLUDED.{col}" for col in update_columns)
+            conflict_action = f"DO UPDATE SET {set_list}"
+            if change_column:
+                conflict_action += f" WHERE {table_name}.{change_column} IS DISTINCT FROM EXCLUDED.{change_column}"
+        else:
+            conflict_action = "DO NOTHING"
+
+        returning_clause = f" RETURNING {', '.join(returning)}" if returning else ""
+        insert_sql = (f"INSERT INTO {table_name} ({insert_list}) "
+                      f"SELECT DISTINCT ON ({conflict_list}) {select_list} FROM {stage_table_name} "
+                      f"{where_clause} ON CONFLICT ({conflict_list}) {conflict_action}")
+
+        if returning and return_existing:
+            # The statement sees the table as it was before the insert, so the rows the insert touched are taken
+            # from its RETURNING and the matched rows it left alone from the table - one round trip for both
+            key_list = ", ".join(f"{col} AS merged_key_{i}" for i, col in enumerate(conflict_columns))
+            merged_match = " AND ".join(f"merged.merged_key_{i} = {table_name}.{col}"
+                                        for i, col in enumerate(conflict_columns))
+            result = conn.execute(text(
+                f"WITH merged AS ({insert_sql} RETURNING {', '.join(returning)}, {key_list}) "
+                f"SELECT {', '.join(returning)}, TRUE FROM merged "
+                f"UNION ALL SELECT {', '.join(f'{table_name}.{col}' for col in returning)}, FALSE FROM {table_name} "
+                f"WHERE EXISTS (SELECT 1 FROM {stage_table_name} WHERE {key_match}) "
+                f"AND NOT EXISTS (SELECT 1 FROM merged WHERE {merged_match});"))
+            all_rows = result.fetchall()
+            row_count = sum(1 for row in all_rows if row[-1])
+            returned_rows = [tuple(row)[:-1] for row in all_rows]
+        else:
+            result = conn.execute(text(f"{insert_sql}{returning_clause};"))
+            row_count = result.rowcount
+            returned_rows = [tuple(row) for row in result.fetchall()] if returning else None
+        # a run merges the same table again for every chunk before it commits
+        conn.execute(text(f"DROP TABLE {stage_table_name};"))
+    elapsed_secs = time.perf_counter() - start_time
+
+    if row_count > 0:
+        print(f"Added or updated {row_count} rows in {table_name} table "
+              f"({len(dataframe_name) / max(elapsed_secs, 1e-9):.0f} rows/sec staged)")
+    else:
+        print(f"No new data to add to {table_name}")
+
+    if returning and return_existing:
+        return returned_rows, row_count
+    if returning:
+        return returned_rows
+    return row_count
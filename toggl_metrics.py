@@ -0,0 +1,255 @@
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import json
+import sys
+from threading import Lock
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on windows - peak RSS is left out of the report
+    resource = None
+
+# counters of TogglHttp.stats copied into the stages that call the api
+HTTP_COUNTERS = {"requests": "api_calls", "bytes_received": "bytes_received", "retries": "retries"}
+
+# stage counters and their prometheus metric names and help texts
+PROMETHEUS_METRICS = [
+    ("wall_secs", "toggl_stage_wall_seconds", "Wall time spent in the stage"),
+    ("calls", "toggl_stage_calls", "Number of times the stage ran, for example once per chunk"),
+    ("rows_in", "toggl_stage_rows_in", "Rows going into the stage"),
+    ("rows_out", "toggl_stage_rows_out", "Rows coming out of the stage"),
+    ("rows_written", "toggl_stage_rows_written", "Rows inserted or updated in the database"),
+    ("api_calls", "toggl_stage_api_calls", "Api requests sent, retries included"),
+    ("bytes_received", "toggl_stage_bytes_received", "Bytes of api responses received"),
+    ("retries", "toggl_stage_retries", "Api requests retried after a 429/5xx response or connection error"),
+    ("bytes_in", "toggl_stage_frame_bytes_in", "Memory held by the frames going into the stage"),
+    ("bytes_out", "toggl_stage_frame_bytes_out", "Memory held by the frames coming out of the stage"),
+    ("peak_rss_mb", "toggl_stage_peak_rss_megabytes", "Peak resident memory of the process when the stage ended"),
+]
+
+
+def peak_rss_mb():
+    """Get the peak resident memory of the process so far
+
+    Args:
+
+    Returns:
+        peak_rss_mb (float): Peak RSS in megabytes, None if it can not be measured
+
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on mac, kilobytes everywhere else
+    return max_rss / 1024 / 1024 if sys.platform == "darwin" else max_rss / 1024
+
+
+class StageMetrics():
+    def __init__(self, name):
+        """Counters of one pipeline stage, added up over every time the stage runs
+
+        Args:
+            name (str): Name of the stage, for example "task load"
+
+        Returns:
+
+        """
+        self.name = name
+        self.counters = {"wall_secs": 0.0, "calls": 0, "rows_in": 0, "rows_out": 0, "rows_written": 0}
+        self.peak_rss_mb = None
+
+    def add(self, **counts):
+        """Add to the counters of the stage, for example add(rows_out=10, rows_written=4)"""
+        for name, count in counts.items():
+            self.counters[name] = self.counters.get(name, 0) + count
+
+    def to_dict(self):
+        return dict(self.counters, peak_rss_mb=self.peak_rss_mb)
+
+
+class RunMetrics():
+    def __init__(self, pipeline, http=None):
+        """Per stage wall time, row counts, api counters and peak memory of one pipeline run
+
+        Args:
+            pipeline (str): Name of the pipeline, for example "toggl_relational_extract"
+            http (TogglHttp object, optional): Http layer of the TogglApi used by the run, to count the api calls,
+                bytes received and retries of the stages that pull from the api
+
+        Returns:
+
+        """
+        self.pipeline = pipeline
+        self.http = http
+        self.started_at = datetime.now(timezone.utc)
+        self.start_time = time.perf_counter()
+        # stage name -> StageMetrics, in the order the stages first ran
+        self.stages = {}
+        # stage name -> secs the stage spent on the critical path of the scheduled stages, see add_critical_path
+        self.critical_path_secs = {}
+        # stages scheduled by a StageGraph run at the same time
+        self.lock = Lock()
+
+    def get_stage(self, name):
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = StageMetrics(name)
+            return self.stages[name]
+
+    def add_critical_path(self, path_list):
+        """Add up the time each stage spent on the critical path of a StageGraph run
+
+        Args:
+            path_list (list): List of (stage name, secs) tuples, as returned by StageGraph.critical_path
+
+        Returns:
+
+        """
+        for name, secs in path_list:
+            self.critical_path_secs[name] = self.critical_path_secs.get(name, 0.0) + secs
+
+    @contextmanager
+    def stage(self, name, rows_in=0, api=False):
+        """Time a block of code as a run of a stage
+
+        Args:
+            name (str): Name of the stage
+            rows_in (int, optional): Rows going into the stage
+            api (bool, optional): Count the api calls, bytes received and retries made during the block
+
+        Yields:
+            stage (StageMetrics object): Metrics of the stage, to add rows_out and rows_written to
+
+        """
+        stage = self.get_stage(name)
+        http_stats = self._http_stats() if api else None
+        start_time = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.add(wall_secs=time.perf_counter() - start_time, calls=1, rows_in=rows_in)
+            if api:
+                self._add_http_stats(stage, http_stats)
+            stage.peak_rss_mb = peak_rss_mb()
+
+    def timed_iter(self, name, item_iter, count_rows=len):
+        """Wrap an iterator of api pages as a stage, for pulls interleaved with the stages processing them. Only the
+        time spent waiting for the next page counts as wall time. The api counters cover the whole iteration,
+        including pages pulled ahead by worker threads while other stages ran.
+
+        Args:
+            name (str): Name of the stage, for example "entry pull"
+            item_iter (iterable): Iterator to wrap, for example TogglApi.iter_toggl_log_data_windows
+            count_rows (function, optional): Number of rows in an item, added to rows_out
+
+        Yields:
+            item: Items of item_iter
+
+        """
+        stage = self.get_stage(name)
+        http_stats = self._http_stats()
+        item_iter = iter(item_iter)
+        try:
+            while True:
+                start_time = time.perf_counter()
+                try:
+                    item = next(item_iter)
+                except StopIteration:
+                    stage.add(wall_secs=time.perf_counter() - start_time)
+                    return
+                stage.add(wall_secs=time.perf_counter() - start_time, rows_out=count_rows(item))
+                yield item
+        finally:
+            stage.add(calls=1)
+            self._add_http_stats(stage, http_stats)
+            stage.peak_rss_mb = peak_rss_mb()
+
+    def report(self):
+        """Build the run report
+
+        Args:
+
+        Returns:
+            report (dict): Run totals and the counters of every stage
+
+        """
+        report = {
+            "pipeline": self.pipeline,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "wall_secs": time.perf_counter() - self.start_time,
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+        }
+        if self.critical_path_secs:
+            report["critical_path_secs"] = self.critical_path_secs
+        if self.http is not None:
+            report["http"] = self.http.connection_stats()
+        return report
+
+    def write_json(self, file_name):
+        """Write the run report to a json file"""
+        with open(file_name, "w") as json_data_file:
+            json.dump(self.report(), json_data_file, indent=4)
+
+    def prometheus_text(self):
+        """Format the stage counters in the prometheus text exposition format, for example for the node exporter
+        textfile collector
+
+        Args:
+
+        Returns:
+            text (str): One gauge per counter, labelled with the pipeline and stage
+
+        """
+        line_list = []
+        for counter_name, metric_name, help_text in PROMETHEUS_METRICS:
+            line_list.append(f"# HELP {metric_name} {help_text}")
+            line_list.append(f"# TYPE {metric_name} gauge")
+            for stage_name, stage in self.stages.items():
+                value = stage.to_dict().get(counter_name)
+                if value is None:
+                    continue
+                line_list.append(f'{metric_name}{{pipeline="{self.pipeline}",stage="{stage_name}"}} {value}')
+        if self.critical_path_secs:
+            line_list.append("# HELP toggl_stage_critical_path_seconds Wall time the stage spent on the critical "
+                             "path of the scheduled stages")
+            line_list.append("# TYPE toggl_stage_critical_path_seconds gauge")
+            for stage_name, secs in self.critical_path_secs.items():
+                line_list.append(f'toggl_stage_critical_path_seconds{{pipeline="{self.pipeline}",'
+                                 f'stage="{stage_name}"}} {secs}')
+        line_list.append("# HELP toggl_run_wall_seconds Wall time of the whole run")
+        line_list.append("# TYPE toggl_run_wall_seconds gauge")
+        line_list.append(f'toggl_run_wall_seconds{{pipeline="{self.pipeline}"}} '
+                         f'{time.perf_counter() - self.start_time}')
+        return "\n".join(line_list) + "\n"
+
+    def write_prometheus(self, file_name):
+        """Write the stage counters to a prometheus text file"""
+        with open(file_name, "w") as prometheus_file:
+            prometheus_file.write(self.prometheus_text())
+
+    def print_summary(self):
+        """Print the wall time and rows of every stage"""
+        print(f"{'stage':>19} {'secs':>9} {'rows in':>9} {'rows out':>9} {'written':>9} {'api calls':>9}")
+        for name, stage in self.stages.items():
+            counters = stage.counters
+            print(f"{name:>19} {counters['wall_secs']:9.2f} {counters['rows_in']:9d} {counters['rows_out']:9d} "
+                  f"{counters['rows_written']:9d} {counters.get('api_calls', 0):9d}")
+        if self.critical_path_secs:
+            # secs summed over every run of the stage graph, for example once per chunk - the path can differ per run
+            path_text = ", ".join(f"{name} {self.critical_path_secs[name]:.2f}" for name in self.stages
+                                  if name in self.critical_path_secs)
+            print(f"Critical path secs: {path_text}")
+
+    def _http_stats(self):
+        return dict(self.http.stats) if self.http is not None else None
+
+    def _add_http_stats(self, stage, http_stats):
+        if http_stats is None:
+            return
+        current_stats = self._http_stats()
+        stage.add(**{counter_name: current_stats[stats_name] - http_stats[stats_name]
+                     for stats_name, counter_name in HTTP_COUNTERS.items()})
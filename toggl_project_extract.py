@@ -1,13 +1,14 @@
-from datetime import date, datetime, timedelta
 import json
 from os import environ
 from os.path import join
-import sqlite3
 
 import pandas as pd
 
 from toggl.api_client import TogglClientApi
 
+from toggl_landing import LandingZone
+from toggl_sqlite import SQLITE_FILE, connect_sqlite, upsert_rows
+
 with open(join(environ["HOME"], "repos/toggl_api/config.json")) as json_data_file:
     data = json.load(json_data_file)
 
@@ -17,6 +18,10 @@ client = TogglClientApi(settings)
 
 projects_data = client.get_projects().json()
 
+# keep a snapshot of the raw projects data in the parquet landing zone if landing_dir is set in the toggl_config
+if settings.get("landing_dir"):
+    LandingZone(settings["landing_dir"]).write_projects(projects_data)
+
 projects_df = pd.DataFrame(projects_data)
 
 # data cleanup
@@ -26,6 +31,8 @@ convert_to_string = ["billable", "is_private", "active", "template", "auto_estim
 for col in convert_to_string:
     projects_df[col] = projects_df[col].astype(str)
 
-conn = sqlite3.connect(join(environ["HOME"], "repos/toggl_api/togg_api.sqlite"))
+# the toggl_projects table of the database toggl_data_extract.py reads the project ids from
+conn = connect_sqlite(SQLITE_FILE)
 
-projects_df.to_sql("toggl_projects", conn, if_exists="replace", index=False)
+# only new and changed projects are written - replacing the table would drop its primary key
+upsert_rows(conn, "toggl_projects", projects_df)
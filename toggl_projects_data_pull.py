@@ -1,29 +1,93 @@
-from os import environ
-from os.path import join
-import sqlite3
+import argparse
 
 import pandas as pd
 
 import toggl_extract as te
+from toggl_landing import LandingZone
+from toggl_sqlite import SQLITE_FILE, connect_sqlite, upsert_rows
 
-# connect to ToggleApi class
-toggl_client = te.TogglApi()
+DESCRIPTION = "Pull toggl projects into the toggl_projects table in sqlite"
 
-# pull toggl projects data from api
-projects_data_list = toggl_client.get_toggl_projects()
 
-# put toggle projects data into dataframe
-projects_df = pd.DataFrame(projects_data_list)
+def add_arguments(parser):
+    """Add the command line arguments of the pipeline to an argument parser
 
-# data cleanup
-projects_df["at"] = pd.to_datetime(projects_df["at"])
-projects_df["created_at"] = pd.to_datetime(projects_df["created_at"])
-convert_to_string = ["billable", "is_private", "active", "template", "auto_estimates"]
-for col in convert_to_string:
-    projects_df[col] = projects_df[col].astype(str)
+    Args:
+        parser (ArgumentParser object): Parser of the pipeline or of its toggl_cli.py subcommand
 
-# connect to sqlite database
-conn = sqlite3.connect(join(environ["HOME"], "repos/toggl_api/toggl_api.sqlite"))
+    Returns:
 
-# push toggl projects data to sqlite database
-projects_df.to_sql("toggl_projects", conn, if_exists="replace", index=False)
+    """
+    parser.add_argument("--config-file", default=None, help="Full path to the config json file")
+    parser.add_argument("--sqlite-file", default=SQLITE_FILE, help="Full path to the sqlite database file")
+
+
+def clean_projects(projects_data_list):
+    """Clean the projects data of the api for the toggl_projects table
+
+    Args:
+        projects_data_list (list): List of dictionaries containing projects data
+
+    Returns:
+        projects_df (Pandas DataFrame object): Pandas DataFrame of the cleaned projects
+
+    """
+    projects_df = pd.DataFrame(projects_data_list)
+
+    # data cleanup
+    projects_df["at"] = pd.to_datetime(projects_df["at"])
+    projects_df["created_at"] = pd.to_datetime(projects_df["created_at"])
+    convert_to_string = ["billable", "is_private", "active", "template", "auto_estimates"]
+    for col in convert_to_string:
+        projects_df[col] = projects_df[col].astype(str)
+    return projects_df
+
+
+def run(args):
+    """Pull the toggl projects into the toggl_projects table
+
+    Args:
+        args (Namespace object): Parsed command line arguments, see add_arguments
+
+    Returns:
+        row_count (int): Number of projects added or updated
+
+    """
+    # connect to ToggleApi class
+    toggl_client = te.TogglApi(config_file=args.config_file)
+
+    # pull toggl projects data from api
+    projects_data_list = toggl_client.get_toggl_projects()
+
+    # keep a snapshot of the raw projects data in the parquet landing zone if landing_dir is set in the toggl_config
+    if toggl_client.settings.get("landing_dir"):
+        LandingZone(toggl_client.settings["landing_dir"]).write_projects(projects_data_list)
+
+    # put toggle projects data into dataframe and clean it up
+    projects_df = clean_projects(projects_data_list)
+
+    # connect to sqlite database - creates the toggl_projects table if it is missing
+    conn = connect_sqlite(args.sqlite_file)
+
+    # push toggl projects data to sqlite database - only new and changed projects are written
+    row_count = upsert_rows(conn, "toggl_projects", projects_df)
+    print(f"Added or updated {row_count} rows in toggl_projects table")
+    return row_count
+
+
+def main(argv=None):
+    """Run the pipeline from the command line
+
+    Args:
+        argv (list, optional): Command line arguments, defaults to sys.argv
+
+    Returns:
+
+    """
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
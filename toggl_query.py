@@ -0,0 +1,401 @@
+from datetime import date, timedelta
+import json
+from os import environ, getpid, replace
+from os.path import exists, getmtime, join
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from toggl_config import locked_file
+from toggl_landing import LandingZone
+
+# default location of the query cache file
+QUERY_CACHE_FILE = join(environ["HOME"], "repos/toggl_api/query_cache.json")
+
+# dimensions the totals can be grouped by
+DIMENSIONS = ["project", "user", "task", "tag"]
+
+# postgres queries of the per day totals of each dimension, of the workspace :workspace_id or of every workspace if it
+# is NULL. Project, user and tag totals come from the daily rollup tables, task totals from toggl_entry using the
+# start_date index
+POSTGRES_DAY_TOTALS_SQL = {
+    "project": """
+        SELECT r.day, p.project_name AS name, SUM(r.duration_secs) AS secs, SUM(r.entry_count) AS entry_count
+        FROM toggl_daily_project_user r LEFT JOIN toggl_project p ON p.id = r.toggl_project_id
+        WHERE r.day BETWEEN :start_date AND :end_date
+          AND (CAST(:workspace_id AS bigint) IS NULL OR r.workspace_id = :workspace_id)
+        GROUP BY r.day, p.project_name""",
+    "user": """
+        SELECT r.day, u.name AS name, SUM(r.duration_secs) AS secs, SUM(r.entry_count) AS entry_count
+        FROM toggl_daily_project_user r LEFT JOIN toggl_user u ON u.id = r.toggl_user_id
+        WHERE r.day BETWEEN :start_date AND :end_date
+          AND (CAST(:workspace_id AS bigint) IS NULL OR r.workspace_id = :workspace_id)
+        GROUP BY r.day, u.name""",
+    "tag": """
+        SELECT r.day, t.tag_name AS name, SUM(r.duration_secs) AS secs, SUM(r.entry_count) AS entry_count
+        FROM toggl_daily_tag r LEFT JOIN toggl_tag t ON t.id = r.toggl_tag_id
+        WHERE r.day BETWEEN :start_date AND :end_date
+          AND (CAST(:workspace_id AS bigint) IS NULL OR r.workspace_id = :workspace_id)
+        GROUP BY r.day, t.tag_name""",
+    "task": """
+        SELECT CAST(e.start_date AS date) AS day, t.task_name AS name,
+               COALESCE(SUM(EXTRACT(EPOCH FROM e.end_date - e.start_date)), 0) AS secs, COUNT(*) AS entry_count
+        FROM toggl_entry e LEFT JOIN toggl_task t ON t.id = e.toggl_task_id
+        WHERE e.start_date >= :start_date AND e.start_date < CAST(:end_date AS date) + 1
+          AND (CAST(:workspace_id AS bigint) IS NULL OR e.workspace_id = :workspace_id)
+        GROUP BY CAST(e.start_date AS date), t.task_name""",
+}
+
+# key of the query cache file holding the invalidation generation of the days dropped by syncs - store keys always
+# start with the store type
+INVALIDATED_KEY = "_invalidated"
+
+# missing days at most this many days apart are computed with one store query
+MAX_GAP_DAYS = 31
+
+# columns of the raw entries holding the name of each dimension, in the sqlite toggl_data table and landing zone
+ENTRY_NAME_COLUMNS = {"project": "project", "user": "user", "task": "description", "tag": "tags"}
+
+
+class PostgresStore():
+    def __init__(self, engine, workspace_id=None):
+        """Totals over the postgres toggl_* tables and daily rollup tables loaded by toggl_relational_extract.py
+
+        Args:
+            engine (SQLAlchemy engine object): SQLAlchemy engine object
+            workspace_id (int, optional): Only total the entries of this workspace. Projects, tasks and tags of the
+                same name in several workspaces are summed together if not given
+
+        Returns:
+
+        """
+        self.engine = engine
+        self.workspace_id = None if workspace_id is None else int(workspace_id)
+        self.key = f"postgres:{engine.url.host or ''}/{engine.url.database}"
+        if self.workspace_id is not None:
+            self.key += f":{self.workspace_id}"
+
+    def day_totals(self, dimension, start_date, end_date):
+        """Get the totals per day and name of a dimension, see TimeQuery.totals"""
+        with self.engine.connect() as conn:
+            day_totals_df = pd.read_sql(text(POSTGRES_DAY_TOTALS_SQL[dimension]), conn,
+                                        params={"start_date": start_date, "end_date": end_date,
+                                                "workspace_id": self.workspace_id})
+        day_totals_df["day"] = pd.to_datetime(day_totals_df["day"]).dt.strftime("%Y-%m-%d")
+        day_totals_df["name"] = day_totals_df["name"].fillna("").astype(str)
+        return day_totals_df
+
+
+class SqliteStore():
+    def __init__(self, conn, db_file):
+        """Totals over the sqlite toggl_data table loaded by toggl_data_pull.py
+
+        Args:
+            conn (sqlite3 connection object): Open connection
+            db_file (str): Full path to the sqlite database file, to tell stores apart in the cache
+
+        Returns:
+
+        """
+        self.conn = conn
+        self.key = f"sqlite:{db_file}"
+
+    def day_totals(self, dimension, start_date, end_date):
+        """Get the totals per day and name of a dimension, see TimeQuery.totals"""
+        name_column = ENTRY_NAME_COLUMNS[dimension]
+        # start is stored as UTC text, so a text range selects the days
+        entry_df = pd.read_sql(f'SELECT "start", "end", "{name_column}" FROM toggl_data '
+                               f'WHERE "start" >= ? AND "start" < ?;', self.conn,
+                               params=[start_date.isoformat(), (end_date + timedelta(days=1)).isoformat()])
+        if dimension == "tag":
+            # tags are stored as one comma separated string per entry
+            entry_df[name_column] = entry_df[name_column].str.split(", ")
+        return group_day_totals(entry_df, name_column)
+
+
+class LandingStore():
+    def __init__(self, landing_dir):
+        """Totals over the parquet landing zone written by toggl_data_pull.py
+
+        Args:
+            landing_dir (str): Full path to the landing zone directory
+
+        Returns:
+
+        """
+        self.landing_zone = LandingZone(landing_dir)
+        self.key = f"landing:{landing_dir}"
+
+    def day_totals(self, dimension, start_date, end_date):
+        """Get the totals per day and name of a dimension, see TimeQuery.totals"""
+        name_column = ENTRY_NAME_COLUMNS[dimension]
+        # only the partitions of the months in the date range are read
+        entry_df = self.landing_zone.read_entries(columns=["start", "end", name_column],
+                                                  start_month=start_date.strftime("%Y-%m"),
+                                                  end_month=end_date.strftime("%Y-%m"))
+        start_series = pd.to_datetime(entry_df["start"], utc=True)
+        day_series = start_series.dt.strftime("%Y-%m-%d")
+        entry_df = entry_df[(day_series >= start_date.isoformat()) & (day_series <= end_date.isoformat())]
+        return group_day_totals(entry_df, name_column)
+
+
+class QueryCache():
+    def __init__(self, cache_file=None):
+        """Per day totals of each store and dimension, kept in a json file so every process shares them. A query
+        only computes the days missing from the cache, and a sync only drops the days it changed. Every sync that
+        drops days counts up a generation and records it for those days, so a query that read the store before the
+        sync does not write its stale totals of those days back. The file looks like:
+            {
+                "postgres:localhost/toggl": {
+                    "project": {
+                        "2020-06-30": {"Project name": [3600.0, 2]}
+                    }
+                },
+                "_invalidated": {
+                    "generation": 3,
+                    "cleared": 1,
+                    "days": {"2020-07-01": 3}
+                }
+            }
+
+        Args:
+            cache_file (str, optional): Full path to the query cache json file
+
+        Returns:
+
+        """
+        self.cache_file = cache_file or QUERY_CACHE_FILE
+        self.data = {}
+        self.file_mtime = None
+        self._load()
+
+    def get(self, store_key, dimension, day_list):
+        """Get the cached totals of days
+
+        Args:
+            store_key (str): Key of the store, for example PostgresStore.key
+            dimension (str): Dimension, one of DIMENSIONS
+            day_list (list): ISO formatted days
+
+        Returns:
+            day_totals_dict (dict): Day -> {name: [secs, entry_count]} for the cached days
+            missing_day_list (list): Days not in the cache
+            generation (int): Invalidation generation of the cache when it was read, to pass to put once the missing
+                days are computed
+
+        """
+        self._load()
+        dimension_cache = self.data.get(store_key, {}).get(dimension, {})
+        day_totals_dict = {day: dimension_cache[day] for day in day_list if day in dimension_cache}
+        generation = self.data.get(INVALIDATED_KEY, {}).get("generation", 0)
+        return day_totals_dict, [day for day in day_list if day not in dimension_cache], generation
+
+    def put(self, store_key, dimension, day_totals_dict, generation):
+        """Add the totals of days and save the cache file. Days a sync dropped since get read the cache are left
+        out, their totals may be stale.
+
+        Args:
+            store_key (str): Key of the store
+            dimension (str): Dimension, one of DIMENSIONS
+            day_totals_dict (dict): Day -> {name: [secs, entry_count]}
+            generation (int): Invalidation generation returned by get before the store was read
+
+        Returns:
+
+        """
+        # syncs and queries of other processes change the same file - hold the lock from reading it to replacing it
+        with locked_file(self.cache_file):
+            self._load()
+            invalidated = self.data.get(INVALIDATED_KEY, {})
+            invalidated_dict = invalidated.get("days", {})
+            cleared_generation = invalidated.get("cleared", 0)
+            day_totals_dict = {day: totals for day, totals in day_totals_dict.items()
+                               if max(invalidated_dict.get(day, 0), cleared_generation) <= generation}
+            if day_totals_dict:
+                self.data.setdefault(store_key, {}).setdefault(dimension, {}).update(day_totals_dict)
+                self._save()
+
+    def invalidate(self, days):
+        """Drop the cached totals of days whose entries changed, in every store and dimension
+
+        Args:
+            days (iterable): Dates or ISO formatted days
+
+        Returns:
+            day_count (int): Number of cached days dropped
+
+        """
+        day_set = {day if isinstance(day, str) else day.isoformat() for day in days}
+        if not day_set:
+            return 0
+        with locked_file(self.cache_file):
+            self._load()
+            day_count = 0
+            for store_key, store_cache in self.data.items():
+                if store_key == INVALIDATED_KEY:
+                    continue
+                for dimension_cache in store_cache.values():
+                    for day in day_set & set(dimension_cache):
+                        del dimension_cache[day]
+                        day_count += 1
+            # queries that read the store before now must not put their totals of these days back
+            invalidated = self._next_generation()
+            invalidated.setdefault("days", {}).update((day, invalidated["generation"]) for day in day_set)
+            self._save()
+        return day_count
+
+    def clear(self):
+        """Drop every cached total"""
+        with locked_file(self.cache_file):
+            self._load()
+            # queries that read the store before now must not put any of their totals back
+            invalidated = self._next_generation()
+            invalidated["cleared"] = invalidated["generation"]
+            self.data = {INVALIDATED_KEY: invalidated}
+            self._save()
+
+    def _next_generation(self):
+        """Count up the invalidation generation, call with the cache file locked
+
+        Args:
+
+        Returns:
+            invalidated (dict): Invalidation state of the cache with the new generation
+
+        """
+        invalidated = self.data.setdefault(INVALIDATED_KEY, {})
+        invalidated["generation"] = invalidated.get("generation", 0) + 1
+        return invalidated
+
+    def _load(self):
+        """Read the cache file if it changed since it was last read"""
+        if not exists(self.cache_file):
+            return
+        file_mtime = getmtime(self.cache_file)
+        if file_mtime == self.file_mtime:
+            return
+        with open(self.cache_file) as json_data_file:
+            self.data = json.load(json_data_file)
+        self.file_mtime = file_mtime
+
+    def _save(self):
+        """Write the cache file through a temp file of the process, so readers never see a half written file"""
+        temp_file = f"{self.cache_file}.{getpid()}.tmp"
+        with open(temp_file, "w") as json_data_file:
+            json.dump(self.data, json_data_file)
+        replace(temp_file, self.cache_file)
+        self.file_mtime = getmtime(self.cache_file)
+
+
+class TimeQuery():
+    def __init__(self, store, cache=None):
+        """Time totals per project, user, task or tag over a date range
+
+        Args:
+            store (PostgresStore, SqliteStore or LandingStore object): Store to compute the totals from
+            cache (QueryCache object, optional): Cache of the per day totals, no caching if not given
+
+        Returns:
+
+        """
+        self.store = store
+        self.cache = cache
+        # days read from the cache and computed from the store by the last query
+        self.stats = {"cached_days": 0, "computed_days": 0}
+
+    def totals(self, dimension, start_date, end_date):
+        """Get the time tracked per name of a dimension. Entries count towards the day (UTC) they start on.
+
+        Args:
+            dimension (str): Dimension to group by, one of DIMENSIONS
+            start_date (date): First day of the date range
+            end_date (date): Last day of the date range
+
+        Returns:
+            totals_df (Pandas DataFrame object): Pandas DataFrame with name, hours and entry_count columns, most
+                hours first. Entries without a project, user or task have an empty name, entries without tags are
+                left out of the tag totals
+
+        """
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension {dimension}, expected one of {', '.join(DIMENSIONS)}")
+        day_list = [(start_date + timedelta(days=i)).isoformat() for i in range((end_date - start_date).days + 1)]
+
+        if self.cache is not None:
+            day_totals_dict, missing_day_list, generation = self.cache.get(self.store.key, dimension, day_list)
+        else:
+            day_totals_dict, missing_day_list = {}, day_list
+
+        # compute the missing days with one store query per run of nearby days
+        computed_dict = {}
+        for run_start, run_end in _day_runs(missing_day_list):
+            day_totals_df = self.store.day_totals(dimension, date.fromisoformat(run_start),
+                                                  date.fromisoformat(run_end))
+            # days without entries are cached too - the cached days between the missing days of the run are skipped
+            run_dict = {day: {} for day in missing_day_list if run_start <= day <= run_end}
+            for day, name, secs, entry_count in zip(day_totals_df["day"], day_totals_df["name"],
+                                                    day_totals_df["secs"], day_totals_df["entry_count"]):
+                if day in run_dict:
+                    run_dict[day][name] = [float(secs), int(entry_count)]
+            computed_dict.update(run_dict)
+        if computed_dict and self.cache is not None:
+            self.cache.put(self.store.key, dimension, computed_dict, generation)
+        day_totals_dict.update(computed_dict)
+        self.stats = {"cached_days": len(day_list) - len(missing_day_list), "computed_days": len(missing_day_list)}
+
+        row_list = [(name, secs, entry_count) for name_dict in day_totals_dict.values()
+                    for name, (secs, entry_count) in name_dict.items()]
+        totals_df = pd.DataFrame(row_list, columns=["name", "secs", "entry_count"])
+        # named aggregations keep the columns when no entries were tracked in the date range
+        totals_df = totals_df.groupby("name", as_index=False).agg(secs=("secs", "sum"),
+                                                                  entry_count=("entry_count", "sum"))
+        totals_df["hours"] = totals_df["secs"] / 3600
+        totals_df = totals_df.sort_values(["hours", "name"], ascending=[False, True]).reset_index(drop=True)
+        return totals_df[["name", "hours", "entry_count"]]
+
+
+def group_day_totals(entry_df, name_column):
+    """Group raw entries into totals per day and name with one vectorized group by
+
+    Args:
+        entry_df (Pandas DataFrame object): Pandas DataFrame with start, end and name_column columns. A name column
+            holding lists, like the tags, counts the entry once per name and leaves out entries without names
+        name_column (str): Name of the column to group by
+
+    Returns:
+        day_totals_df (Pandas DataFrame object): Pandas DataFrame with day, name, secs and entry_count columns
+
+    """
+    start_series = pd.to_datetime(entry_df["start"], utc=True)
+    day_totals_df = pd.DataFrame({
+        "day": start_series.dt.strftime("%Y-%m-%d"),
+        "name": entry_df[name_column],
+        "secs": (pd.to_datetime(entry_df["end"], utc=True) - start_series).dt.total_seconds().fillna(0),
+    })
+    if day_totals_df["name"].map(lambda name: isinstance(name, (list, np.ndarray))).any():
+        day_totals_df = day_totals_df.explode("name")
+        day_totals_df = day_totals_df[day_totals_df["name"].notnull()]
+    day_totals_df["name"] = day_totals_df["name"].fillna("").astype(str)
+    return (day_totals_df.groupby(["day", "name"], as_index=False)
+            .agg(secs=("secs", "sum"), entry_count=("secs", "size")))
+
+
+def _day_runs(day_list, max_gap_days=MAX_GAP_DAYS):
+    """Split sorted ISO formatted days into runs of days at most max_gap_days apart
+
+    Args:
+        day_list (list): Sorted ISO formatted days
+        max_gap_days (int, optional): Most days between two days of the same run
+
+    Returns:
+        run_list (list): List of (first day, last day) tuples
+
+    """
+    run_list = []
+    for day in day_list:
+        if run_list and (date.fromisoformat(day) - date.fromisoformat(run_list[-1][1])).days <= max_gap_days:
+            run_list[-1] = (run_list[-1][0], day)
+        else:
+            run_list.append((day, day))
+    return run_list
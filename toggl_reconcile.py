@@ -0,0 +1,283 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from hashlib import sha1
+
+import pandas as pd
+from sqlalchemy import text
+
+# ways to find the partitions that differ from the api. "summary" pulls one summary report per month for the whole
+# workspace and compares the time of each project. "probe" also pulls the first detailed report page of every
+# (project, month) with entries, comparing entry counts and, for partitions that fit on the page, the entry ids and
+# latest updated timestamp
+RECONCILE_METHODS = ["summary", "probe"]
+
+# days added before and after a month when it is pulled again, so entries near the month boundary are pulled
+# whatever the timezone of the api user
+REFETCH_MARGIN_DAYS = 1
+
+
+def month_list(date_range_list):
+    """Split date ranges into calendar months
+
+    Args:
+        date_range_list (list): Nested list of date ranges, for example:
+            [[datetime.date(2019, 1, 1), datetime.date(2019, 12, 31)]]
+
+    Returns:
+        month_list (list): Nested list of [first day, last day] of every month the date ranges touch, in date order
+
+    """
+    month_set = set()
+    for start_date, end_date in date_range_list:
+        month_start_date = start_date.replace(day=1)
+        while month_start_date <= end_date:
+            month_set.add(month_start_date)
+            month_start_date = (month_start_date + timedelta(days=32)).replace(day=1)
+    return [[month_start_date, (month_start_date + timedelta(days=32)).replace(day=1) - timedelta(days=1)]
+            for month_start_date in sorted(month_set)]
+
+
+def postgres_entry_frame(engine, workspace_id=None):
+    """Read the columns the digests are built from out of the postgres toggl_entry table
+
+    Args:
+        engine (SQLAlchemy engine or connection object): SQLAlchemy engine, or an open connection to read inside its
+            transaction
+        workspace_id (int, optional): Only read the entries of this workspace, defaults to every workspace
+
+    Returns:
+        entry_df (Pandas DataFrame object): Pandas DataFrame with id, pid, start, duration_secs and updated columns
+
+    """
+    return pd.read_sql(text("SELECT id, toggl_project_id AS pid, start_date AS start, "
+                            "EXTRACT(EPOCH FROM end_date - start_date) AS duration_secs, update_date AS updated "
+                            "FROM toggl_entry "
+                            "WHERE CAST(:workspace_id AS bigint) IS NULL OR workspace_id = :workspace_id;"),
+                       engine, params={"workspace_id": workspace_id})
+
+
+def sqlite_entry_frame(conn):
+    """Read the columns the digests are built from out of the sqlite toggl_data table
+
+    Args:
+        conn (sqlite3 connection object): Open connection
+
+    Returns:
+        entry_df (Pandas DataFrame object): Pandas DataFrame with id, pid, start, duration_secs and updated columns
+
+    """
+    return pd.read_sql('SELECT id, pid, "start", dur_secs AS duration_secs, updated FROM toggl_data;', conn)
+
+
+def entry_months(entry_df, timezone):
+    """Find the month each stored entry counts towards in the reports of the api user
+
+    Args:
+        entry_df (Pandas DataFrame object): Pandas DataFrame with a start column in UTC
+        timezone (str): Timezone of the api user, for example "Europe/Berlin"
+
+    Returns:
+        month_series (Pandas Series object): First day of the month of every entry, as an ISO formatted string
+
+    """
+    start_series = pd.to_datetime(entry_df["start"], utc=True).dt.tz_convert(timezone)
+    return start_series.dt.strftime("%Y-%m-01")
+
+
+def local_digests(entry_df, timezone):
+    """Build the digest of every (project, month) partition of the stored entries
+
+    Args:
+        entry_df (Pandas DataFrame object): Pandas DataFrame with id, pid, start, duration_secs and updated columns
+        timezone (str): Timezone of the api user, for example "Europe/Berlin"
+
+    Returns:
+        digest_dict (dict): (project id, first day of the month) -> dict with entry_count, duration_secs,
+            max_updated and ids_hash
+
+    """
+    digest_df = pd.DataFrame({"pid": entry_df["pid"], "month": entry_months(entry_df, timezone),
+                              "id": entry_df["id"].astype("int64"),
+                              "duration_secs": entry_df["duration_secs"].fillna(0).round().astype("int64"),
+                              "updated": pd.to_datetime(entry_df["updated"], utc=True)})
+    digest_dict = {}
+    for (project, month), partition_df in digest_df.dropna(subset=["pid"]).groupby(["pid", "month"], sort=False):
+        digest_dict[(int(project), month)] = {
+            "entry_count": len(partition_df),
+            "duration_secs": int(partition_df["duration_secs"].sum()),
+            "max_updated": partition_df["updated"].max().isoformat(),
+            "ids_hash": ids_hash(partition_df["id"]),
+        }
+    return digest_dict
+
+
+def summary_digests(toggl_client, month_date_range_list):
+    """Build the digest of every (project, month) partition from the summary reports of the api, one request per
+    month for the whole workspace
+
+    Args:
+        toggl_client (TogglApi object): Toggl api client
+        month_date_range_list (list): Nested list of [first day, last day] of the months, see month_list
+
+    Returns:
+        digest_dict (dict): (project id, first day of the month) -> dict with duration_secs
+
+    """
+    def get_month(month_date_range):
+        return month_date_range[0].isoformat(), toggl_client.get_toggl_summary(month_date_range)
+
+    digest_dict = {}
+    with ThreadPoolExecutor(max_workers=toggl_client.max_workers) as executor:
+        for month, data in executor.map(get_month, month_date_range_list):
+            for project_data in data["data"]:
+                # entries without a project are never pulled. Projects whose entries add up to no time, for example
+                # only running entries, still have a partition
+                if project_data.get("id") is not None:
+                    digest_dict[(project_data["id"], month)] = {
+                        "duration_secs": round((project_data.get("time") or 0) / 1000)}
+    return digest_dict
+
+
+def probe_digests(toggl_client, partition_list):
+    """Build the digest of (project, month) partitions from the first detailed report page of each. Partitions
+    that fit on the first page get every digest field, bigger ones only the entry count and duration.
+
+    Args:
+        toggl_client (TogglApi object): Toggl api client
+        partition_list (list): List of (project id, first day of the month) tuples
+
+    Returns:
+        digest_dict (dict): (project id, first day of the month) -> dict with entry_count and duration_secs, and
+            max_updated and ids_hash for the partitions that fit on one page
+
+    """
+    def probe(partition):
+        project, month = partition
+        month_date_range = month_list([[date.fromisoformat(month)] * 2])[0]
+        return partition, toggl_client.get_toggl_log_page(project, month_date_range, 1)
+
+    digest_dict = {}
+    with ThreadPoolExecutor(max_workers=toggl_client.max_workers) as executor:
+        for partition, data in executor.map(probe, partition_list):
+            entry_count = data.get("total_count", len(data["data"]))
+            if not entry_count:
+                continue
+            digest = {"entry_count": entry_count}
+            if data.get("total_grand") is not None:
+                digest["duration_secs"] = round(data["total_grand"] / 1000)
+            if entry_count == len(data["data"]):
+                digest["max_updated"] = pd.to_datetime([entry["updated"] for entry in data["data"]],
+                                                       utc=True).max().isoformat()
+                digest["ids_hash"] = ids_hash([entry["id"] for entry in data["data"]])
+            digest_dict[partition] = digest
+    return digest_dict
+
+
+def changed_partitions(local_digest_dict, remote_digest_dict):
+    """Compare the stored digests with the digests from the api. A partition differs if it is only on one side or
+    any digest field both sides have differs.
+
+    Args:
+        local_digest_dict (dict): Digests of the stored entries, see local_digests
+        remote_digest_dict (dict): Digests from the api, see summary_digests and probe_digests
+
+    Returns:
+        partition_list (list): Sorted list of (project id, first day of the month) tuples to pull again
+
+    """
+    partition_list = []
+    for partition in set(local_digest_dict) | set(remote_digest_dict):
+        local_digest = local_digest_dict.get(partition)
+        remote_digest = remote_digest_dict.get(partition)
+        if local_digest is None or remote_digest is None or any(
+                local_digest[field] != value for field, value in remote_digest.items()):
+            partition_list.append(partition)
+    return sorted(partition_list)
+
+
+def find_changed_partitions(toggl_client, entry_df, date_range_list, method="summary", timezone="UTC"):
+    """Find the (project, month) partitions whose stored entries differ from the api
+
+    Args:
+        toggl_client (TogglApi object): Toggl api client
+        entry_df (Pandas DataFrame object): Stored entries, see postgres_entry_frame and sqlite_entry_frame
+        date_range_list (list): Nested list of date ranges to check, for example build_date_range_list()
+        method (str, optional): One of RECONCILE_METHODS
+        timezone (str, optional): Timezone of the api user, the api splits months in this timezone
+
+    Returns:
+        partition_list (list): Sorted list of (project id, first day of the month) tuples to pull again
+
+    """
+    month_date_range_list = month_list(date_range_list)
+    month_set = {month_start_date.isoformat() for month_start_date, _ in month_date_range_list}
+    local_digest_dict = {partition: digest for partition, digest in local_digests(entry_df, timezone).items()
+                         if partition[1] in month_set}
+    remote_digest_dict = summary_digests(toggl_client, month_date_range_list)
+    print(f"Compared {len(local_digest_dict)} stored partitions with {len(month_date_range_list)} monthly summaries")
+
+    if method == "probe":
+        # partitions whose time matches can still have added, deleted or edited entries - probe every partition
+        # with entries on either side
+        probe_list = sorted(set(local_digest_dict) | set(remote_digest_dict))
+        probe_digest_dict = probe_digests(toggl_client, probe_list)
+        print(f"Probed {len(probe_list)} partitions")
+        # the summary time is kept for the partitions the probe has no duration for
+        for partition, digest in remote_digest_dict.items():
+            probe_digest_dict.setdefault(partition, {}).setdefault("duration_secs", digest["duration_secs"])
+        remote_digest_dict = probe_digest_dict
+    return changed_partitions(local_digest_dict, remote_digest_dict)
+
+
+def refetch_work_list(partition_list):
+    """Build the work list that pulls changed partitions again
+
+    Args:
+        partition_list (list): List of (project id, first day of the month) tuples
+
+    Returns:
+        work_list (list): List of (project_id, date_range_list) tuples, each month with REFETCH_MARGIN_DAYS before
+            and after
+
+    """
+    work_list = []
+    for project, month in partition_list:
+        month_start_date, month_end_date = month_list([[date.fromisoformat(month)] * 2])[0]
+        work_list.append((project, [month_start_date - timedelta(days=REFETCH_MARGIN_DAYS),
+                                    month_end_date + timedelta(days=REFETCH_MARGIN_DAYS)]))
+    return work_list
+
+
+def stale_entry_ids(entry_df, partition_list, pulled_id_set, timezone="UTC"):
+    """Find the stored entries of pulled partitions that the api did not return any more - deleted in toggl
+
+    Args:
+        entry_df (Pandas DataFrame object): Stored entries before the partitions were pulled again
+        partition_list (list): List of (project id, first day of the month) tuples that were pulled again
+        pulled_id_set (set): Ids of every entry the pull returned, an entry moved to another project is kept
+        timezone (str, optional): Timezone of the api user
+
+    Returns:
+        entry_id_list (list): Ids of the entries to delete
+
+    """
+    partition_set = set(partition_list)
+    in_partition_series = pd.Series([(int(project), month) in partition_set if pd.notnull(project) else False
+                                     for project, month in zip(entry_df["pid"], entry_months(entry_df, timezone))],
+                                    index=entry_df.index, dtype=bool)
+    id_series = entry_df["id"][in_partition_series].astype("int64")
+    return [int(entry_id) for entry_id in id_series if entry_id not in pulled_id_set]
+
+
+def ids_hash(entry_ids):
+    """Hash a set of entry ids, in any order
+
+    Args:
+        entry_ids (iterable): Entry ids
+
+    Returns:
+        ids_hash (str): Hex digest of the sorted ids
+
+    """
+    return sha1(",".join(str(entry_id) for entry_id in sorted(int(entry_id) for entry_id in entry_ids)).encode()
+                ).hexdigest()
@@ -1,72 +1,167 @@
-from datetime import date, datetime, timedelta
-import json
-from os import environ
-from os.path import join
+import argparse
+from threading import Lock
 
-import numpy as np
 import pandas as pd
-import psycopg2
-import pytz
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 
+from toggl_config import load_config, select_workspace, workspace_file
+from toggl_dimension_cache import DimensionCache, MAX_CACHE_ENTRIES
 import toggl_extract as te
+from toggl_landing import LandingZone
+from toggl_load import COPY_CHUNK_SIZE, begin, defer_foreign_keys, sync_id_sequence, upsert_data_to_table
+from toggl_metrics import RunMetrics
+from toggl_query import QueryCache
+from toggl_reconcile import (RECONCILE_METHODS, find_changed_partitions, postgres_entry_frame, refetch_work_list,
+                             stale_entry_ids)
+from toggl_rollup import create_rollup_tables, entry_days, rebuild_daily_rollups, refresh_daily_rollups
+from toggl_scheduler import DEFAULT_STAGE_WORKERS, StageGraph
+from toggl_sync_state import SyncState, build_date_range_list
+from toggl_transform import (ENTRY_CHUNK_SIZE, compact_entries, convert_columns_to_utc, explode_tags,
+                             fill_missing_names, iter_page_chunks, memory_bytes)
 
-# Open config file
-with open(join(environ["HOME"], "repos/toggl_api/config.json")) as json_data_file:
-    data = json.load(json_data_file)
+DESCRIPTION = "Pull toggl data and load it into the postgres toggl_* tables"
 
-# Grab the database_config from the json data
-db_settings = data["database_config"]
+# columns of the raw entries the tables are built from, the other columns are dropped before transforming
+RAW_ENTRY_COLUMNS = ["id", "pid", "uid", "user", "description", "start", "end", "updated", "tags"]
 
-# Define user and database from config
-user = db_settings["user"]
-db = db_settings["database"]
-connection = db_settings["connection"]
+# tables a run loads in its one transaction, their foreign keys are checked at commit
+LOADED_TABLES = ["toggl_user", "toggl_project", "toggl_task", "toggl_tag", "toggl_entry", "toggl_entry_tag"]
 
-# Create engine for postgres connection
-engine = create_engine(f"postgresql://{user}@{connection}/{db}")
+# tables with a workspace_id column -> name column unique per workspace. Databases created from an older
+# toggl_data.sql get the column, see create_workspace_columns
+WORKSPACE_TABLES = {"toggl_project": "project_name", "toggl_task": "task_name", "toggl_tag": "tag_name",
+                    "toggl_entry": None}
 
+# columns of the toggl_entry table, in load order
+ENTRY_DATA_COLUMNS = ["id", "workspace_id", "toggl_project_id", "toggl_task_id", "toggl_user_id", "start_date",
+                      "end_date", "update_date"]
+
+
+def add_arguments(parser):
+    """Add the command line arguments of the pipeline to an argument parser
 
-### Start of helper functions
-def duplicate_entry_check(table_name, column_name, engine, dataframe_name, table_columns):
-    """Pull data from table and check against dataframe if the records in the dataframe already exist in the table.
-    If so, filter those out of the dataframe.
-    
     Args:
-        table_name (str): Name of the table
-        column_name (str): Name of the column in the table to pull the records from the table
-        engine (SQLAlchemy engine object): SQLAlchemy engine object
-        dataframe_name (Pandas DataFrame object): Pandas DataFrame object containing the data
-        table_columns (list): List of columns for the final table to re-order the columns in the dataframe
-    
+        parser (ArgumentParser object): Parser of the pipeline or of its toggl_cli.py subcommand
+
     Returns:
-        merged_df (Pandas DataFrame object): Filtered dataframe of non-duplicate records in table
-    
+
     """
-    # Split column name on comma - create list
-    column_name_list = column_name.split(",")
-    # Strip out whitespace from each value in the list
-    column_name_list = [column.strip() for column in column_name_list]
+    parser.add_argument("--config-file", default=None, help="Full path to the config json file")
+    parser.add_argument("--workspace-id", default=None,
+                        help="Workspace of the config to pull, defaults to the first. See toggl_cli.py workspaces to "
+                             "pull every workspace at once")
+    parser.add_argument("--full", action="store_true",
+                        help="Pull every entry since the base year instead of only entries changed since the last "
+                             "sync")
+    parser.add_argument("--state-file", default=None, help="Full path to the sync state json file")
+    parser.add_argument("--lookback-days", type=int, default=7,
+                        help="Number of days before the last synced date to pull again in incremental mode")
+    parser.add_argument("--chunk-size", type=int, default=ENTRY_CHUNK_SIZE,
+                        help="Number of entries transformed and loaded at once")
+    parser.add_argument("--replay", action="store_true",
+                        help="Rebuild from the raw responses in the response cache without calling the api. "
+                             "Implies --full and leaves the sync state untouched")
+    parser.add_argument("--from-landing", action="store_true",
+                        help="Read the projects and entries from the parquet landing zone in landing_dir instead of "
+                             "the api. Leaves the sync state untouched")
+    parser.add_argument("--reconcile", choices=RECONCILE_METHODS, default=None,
+                        help="Compare a digest of every stored (project, month) with the api and pull again only the "
+                             "months that differ, deleting the entries removed in toggl. Leaves the sync state "
+                             "untouched")
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help="Rebuild the daily rollup tables for every day before loading, instead of only "
+                             "refreshing the days the loaded entries start on")
+    parser.add_argument("--stage-workers", type=int, default=None,
+                        help="Number of transform and load stages run at once, overrides stage_workers in the "
+                             "database_config. 1 runs the stages one after another")
+    parser.add_argument("--fetch-mode", choices=te.FETCH_MODES, default=None,
+                        help="Pull the detailed report per project or once for the whole workspace, overrides "
+                             "fetch_mode in the toggl_config")
+    parser.add_argument("--metrics-file", default=None, help="Full path to write the json run report to")
+    parser.add_argument("--prometheus-file", default=None,
+                        help="Full path to write the run metrics to in the prometheus text format")
+
+
+def build_engine(db_settings, pool_size=1):
+    """Create the engine for the postgres connection
 
-    # Query the table table
-    table_df = pd.read_sql(f"SELECT ID AS TABLE_ID, {column_name} FROM {table_name};", engine)
+    Args:
+        db_settings (dict): "database_config" section of the config file
+        pool_size (int, optional): Number of connections kept open - a run loads over one connection
 
-    # Merge the table data to the dataframe
-    merged_df = dataframe_name.merge(right=table_df, on=column_name_list, how="left")
-    
-    # Filter out duplicate rows
-    merged_df = merged_df[merged_df.table_id.isnull()]
-    
-    # Delete the table_id column
-    del merged_df["table_id"]
-    
-    # Re-order columns
-    merged_df = merged_df[table_columns]
-    
-    return merged_df
+    Returns:
+        engine (SQLAlchemy engine object): SQLAlchemy engine object
+
+    """
+    # Define user and database from config
+    user = db_settings["user"]
+    db = db_settings["database"]
+    connection = db_settings["connection"]
+    # the toggl_* tables can live in a schema of their own, "schema" in the database_config
+    connect_args = {"options": f"-csearch_path={db_settings['schema']}"} if db_settings.get("schema") else {}
+    return create_engine(f"postgresql://{user}@{connection}/{db}", pool_size=pool_size, connect_args=connect_args)
+
+
+def create_workspace_columns(engine, workspace_id):
+    """Add the workspace_id column to the WORKSPACE_TABLES of a database created from an older toggl_data.sql. The
+    rows already loaded belong to the workspace given, and the names of projects, tasks and tags become unique per
+    workspace instead of across the tables.
+
+    Args:
+        engine (SQLAlchemy engine object): SQLAlchemy engine object
+        workspace_id (int): Workspace the rows loaded before the column existed were pulled from
 
+    Returns:
+        created (bool): True if the columns had to be added
+
+    """
+    with engine.begin() as conn:
+        # to_regclass resolves the table on the search path, so tables of other schemas are never looked at
+        if conn.execute(text("SELECT EXISTS (SELECT 1 FROM pg_attribute WHERE attrelid = to_regclass('toggl_entry') "
+                             "AND attname = 'workspace_id' AND NOT attisdropped);")).scalar():
+            return False
+        for table_name, column_name in WORKSPACE_TABLES.items():
+            conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS workspace_id bigint;"))
+            conn.execute(text(f"UPDATE {table_name} SET workspace_id = :workspace_id WHERE workspace_id IS NULL;"),
+                         {"workspace_id": workspace_id})
+            if column_name:
+                conn.execute(text(f'ALTER TABLE {table_name} '
+                                  f'DROP CONSTRAINT IF EXISTS "{table_name}_{column_name}_key";'))
+                conn.execute(text(f"ALTER TABLE {table_name} ADD UNIQUE (workspace_id, {column_name});"))
+    print(f"Added the workspace_id column, rows loaded so far belong to workspace {workspace_id}")
+    return True
+
+
+def prepare_schema(engine, workspace_id, query_cache, rebuild_rollups=False):
+    """Bring a database created from an older toggl_data.sql up to date, before any run loads into it. Runs of
+    several workspaces at once prepare the schema once, see toggl_workspaces.py.
 
-def foreign_key_grab(table_name, column_name, engine, dataframe_name, foreign_key_name):
+    Args:
+        engine (SQLAlchemy engine object): SQLAlchemy engine object
+        workspace_id (int): Workspace the rows loaded before the workspace_id column existed were pulled from
+        query_cache (QueryCache object): Per day query totals, cleared if the rollup tables are rebuilt
+        rebuild_rollups (bool, optional): Rebuild the daily rollup tables for every day
+
+    Returns:
+
+    """
+    create_workspace_columns(engine, workspace_id)
+    with engine.begin() as conn:
+        # new task and tag ids come from the id sequences, past the ids older versions assigned themselves
+        for table_name in ["toggl_task", "toggl_tag"]:
+            sync_id_sequence(conn, table_name)
+        # foreign keys of older databases are made deferrable
+        defer_foreign_keys(conn, LOADED_TABLES)
+
+    # Daily rollup tables - created and filled from the loaded entries for databases that predate them, then only
+    # the days touched by each chunk are refreshed
+    if create_rollup_tables(engine) or rebuild_rollups:
+        rebuild_daily_rollups(engine)
+        query_cache.clear()
+
+
+def foreign_key_grab(table_name, column_name, engine, dataframe_name, foreign_key_name, dimension_cache=None,
+                     conn=None):
     """Grab the foreign key value from the reference table
     
     Args:
@@ -75,13 +170,28 @@ def foreign_key_grab(table_name, column_name, engine, dataframe_name, foreign_ke
         engine (SQLAlchemy engine object): SQLAlchemy engine object
         dataframe_name (Pandas DataFrame object): Pandas DataFrame object containing the data
         foreign_key_name (str): Name of the column in the table which is the foreign key
+        dimension_cache (DimensionCache object, optional): Cache of name -> id maps. If given, the foreign keys
+            are looked up in the cache instead of reading the whole table
+        conn (SQLAlchemy connection object, optional): Open connection to read with, so the rows the transaction of
+            the run loaded are seen before it commits
     
     Returns:
         merge_df (Pandas DataFrame object): Pandas DataFrame object containing the foreign key
     """
-    
-    # Query the table
-    table_data_df = pd.read_sql(f"SELECT ID AS TABLE_ID, {column_name} FROM {table_name};", engine)
+    if dimension_cache is not None:
+        # Look up the ids of the distinct names in the cache
+        id_dict = dimension_cache.lookup(table_name, dataframe_name[column_name].dropna().unique().tolist(),
+                                         conn=conn)
+        merged_df = dataframe_name.copy()
+        # names missing from the table map to NA - ids stay integers, also for categorical name columns
+        merged_df[foreign_key_name] = merged_df[column_name].map(id_dict).astype("Int64")
+        return merged_df
+
+    # Query the rows of the names in the dataframe
+    table_data_df = pd.read_sql(text(f"SELECT ID AS TABLE_ID, {column_name} FROM {table_name} "
+                                     f"WHERE {column_name} = ANY(:names);"),
+                                engine if conn is None else conn,
+                                params={"names": dataframe_name[column_name].dropna().unique().tolist()})
     
     # Merge the table data to the dataframe
     merged_df = dataframe_name.merge(right=table_data_df, on=column_name, how="left")
@@ -92,339 +202,532 @@ def foreign_key_grab(table_name, column_name, engine, dataframe_name, foreign_ke
     return merged_df
 
 
-def convert_to_utc(datetime_obj):
-    """Convert datetime object to UTC. This datetime object must already have timezone specified.
-    
+def transform_and_load_entries(toggl_data_raw_df, engine, conn, workspace_id, dimension_cache, copy_chunk_size,
+                               metrics, stage_workers=DEFAULT_STAGE_WORKERS):
+    """Transform a chunk of raw toggl entries and load it into the user, task, tag, entry and entry tag tables.
+    Every load runs in the transaction of the run, so the run commits or rolls back as a whole. The stages run as a
+    StageGraph, but a transaction lives on one connection, which runs one statement at a time - the loads take turns
+    on it and only the transforms overlap with them, for example the tag transform with the task load. The loads
+    cost one round trip each, as the merges run inside postgres, so the turns are short next to a pooled connection
+    per load outside the transaction. The foreign keys are checked when the run commits, so toggl_entry is loaded
+    as soon as the task ids it looks up are known, without waiting for the users, and toggl_entry_tag without
+    waiting for the entries. toggl_user is shared by every workspace - users whose name did not change are not
+    written, so runs of other workspaces with the same users do not wait for this run to commit.
+
     Args:
-        datetime_obj (datetime object): Date of the entry
-    
+        toggl_data_raw_df (Pandas DataFrame object): Pandas DataFrame of raw toggl entries from the api
+        engine (SQLAlchemy engine object): SQLAlchemy engine object
+        conn (SQLAlchemy connection object): Open connection inside the transaction of the run, see
+            defer_foreign_keys
+        workspace_id (int): Workspace the entries were pulled from
+        dimension_cache (DimensionCache object): Cache of name -> id maps for the dimension tables
+        copy_chunk_size (int): Number of rows sent per COPY call when loading tables
+        metrics (RunMetrics object): Run metrics the transform and load stages are recorded in
+        stage_workers (int, optional): Number of stages run at once
+
     Returns:
-        utc_datetime (datetime object): Date coverted to UTC
-    
+        day_set (set): Dates the new and changed entries start on, before and after the update
+
     """
-    
-    # Convert to UTC
-    utc_datetime = datetime_obj.astimezone(pytz.utc).replace(tzinfo=None)
-    
-    return utc_datetime
+    # one connection can only run one statement at a time - the stages hold the lock while they use it
+    conn_lock = Lock()
+
+    def clean_entries(results):
+        with metrics.stage("entry clean", rows_in=len(toggl_data_raw_df)) as stage:
+            raw_bytes = memory_bytes(toggl_data_raw_df)
+            # keep only the columns the tables are built from, with categoricals for the repeated names and the
+            # smallest integer types for the ids
+            entry_clean_df = compact_entries(toggl_data_raw_df, columns=RAW_ENTRY_COLUMNS)
+
+            # data cleaning - convert the date columns to UTC
+            entry_clean_df = convert_columns_to_utc(entry_clean_df, ["start", "end", "updated"])
+
+            # entries without a description belong to the task with an empty name, so their task is found again on
+            # every run instead of adding another NULL task
+            entry_clean_df["description"] = fill_missing_names(entry_clean_df["description"])
+
+            # the "tags" data comes in as a list - explode it to one row per entry and tag
+            entry_tag_df = explode_tags(entry_clean_df)
+
+            clean_bytes = memory_bytes(entry_clean_df)
+            print(f"Entry chunk memory: {raw_bytes / max(len(toggl_data_raw_df), 1):.0f} bytes per entry raw, "
+                  f"{clean_bytes / max(len(entry_clean_df), 1):.0f} bytes per entry compacted")
+            stage.add(rows_out=len(entry_clean_df), bytes_in=raw_bytes, bytes_out=clean_bytes)
+        return entry_clean_df, entry_tag_df
+
+    ### Start of Toggl Users data
+    def transform_users(results):
+        entry_clean_df, _ = results["entry clean"]
+        print("Transforming Toggl User data")
+        with metrics.stage("user transform", rows_in=len(entry_clean_df)) as stage:
+            # Get distinct values of the uid and user columns
+            user_data_df = entry_clean_df[["uid", "user"]].drop_duplicates()
+
+            # Rename columns
+            user_data_df = user_data_df.rename(columns={"uid": "id", "user": "name"})
+            stage.add(rows_out=len(user_data_df))
+        return user_data_df
+
+    def load_users(results):
+        user_data_df = results["user transform"]
+        # Write data to table - update the name of existing users if it changed
+        with metrics.stage("user load", rows_in=len(user_data_df)) as stage, conn_lock:
+            user_id_rows = upsert_data_to_table(dataframe_name=user_data_df[["id", "name"]], engine=engine,
+                table_name="toggl_user", conflict_columns=["id"], update_columns=["name"], change_column="name",
+                chunk_size=copy_chunk_size, returning=["id", "name"], conn=conn)
+            stage.add(rows_out=len(user_id_rows), rows_written=len(user_id_rows))
+        # Add the new user ids to the cache
+        dimension_cache.update("toggl_user", {name: table_id for table_id, name in user_id_rows})
+    ### End of Toggl Users data
+
+    ### Start of Toggl Tasks data
+    def transform_tasks(results):
+        entry_clean_df, _ = results["entry clean"]
+        print("Transforming Toggl Tasks data")
+        with metrics.stage("task transform", rows_in=len(entry_clean_df)) as stage:
+            # Get distinct values of the description column
+            task_df = entry_clean_df[["description"]].drop_duplicates()
+
+            # Rename columns
+            task_df = task_df.rename(columns={"description": "task_name"})
+            task_df.insert(0, "workspace_id", workspace_id)
+            stage.add(rows_out=len(task_df))
+        return task_df
+
+    def load_tasks(results):
+        task_df = results["task transform"]
+        # Write new tasks to table - ids for new task names are assigned inside postgres, and the ids of every task
+        # name of the chunk, new or not, come back from the same statement
+        with metrics.stage("task load", rows_in=len(task_df)) as stage, conn_lock:
+            task_id_rows, row_count = upsert_data_to_table(dataframe_name=task_df, engine=engine,
+                table_name="toggl_task", conflict_columns=["workspace_id", "task_name"], assign_id=True,
+                chunk_size=copy_chunk_size, returning=["id", "task_name"], return_existing=True, conn=conn)
+            stage.add(rows_out=len(task_id_rows), rows_written=row_count)
+        # Add the ids to the cache - the entries of the chunk find all their tasks there
+        dimension_cache.update("toggl_task", {name: table_id for table_id, name in task_id_rows})
+    ### End of Toggl Tasks data
+
+    ### Start of Toggl Tag data
+    def transform_tags(results):
+        _, entry_tag_df = results["entry clean"]
+        print("Transforming Toggl Tag data")
+        with metrics.stage("tag transform", rows_in=len(entry_tag_df)) as stage:
+            # Get distinct values of the tag_name column
+            tag_unique_df = entry_tag_df[["tag_name"]].drop_duplicates().sort_values("tag_name").reset_index(drop=True)
+            tag_unique_df.insert(0, "workspace_id", workspace_id)
+            stage.add(rows_out=len(tag_unique_df))
+        return tag_unique_df
+
+    def load_tags(results):
+        tag_unique_df = results["tag transform"]
+        # Write new tags to table - ids for new tag names are assigned inside postgres, and the ids of every tag
+        # name of the chunk, new or not, come back from the same statement
+        with metrics.stage("tag load", rows_in=len(tag_unique_df)) as stage, conn_lock:
+            tag_id_rows, row_count = upsert_data_to_table(dataframe_name=tag_unique_df, engine=engine,
+                table_name="toggl_tag", conflict_columns=["workspace_id", "tag_name"], assign_id=True,
+                chunk_size=copy_chunk_size, returning=["id", "tag_name"], return_existing=True, conn=conn)
+            stage.add(rows_out=len(tag_id_rows), rows_written=row_count)
+        # Add the ids to the cache - the entries of the chunk find all their tags there
+        dimension_cache.update("toggl_tag", {name: table_id for table_id, name in tag_id_rows})
+    ### End of Toggl Tag data
+
+    ### Start of Toggl Entry data
+    def transform_entries(results):
+        entry_clean_df, _ = results["entry clean"]
+        print("Transforming Toggl Entry data")
+        with metrics.stage("entry transform", rows_in=len(entry_clean_df)) as stage:
+            # Get distinct values of the entry columns
+            entry_data_df = entry_clean_df[["id", "pid", "uid", "description", "start", "end",
+                                            "updated"]].drop_duplicates()
+
+            # Rename columns
+            entry_data_df = entry_data_df.rename(columns={"uid": "toggl_user_id", "pid": "toggl_project_id",
+                                                          "description": "task_name", "start": "start_date",
+                                                          "end": "end_date", "updated": "update_date"})
+            entry_data_df["workspace_id"] = workspace_id
+
+            # Get the id from the toggl_task table for the foreign key
+            with conn_lock:
+                entry_data_df = foreign_key_grab(table_name="toggl_task", column_name="task_name", engine=engine,
+                    dataframe_name=entry_data_df, foreign_key_name="toggl_task_id", dimension_cache=dimension_cache,
+                    conn=conn)
+
+            # Re-order columns
+            entry_data_df = entry_data_df[ENTRY_DATA_COLUMNS]
+            stage.add(rows_out=len(entry_data_df))
+        return entry_data_df
+
+    def load_entries(results):
+        entry_data_df = results["entry transform"]
+        # Write data to table - existing entries are only updated if their update_date changed
+        with metrics.stage("entry load", rows_in=len(entry_data_df)) as stage, conn_lock:
+            # days the stored entries start on before the update - an entry moved to another day changes both days
+            previous_day_dict = entry_days(conn, entry_data_df["id"].tolist())
+            changed_id_rows = upsert_data_to_table(dataframe_name=entry_data_df, engine=engine,
+                table_name="toggl_entry", conflict_columns=["id"], update_columns=ENTRY_DATA_COLUMNS[1:],
+                change_column="update_date", chunk_size=copy_chunk_size, returning=["id"], conn=conn)
+            stage.add(rows_out=len(changed_id_rows), rows_written=len(changed_id_rows))
+        # days touched by the new and changed entries, before and after the update
+        changed_id_set = {entry_id for entry_id, in changed_id_rows}
+        changed_df = entry_data_df[entry_data_df["id"].isin(changed_id_set)]
+        return ({previous_day_dict[entry_id] for entry_id in changed_id_set if entry_id in previous_day_dict}
+                | set(changed_df["start_date"].dropna().dt.date))
+    ### End of Toggl Entry data
+
+    ### Start of Toggl Entry Tag data
+    def transform_entry_tags(results):
+        _, entry_tag_df = results["entry clean"]
+        print("Transforming Toggl Entry Tag data")
+        with metrics.stage("entry tag transform", rows_in=len(entry_tag_df)) as stage:
+            # Rename id to toggl_entry_id to match toggl_entry_tag table
+            entry_tag_data_tall_df = entry_tag_df.rename(columns={"id": "toggl_entry_id"})
+
+            # Get the id from the toggl_tag table for the foreign key
+            with conn_lock:
+                entry_tag_data_tall_df = foreign_key_grab(table_name="toggl_tag", column_name="tag_name",
+                    engine=engine, dataframe_name=entry_tag_data_tall_df, foreign_key_name="toggl_tag_id",
+                    dimension_cache=dimension_cache, conn=conn)
+
+            # Delete unneeded columns
+            del entry_tag_data_tall_df["tag_name"]
+            stage.add(rows_out=len(entry_tag_data_tall_df))
+        return entry_tag_data_tall_df
+
+    def load_entry_tags(results):
+        entry_tag_data_tall_df = results["entry tag transform"]
+        entry_data_df = results["entry transform"]
+        # Write data to table - tags removed from the pulled entries are deleted
+        with metrics.stage("entry tag load", rows_in=len(entry_tag_data_tall_df)) as stage, conn_lock:
+            row_count = upsert_data_to_table(
+                dataframe_name=entry_tag_data_tall_df[["toggl_entry_id", "toggl_tag_id"]], engine=engine,
+                table_name="toggl_entry_tag", conflict_columns=["toggl_entry_id", "toggl_tag_id"],
+                replace_column="toggl_entry_id", replace_values=entry_data_df["id"].tolist(),
+                chunk_size=copy_chunk_size, conn=conn)
+            stage.add(rows_out=row_count, rows_written=row_count)
+    ### End of Toggl Entry Tag data
+
+    def refresh_rollups(results):
+        # Rebuild the daily rollups of only the days the new and changed entries start on, now or before the update
+        day_set = results["entry load"]
+        with metrics.stage("rollup refresh", rows_in=len(day_set)) as stage, conn_lock:
+            row_count = refresh_daily_rollups(engine, day_set, conn=conn, workspace_id=workspace_id)
+            stage.add(rows_out=row_count, rows_written=row_count)
+
+    # Stages and the stages they need first - the foreign keys are deferred to the commit of the run, so only the
+    # ids the transforms look up and the rows the rollups are built from decide the order
+    stage_graph = StageGraph(max_workers=stage_workers)
+    stage_graph.add("entry clean", clean_entries)
+    stage_graph.add("user transform", transform_users, depends_on=["entry clean"])
+    stage_graph.add("user load", load_users, depends_on=["user transform"])
+    stage_graph.add("task transform", transform_tasks, depends_on=["entry clean"])
+    stage_graph.add("task load", load_tasks, depends_on=["task transform"])
+    stage_graph.add("tag transform", transform_tags, depends_on=["entry clean"])
+    stage_graph.add("tag load", load_tags, depends_on=["tag transform"])
+    stage_graph.add("entry transform", transform_entries, depends_on=["task load"])
+    stage_graph.add("entry load", load_entries, depends_on=["entry transform"])
+    stage_graph.add("entry tag transform", transform_entry_tags, depends_on=["tag load"])
+    stage_graph.add("entry tag load", load_entry_tags, depends_on=["entry tag transform", "entry transform"])
+    stage_graph.add("rollup refresh", refresh_rollups, depends_on=["user load", "entry load", "entry tag load"])
+    results = stage_graph.run()
+
+    # the chain of stages that decided how long the chunk took
+    metrics.add_critical_path(stage_graph.critical_path())
+    return results["entry load"]
+
+
+def delete_entries(engine, entry_ids, conn=None):
+    """Delete entries and their entry tags, for example entries that were deleted in toggl
 
+    Args:
+        engine (SQLAlchemy engine object): SQLAlchemy engine object
+        entry_ids (list): Entry ids
+        conn (SQLAlchemy connection object, optional): Open connection inside the caller's transaction, the caller
+            commits. Defaults to a transaction of its own
+
+    Returns:
+        day_set (set): Days the deleted entries started on, their rollups and cached totals are out of date
+
+    """
+    if not entry_ids:
+        return set()
+    with begin(engine, conn) as conn:
+        conn.execute(text("DELETE FROM toggl_entry_tag WHERE toggl_entry_id = ANY(:ids);"), {"ids": entry_ids})
+        day_rows = conn.execute(text("DELETE FROM toggl_entry WHERE id = ANY(:ids) "
+                                     "RETURNING CAST(start_date AS date);"), {"ids": entry_ids}).fetchall()
+    print(f"Deleted {len(day_rows)} rows from toggl_entry table")
+    return {row[0] for row in day_rows if row[0] is not None}
+
+
+def load_projects(toggl_client, landing_zone, engine, conn, workspace_id, dimension_cache, copy_chunk_size,
+                  metrics):
+    """Pull the projects and load them into the toggl_project table
 
-def add_data_to_table(dataframe_name, engine, table_name):
-    """Append data to table if any exists in dataframe
-    
     Args:
-        dataframe_name (Pandas DataFrame object): Pandas DataFrame containing data to write to table
-        engine (SQLAlchemy engine object)
-        table_name (str): Name of the table
-    
+        toggl_client (TogglApi object): Toggl api client
+        landing_zone (LandingZone object): Landing zone to read the projects snapshot from instead of the api, None
+            to pull from the api
+        engine (SQLAlchemy engine object): SQLAlchemy engine object
+        conn (SQLAlchemy connection object): Open connection inside the transaction of the run
+        workspace_id (int): Workspace the projects are pulled from
+        dimension_cache (DimensionCache object): Cache of name -> id maps for the dimension tables
+        copy_chunk_size (int): Number of rows sent per COPY call when loading tables
+        metrics (RunMetrics object): Run metrics the pull and load stages are recorded in
+
     Returns:
-    
+
     """
-    if not dataframe_name.empty:
-        print(f"Adding data to {table_name} table")
-        # Append data to postgres table for toggl_projects
-        dataframe_name.to_sql(table_name, engine, if_exists="append", index=False)
-    else:
-        print(f"No new data to add to {table_name}")
+    # Pull toggl projects data from api, or from the landing zone snapshot
+    with metrics.stage("projects pull", api=True) as stage:
+        if landing_zone is not None:
+            projects_data_list = landing_zone.read_projects().to_dict("records")
+        else:
+            projects_data_list = toggl_client.get_toggl_projects()
+        stage.add(rows_out=len(projects_data_list))
+
+    # Put toggle projects data into dataframe
+    projects_df_raw = pd.DataFrame(projects_data_list)
+
+    ### Start of toggl projects data cleanup
+    # Convert columns to dates
+    projects_df_raw["at"] = pd.to_datetime(projects_df_raw["at"])
+    projects_df_raw["created_at"] = pd.to_datetime(projects_df_raw["created_at"])
+    # List of columns to convert to string
+    convert_to_string = ["billable", "is_private", "active", "template", "auto_estimates"]
+    # Convert columns to string
+    for col in convert_to_string:
+        projects_df_raw[col] = projects_df_raw[col].astype(str)
+    ### End of data cleanup
+
+    ### Start of data transformation for database
+    # Grab only certain columns
+    projects_df = projects_df_raw.copy()
+    projects_df = projects_df[["id", "name", "active", "created_at"]]
+
+    # Rename columns
+    projects_df.rename(columns={"name":"project_name", "created_at":"created_at_date", "active":"active_raw"},
+                       inplace=True)
+
+    # Create active column as 0 then add 1 for anything that is True
+    projects_df["active"] = 0
+    projects_df.loc[projects_df.active_raw == "True", "active"] = 1
+    # Convert active column to boolean datatype
+    projects_df["active"] = projects_df["active"].astype("bool")
+    # Delete active_raw column
+    del projects_df["active_raw"]
+    ### End of database data transformation
+
+    # Write new projects to table - existing project names are skipped inside postgres
+    projects_df = projects_df[["id", "project_name", "created_at_date", "active"]]
+    projects_df.insert(1, "workspace_id", workspace_id)
+    with metrics.stage("projects load", rows_in=len(projects_df)) as stage:
+        project_id_rows = upsert_data_to_table(dataframe_name=projects_df, engine=engine, table_name="toggl_project",
+            conflict_columns=["workspace_id", "project_name"], chunk_size=copy_chunk_size,
+            returning=["id", "project_name"], conn=conn)
+        stage.add(rows_out=len(project_id_rows), rows_written=len(project_id_rows))
+    # Add the new project ids to the cache
+    dimension_cache.update("toggl_project", {name: table_id for table_id, name in project_id_rows})
+
+
+def run(args, schema_ready=False):
+    """Pull toggl data and load it into the postgres toggl_* tables
 
+    Args:
+        args (Namespace object): Parsed add_arguments arguments
+        schema_ready (bool, optional): The schema was already brought up to date with prepare_schema, for example
+            by toggl_workspaces.py before it started the run of every workspace
+
+    Returns:
+        entry_count (int): Number of entries transformed and loaded
+
+    """
+    if args.reconcile and (args.replay or args.from_landing):
+        raise ValueError("--reconcile compares the stored entries with the api, it can not read the response cache "
+                         "or landing zone")
+    # replaying the cache pulls every cached date range, same as a full pull. Reconciling pulls whole months again
+    full_pull = args.full or args.replay or bool(args.reconcile)
+
+    # Open config file and grab the database_config and the toggl_config of the workspace from the json data
+    shared_config = load_config(args.config_file)
+    config = select_workspace(shared_config, args.workspace_id)
+    workspace_id = int(config["toggl_config"]["workspace_id"])
+    db_settings = config["database_config"]
+    # Number of rows sent per COPY call when loading tables
+    copy_chunk_size = int(db_settings.get("copy_chunk_size", COPY_CHUNK_SIZE))
+
+    # Number of transform and load stages run at once - the loads take turns on the connection of the run
+    stage_workers = args.stage_workers or int(db_settings.get("stage_workers", DEFAULT_STAGE_WORKERS))
+
+    # Create engine for postgres connection
+    engine = build_engine(db_settings)
+
+    # Cache of name -> id maps for the dimension tables, optionally persisted between runs
+    key_cache_size = int(db_settings.get("key_cache_size", MAX_CACHE_ENTRIES))
+    key_cache_file = db_settings.get("key_cache_file")
+    if shared_config["toggl_config"].get("workspaces"):
+        # runs of several workspaces at once each keep a key cache file of their own
+        key_cache_file = workspace_file(key_cache_file, workspace_id)
+    dimension_cache = DimensionCache(engine=engine, max_entries=key_cache_size, cache_file=key_cache_file,
+                                     workspace_id=workspace_id)
+
+    # Per day query totals shared with toggl_cli.py totals - dropped for the days a run changes
+    query_cache = QueryCache(config["toggl_config"].get("query_cache_file"))
+    if not schema_ready:
+        prepare_schema(engine, workspace_id, query_cache, rebuild_rollups=args.rebuild_rollups)
+
+    print("Pulling Toggl Projects data")
+    ### Start of pulling toggl projects data
+    # Connect to ToggleApi class
+    toggl_client = te.TogglApi(config_file=args.config_file, replay=args.replay, fetch_mode=args.fetch_mode,
+                               workspace_id=workspace_id)
+    # Wall time, rows, api calls and memory of every stage of the run
+    metrics = RunMetrics(pipeline="toggl_relational_extract", http=toggl_client.http)
+
+    # Parquet landing zone written by toggl_data_pull.py and toggl_projects_data_pull.py
+    landing_zone = LandingZone(toggl_client.settings["landing_dir"]) if args.from_landing else None
+
+    # every table of the run is loaded over one connection in one transaction, so a failed run leaves the tables as
+    # they were. The foreign keys are checked once, at commit
+    with engine.connect() as conn, conn.begin() as transaction:
+        defer_foreign_keys(conn, LOADED_TABLES)
+
+        load_projects(toggl_client=toggl_client, landing_zone=landing_zone, engine=engine, conn=conn,
+                      workspace_id=workspace_id, dimension_cache=dimension_cache, copy_chunk_size=copy_chunk_size,
+                      metrics=metrics)
+
+        print("Pulling Toggl Entry data")
+        ### Start of pulling Toggl entry data
+        # create list of yearly date ranges for each year up until current year
+        date_range_list = build_date_range_list()
+
+        # query toggl_projects table in sqlite database to grab all project id's of the workspace
+        projects_id_df = pd.read_sql(text("SELECT DISTINCT ID FROM TOGGL_PROJECT WHERE WORKSPACE_ID = :workspace_id;"),
+                                     conn, params={"workspace_id": workspace_id})
+
+        # pull list of project id's from toggl_projects table in sqlite database
+        projects_id_list = projects_id_df.id.tolist()
+
+        # load the sync state - the full pull ignores it but still moves the watermarks forward
+        sync_state = SyncState(workspace_id=toggl_client.settings["workspace_id"], pipeline="toggl_relational_extract",
+                               state_file=args.state_file, lookback_days=args.lookback_days)
+        # watermarks from the previous run - used to drop entries that were already loaded
+        previous_watermarks = sync_state.watermarks()
+        # start each project at the date range granularity it needed last time
+        toggl_client.window_granularity.update(sync_state.granularities())
+
+        # timezone the api splits months in, the stored entries are in UTC
+        timezone = toggl_client.settings.get("timezone", "UTC")
+        if args.reconcile:
+            # pull again only the (project, month) partitions whose stored entries differ from the api
+            with metrics.stage("reconcile", api=True) as stage:
+                stored_entry_df = postgres_entry_frame(conn, workspace_id)
+                partition_list = find_changed_partitions(toggl_client, stored_entry_df, date_range_list,
+                                                         method=args.reconcile, timezone=timezone)
+                stage.add(rows_in=len(stored_entry_df), rows_out=len(partition_list))
+            print(f"{len(partition_list)} project months differ from the api")
+            work_list = refetch_work_list(partition_list)
+        else:
+            # pick the date ranges to pull for each project - only the days since the last sync in incremental mode
+            work_list = []
+            for project in projects_id_list:
+                project_date_range_list = (date_range_list if full_pull
+                                           else sync_state.date_range_list(project, date_range_list))
+                for date_range in project_date_range_list:
+                    work_list.append((project, date_range))
+
+        entry_count = 0
+        # days with new or changed entries - their cached query totals are dropped at the end of the run
+        touched_day_set = set()
+        # ids of every entry pulled when reconciling - stored entries of the pulled months not among them are deleted
+        pulled_id_set = set()
+        # pull every project and date range - concurrently if max_workers is set in the config. Every month a
+        # reconcile picked is pulled, also of archived projects - the stored entries of a month that comes back empty
+        # are deleted
+        if landing_zone is not None:
+            # read only the partitions of the projects and months to load, and only the columns the transforms use
+            chunk_iter = metrics.timed_iter("entry pull", landing_zone.iter_entry_chunks(work_list,
+                columns=RAW_ENTRY_COLUMNS, chunk_size=args.chunk_size))
+        else:
+            page_iter = metrics.timed_iter("entry pull", toggl_client.iter_toggl_log_data_windows(
+                work_list, skip_dormant=False if args.reconcile else None))
+            chunk_iter = iter_page_chunks(page_iter, chunk_size=args.chunk_size)
+        # transform and load the entries in chunks, so only one chunk is held in memory at a time
+        for toggl_data_raw_df in chunk_iter:
+            # move the watermark of each project forward to its newest updated timestamp
+            updated_utc_series = pd.to_datetime(toggl_data_raw_df["updated"], utc=True)
+            latest_updated_series = updated_utc_series.groupby(toggl_data_raw_df["pid"]).max()
+            for project, latest_updated in latest_updated_series.items():
+                sync_state.update(project, updated=latest_updated.isoformat())
+            if args.reconcile:
+                pulled_id_set.update(int(entry_id) for entry_id in toggl_data_raw_df["id"])
+
+            if not full_pull:
+                # keep only the entries changed since the last sync - projects never synced have no watermark
+                watermark_series = pd.to_datetime(toggl_data_raw_df["pid"].map(previous_watermarks), utc=True)
+                toggl_data_raw_df = toggl_data_raw_df[watermark_series.isnull() |
+                                                      (updated_utc_series > watermark_series)].reset_index(drop=True)
+
+            if toggl_data_raw_df.empty:
+                continue
+            entry_count += len(toggl_data_raw_df)
+
+            touched_day_set |= transform_and_load_entries(toggl_data_raw_df=toggl_data_raw_df, engine=engine,
+                conn=conn, workspace_id=workspace_id, dimension_cache=dimension_cache, copy_chunk_size=copy_chunk_size,
+                metrics=metrics, stage_workers=stage_workers)
+
+        if args.reconcile:
+            # entries of the pulled months that the api no longer returns were deleted in toggl
+            stale_id_list = stale_entry_ids(stored_entry_df, partition_list, pulled_id_set, timezone=timezone)
+            with metrics.stage("entry delete", rows_in=len(stale_id_list)) as stage:
+                deleted_day_set = delete_entries(engine, stale_id_list, conn=conn)
+                refresh_daily_rollups(engine, deleted_day_set, conn=conn, workspace_id=workspace_id)
+                stage.add(rows_written=len(stale_id_list))
+            touched_day_set |= deleted_day_set
+
+        with metrics.stage("commit"):
+            transaction.commit()
+
+    # projects without new entries are still synced up to today
+    for project in projects_id_list:
+        sync_state.update(project)
+    # remember how finely each project's date ranges had to be split
+    for project, granularity in toggl_client.window_granularity.items():
+        sync_state.set_granularity(project, granularity)
+
+    if entry_count == 0:
+        print("No new Toggl Entry data found")
+
+    # everything loaded - save the sync state and dimension key cache for the next run
+    # the cache and landing zone only hold what earlier runs pulled - reading them does not move the sync state forward.
+    # Reconciling pulls old months, not the days since the last sync, so it leaves the watermarks to incremental runs
+    if not (args.replay or args.from_landing or args.reconcile):
+        sync_state.save()
+    dimension_cache.save()
+    # the cached totals of the other days are still right
+    print(f"Dropped {query_cache.invalidate(touched_day_set)} cached query days")
+
+    # report where the time went
+    metrics.print_summary()
+    if args.metrics_file:
+        metrics.write_json(args.metrics_file)
+    if args.prometheus_file:
+        metrics.write_prometheus(args.prometheus_file)
+
+    return entry_count
+
+
+def main(argv=None):
+    """Run the pipeline from the command line
 
-def add_years(dt, years):
-    """Takes date and adds years to it
-    
     Args:
-        dt (datetime): Date to increment years
-        years (int): How many years to increment the date
-    
+        argv (list, optional): Command line arguments, defaults to sys.argv
+
     Returns:
-        Date plus how many years you want to increment
+
     """
-    try:
-    # Return same day of the current year        
-        return dt.replace(year=dt.year + years)
-    except ValueError:
-        # If not same day, it will return other, i.e.  February 29 to March 1 etc.        
-        return dt + (date(dt.year + years, 1, 1) - date(dt.year, 1, 1))
-
-### End of helper functions
-
-print("Pulling Toggl Projects data")
-### Start of pulling toggl projects data
-# Connect to ToggleApi class
-toggl_client = te.TogglApi()
-
-# Pull toggl projects data from api
-projects_data_list = toggl_client.get_toggl_projects()
-
-# Put toggle projects data into dataframe
-projects_df_raw = pd.DataFrame(projects_data_list)
-
-### Start of toggl projects data cleanup
-# Convert columns to dates
-projects_df_raw["at"] = pd.to_datetime(projects_df_raw["at"])
-projects_df_raw["created_at"] = pd.to_datetime(projects_df_raw["created_at"])
-# List of columns to convert to string
-convert_to_string = ["billable", "is_private", "active", "template", "auto_estimates"]
-# Convert columns to string
-for col in convert_to_string:
-    projects_df_raw[col] = projects_df_raw[col].astype(str)
-### End of data cleanup
-
-### Start of data transformation for database
-# Grab only certain columns
-projects_df = projects_df_raw.copy()
-projects_df = projects_df[["id", "name", "active", "created_at"]]
-
-# Rename columns
-projects_df.rename(columns={"name":"project_name", "created_at":"created_at_date", "active":"active_raw"},
-                   inplace=True)
-
-# Create active column as 0 then add 1 for anything that is True
-projects_df["active"] = 0
-projects_df.loc[projects_df.active_raw == "True", "active"] = 1
-# Convert active column to boolean datatype
-projects_df["active"] = projects_df["active"].astype("bool")
-# Delete active_raw column
-del projects_df["active_raw"]
-### End of database data transformation
-
-# Checking table and filtering out duplicates values
-projects_df = duplicate_entry_check(table_name="toggl_project", column_name="project_name", engine=engine,
-    dataframe_name=projects_df, table_columns=["id", "project_name", "created_at_date", "active"])
-
-# Write data to table
-add_data_to_table(dataframe_name=projects_df, engine=engine, table_name="toggl_project")
-
-print("Pulling Toggl Entry data")
-### Start of pulling Toggl entry data
-# establish the base year to pull data from
-base_year = 2019
-# create base_start_date as Jan 1st from base year
-base_start_date = date(base_year, 1, 1)
-# create base_end_date as Dec 31st from base year
-base_end_date = date(base_year, 12, 31)
-
-# create list of yearly date ranges for each year up until current year
-# for example: [[datetime.date(2019, 1, 1), datetime.date(2019, 12, 31)]]
-date_range_list = []
-for i in range(0, datetime.today().year - base_start_date.year + 1):
-    date_range_list.append([add_years(base_start_date, i), add_years(base_end_date, i)])
-
-# query toggl_projects table in sqlite database to grab all project id's
-projects_id_df = pd.read_sql("SELECT DISTINCT ID FROM TOGGL_PROJECT;", engine)
-
-# pull list of project id's from toggl_projects table in sqlite database
-projects_id_list = projects_id_df.id.tolist()
-
-df_list = []
-# loop through each project_id
-for project in projects_id_list:
-    # loop through each year date range to pull data
-    for date_range in date_range_list:
-        toggl_api_data = toggl_client.get_toggl_log_data(project_id=project, date_range_list=date_range)
-        # iterate through the toggl_api_data to get data into a dataframe
-        for row in toggl_api_data:
-            df = pd.DataFrame(row)
-            df_list.append(df)
-
-# concatenate all the dataframes in the df_list into one dataframe
-toggl_data_raw_df = pd.concat(df_list).reset_index(drop=True)
-
-# data cleaning
-toggl_data_raw_df["start"] = pd.to_datetime(toggl_data_raw_df["start"])
-toggl_data_raw_df["end"] = pd.to_datetime(toggl_data_raw_df["end"])
-toggl_data_raw_df["updated"] = pd.to_datetime(toggl_data_raw_df["updated"])
-
-# convert columns to string
-string_convert_list = ["use_stop", "is_billable", "tags"]
-for col in string_convert_list:
-    toggl_data_raw_df[col] = toggl_data_raw_df[col].astype(str)
-
-# the "tags" data comes in as a list - convert to just a comma separated string
-toggl_data_raw_df["tags"] = toggl_data_raw_df["tags"].str.replace("[", "").str.replace("]", "").str.replace("'", "")
-toggl_data_raw_df.loc[toggl_data_raw_df.tags == "", "tags"] = np.nan
-
-# create dur_secs column as the number of seconds between the start and end
-toggl_data_raw_df["dur_secs"] = (toggl_data_raw_df["end"] - toggl_data_raw_df["start"]).astype("timedelta64[s]")
-
-print("Transforming Toggl User data")
-### Start of Toggl Users data
-# Create copy of toggl_data_raw_df to create task data
-user_data_df = toggl_data_raw_df.copy()
-
-# Get distinct values of the uid and user columns
-user_data_df = user_data_df[["uid", "user"]].drop_duplicates()
-
-# Rename columns
-user_data_df.rename(columns={"uid": "id", "user": "name"}, inplace=True)
-
-# Checking table and filtering out duplicates values
-user_data_df = duplicate_entry_check(table_name="toggl_user", column_name="name", engine=engine,
-    dataframe_name=user_data_df, table_columns=["id", "name"])
-
-# Write data to table
-add_data_to_table(dataframe_name=user_data_df, engine=engine, table_name="toggl_user")
-### End of Toggl Users data
-
-print("Transforming Toggl Tasks data")
-### Start of Toggl Tasks data
-# Create copy of toggl_data_raw_df to create task data
-task_df = toggl_data_raw_df.copy()
-
-# Get distinct values of the description column
-task_df = task_df[["description"]].drop_duplicates()
-
-# Rename columns
-task_df.rename(columns={"description": "task_name"}, inplace=True)
-
-# Iterate through each row to create an id row_number
-id_list = []
-for i, task in enumerate(task_df.task_name.tolist()):
-    id_list.append(i + 1)
-
-# Add the id column to the dataframe from the id_list
-task_df["id"] = id_list
-
-# Checking table and filtering out duplicates values
-task_df = duplicate_entry_check(table_name="toggl_task", column_name="task_name", engine=engine,
-    dataframe_name=task_df, table_columns=["id", "task_name"])
-
-# Write data to table
-add_data_to_table(dataframe_name=task_df, engine=engine, table_name="toggl_task")
-### End of Toggl Tasks data
-
-print("Transforming Toggl Tag data")
-### Start of Toggl Tag data
-# Create copy of toggl_data_raw_df to create tag data
-tag_df = toggl_data_raw_df.copy()
-
-# Get distinct values of the tags column
-tag_df = tag_df[tag_df.tags.notnull()][["tags"]].drop_duplicates().reset_index(drop=True)
-
-# Split out the tags column into multiple columns - use comma as delimiter
-tag_df = tag_df.tags.str.split(pat=",", expand=True)
-
-# Create new column names for dataframe
-tag_column_names = ["tag_" + str(col + 1) for col in tag_df.columns]
-
-# Rename columns in dataframe
-tag_df.columns = tag_column_names
-
-# Add the data to a list
-tag_row_data = tag_df.values.tolist()
-
-# Add data from list to set to get unique values
-tag_set = set()
-# Iterate through tag_row_data
-for tag_row in tag_row_data:
-    # Iterate through the tag_row
-    for val in tag_row:
-        # If there is data in the row
-        if val:
-            # Strip whitespace
-            val = val.strip()
-            # Add val to the tag_set
-            tag_set.add(val)
-
-# Create list of id's based on how many items are in the set
-id_list = [i + 1 for i in range(len(list(tag_set)))]
-# Convert the set to a list
-tag_list = list(tag_set)
-# Zip the id_list and tag_list into a nested list
-tag_full_list = list(zip(id_list, tag_list))
-# Create dataframe from the tag_full_list
-tag_unique_df = pd.DataFrame(data=tag_full_list, columns=["id", "tag_name"])
-
-# Checking table and filtering out duplicates values
-tag_unique_df = duplicate_entry_check(table_name="toggl_tag", column_name="tag_name", engine=engine,
-    dataframe_name=tag_unique_df, table_columns=["id", "tag_name"])
-
-# Write data to table
-add_data_to_table(dataframe_name=tag_unique_df, engine=engine, table_name="toggl_tag")
-### End of Toggl Tag data
-
-print("Transforming Toggl Entry data")
-### Start of Toggl Entry data
-# Create copy of toggl_data_raw_df to create entry data
-entry_data_df = toggl_data_raw_df.copy()
-
-# Get distinct values of the uid and user columns
-entry_data_df = entry_data_df[["id", "pid", "uid", "description", "start", "end", "updated"]].drop_duplicates()
-
-# Rename columns
-entry_data_df.rename(columns={"uid": "toggl_user_id", "pid": "toggl_project_id", "description": "task_name",
-                              "start": "start_date", "end": "end_date", "updated": "update_date"},
-                     inplace=True)
-
-# Get the id from the toggl_task table for the foreign key
-entry_data_df = foreign_key_grab(table_name="toggl_task", column_name="task_name", engine=engine, 
-    dataframe_name=entry_data_df, foreign_key_name="toggl_task_id")
-
-# Create list of columns for the entry data
-entry_data_columns = ["id", "toggl_project_id", "toggl_task_id", "toggl_user_id", "start_date", "end_date",
-                      "update_date"]
-
-# Checking table and filtering out duplicates values
-entry_data_df = duplicate_entry_check(table_name="toggl_entry", column_name="id", engine=engine,
-    dataframe_name=entry_data_df, table_columns=entry_data_columns)
-
-# Create empty lists for each date column
-start_date_utc_list = []
-end_date_utc_list = []
-update_date_utc_list = []
-# Iterate through each row in the dataframe and convert date columns to utc
-for row in entry_data_df.values.tolist():
-    # Convert start_date to utc
-    start_date_utc_list.append(convert_to_utc(row[4]))
-    # Convert end_date to utc
-    end_date_utc_list.append(convert_to_utc(row[5]))
-    # Convert update_date to utc
-    update_date_utc_list.append(convert_to_utc(row[6]))
-
-# Adding the UTC converted dates to the dataframe columns
-entry_data_df["start_date"] = start_date_utc_list
-entry_data_df["end_date"] = end_date_utc_list
-entry_data_df["update_date"] = update_date_utc_list
-
-# Write data to table
-add_data_to_table(dataframe_name=entry_data_df, engine=engine, table_name="toggl_entry")
-### End of Toggl Entry data
-
-print("Transforming Toggl Entry Tag data")
-### Start of Toggl Entry Tag data
-# Create copy of toggl_data_raw_df to create entry tag data
-entry_tag_data_df = toggl_data_raw_df.copy()
-
-# Split out the tags column into multiple columns - use comma as delimiter
-entry_tag_data_df[tag_column_names] = entry_tag_data_df.tags.str.split(pat=",", expand=True)
-
-# Create tall table - row per tag
-entry_tag_data_tall_df = pd.melt(frame=entry_tag_data_df, id_vars=["id"], value_vars=tag_column_names)
-
-# # Create filter indicator for all rows that 
-# entry_tag_data_tall_df.loc[(entry_tag_data_tall_df.variable != "tag_1") &
-#                            (entry_tag_data_tall_df.value.isnull()), "filter_ind"] = 1
-# entry_tag_data_tall_df = entry_tag_data_tall_df[entry_tag_data_tall_df.filter_ind.isnull()]
-
-# Filter out all rows where the value is null
-entry_tag_data_tall_df = entry_tag_data_tall_df[entry_tag_data_tall_df.value.notnull()].reset_index(drop=True)
-# Rename value to tag_name to match toggl_tag table
-entry_tag_data_tall_df.rename(columns={"value":"tag_name", "id":"toggl_entry_id"}, inplace=True)
-# Strip whitespace from the tag_name column
-entry_tag_data_tall_df["tag_name"] = entry_tag_data_tall_df.tag_name.str.strip()
-
-# Get the id from the toggl_task table for the foreign key
-entry_tag_data_tall_df = foreign_key_grab(table_name="toggl_tag", column_name="tag_name", engine=engine, 
-    dataframe_name=entry_tag_data_tall_df, foreign_key_name="toggl_tag_id")
-
-# Delete unneeded columns
-del entry_tag_data_tall_df["variable"]
-del entry_tag_data_tall_df["tag_name"]
-
-# Checking table and filtering out duplicates values
-entry_tag_data_tall_df = duplicate_entry_check(table_name="toggl_entry_tag",
-    column_name="toggl_entry_id, toggl_tag_id", engine=engine, dataframe_name=entry_tag_data_tall_df,
-    table_columns=["toggl_entry_id", "toggl_tag_id"])
-
-# Write data to table
-add_data_to_table(dataframe_name=entry_tag_data_tall_df, engine=engine, table_name="toggl_entry_tag")
-### End of Toggl Entry Tag data
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import gzip
+import json
+from os import makedirs, remove, replace, walk
+from os.path import dirname, getmtime, getsize, join, relpath, sep
+from threading import Lock
+import time
+
+# default number of hours a cached response is kept
+RESPONSE_CACHE_TTL_HOURS = 24 * 30
+
+# default size of the cache on disk
+RESPONSE_CACHE_MAX_MB = 1024
+
+# when the cache is over its size, evict down to this share of max_bytes so eviction does not run on every write
+EVICT_TO_RATIO = 0.9
+
+CACHE_FILE_SUFFIX = ".json.gz"
+
+
+class ResponseCache():
+    def __init__(self, cache_dir, ttl_hours=RESPONSE_CACHE_TTL_HOURS, max_mb=RESPONSE_CACHE_MAX_MB):
+        """Gzip compressed json files of raw api responses, one file per key. A key like
+        ("workspace_id", "project_id", "2020-01-01", "2020-12-31", "page1") is stored at
+        cache_dir/workspace_id/project_id/2020-01-01/2020-12-31/page1.json.gz
+
+        Args:
+            cache_dir (str): Full path to the cache directory
+            ttl_hours (float, optional): Responses older than this are evicted. 0 keeps them until the cache is full
+            max_mb (float, optional): Size of the cache on disk. The oldest responses are evicted first
+
+        Returns:
+
+        """
+        self.cache_dir = cache_dir
+        self.ttl_secs = ttl_hours * 3600
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.lock = Lock()
+        # path -> (size in bytes, modified time) of every cached response
+        self.index = {}
+        self.total_bytes = 0
+
+        makedirs(self.cache_dir, exist_ok=True)
+        for root, _, file_names in walk(self.cache_dir):
+            for file_name in file_names:
+                if file_name.endswith(CACHE_FILE_SUFFIX):
+                    path = join(root, file_name)
+                    self.index[path] = (getsize(path), getmtime(path))
+                    self.total_bytes += self.index[path][0]
+
+    def get(self, key):
+        """Read a cached response
+
+        Args:
+            key (tuple): Parts of the cache key, for example ("workspace_id", "projects")
+
+        Returns:
+            data (dict or list): Json response, None if the key is not cached
+
+        """
+        path = self._path(key)
+        if path not in self.index:
+            return None
+        with gzip.open(path, "rt") as cache_file:
+            return json.load(cache_file)
+
+    def keys(self, prefix):
+        """List the cached keys starting with a prefix, oldest first
+
+        Args:
+            prefix (tuple): First parts of the cache key, for example ("workspace_id", "project_id")
+
+        Returns:
+            key_list (list): List of key tuples, ordered by the time they were cached
+
+        """
+        prefix_dir = join(self.cache_dir, *[str(part) for part in prefix]) + sep
+        with self.lock:
+            path_list = sorted((path for path in self.index if path.startswith(prefix_dir)),
+                               key=lambda path: self.index[path][1])
+        return [tuple(relpath(path, self.cache_dir)[:-len(CACHE_FILE_SUFFIX)].split(sep)) for path in path_list]
+
+    def put(self, key, data):
+        """Write a response to the cache, replacing any response cached under the same key
+
+        Args:
+            key (tuple): Parts of the cache key
+            data (dict or list): Json response
+
+        Returns:
+
+        """
+        path = self._path(key)
+        makedirs(dirname(path), exist_ok=True)
+        # write to a temp file first so a crash never leaves a half written response
+        temp_path = path + ".tmp"
+        with gzip.open(temp_path, "wt") as cache_file:
+            json.dump(data, cache_file)
+        replace(temp_path, path)
+
+        with self.lock:
+            size, _ = self.index.get(path, (0, 0))
+            self.index[path] = (getsize(path), time.time())
+            self.total_bytes += self.index[path][0] - size
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Drop responses older than the ttl, then the oldest responses until the cache fits in max_bytes
+
+        Args:
+
+        Returns:
+            evicted_count (int): Number of responses dropped
+
+        """
+        with self.lock:
+            expired_time = time.time() - self.ttl_secs
+            evict_paths = [path for path, (_, mtime) in self.index.items() if self.ttl_secs and mtime < expired_time]
+            remaining_bytes = self.total_bytes - sum(self.index[path][0] for path in evict_paths)
+            if remaining_bytes > self.max_bytes:
+                evict_set = set(evict_paths)
+                for path, (size, _) in sorted(self.index.items(), key=lambda item: item[1][1]):
+                    if remaining_bytes <= self.max_bytes * EVICT_TO_RATIO:
+                        break
+                    if path not in evict_set:
+                        evict_paths.append(path)
+                        remaining_bytes -= size
+
+            for path in evict_paths:
+                size, _ = self.index.pop(path)
+                self.total_bytes -= size
+                try:
+                    remove(path)
+                except FileNotFoundError:
+                    pass
+        return len(evict_paths)
+
+    def _path(self, key):
+        """Full path of the file a key is cached in
+
+        Args:
+            key (tuple): Parts of the cache key
+
+        Returns:
+            path (str): Full path of the cache file
+
+        """
+        parts = [str(part) for part in key]
+        return join(self.cache_dir, *parts[:-1], parts[-1] + CACHE_FILE_SUFFIX)
@@ -0,0 +1,149 @@
+import time
+
+from sqlalchemy import text
+
+from toggl_load import begin
+
+# daily rollup tables and the query building their rows for the days in :days of the workspace :workspace_id, or of
+# every workspace if it is NULL. Entries count towards the day (UTC) they start on. Days are matched with a range on
+# start_date, so the start_date index is used
+ROLLUP_TABLES = {
+    "toggl_daily_project_user": {
+        "columns": ["day", "workspace_id", "toggl_project_id", "toggl_user_id", "entry_count", "duration_secs"],
+        "select_sql": """
+            SELECT d.day, e.workspace_id, e.toggl_project_id, e.toggl_user_id, COUNT(*),
+                   CAST(COALESCE(SUM(EXTRACT(EPOCH FROM e.end_date - e.start_date)), 0) AS bigint)
+            FROM UNNEST(CAST(:days AS date[])) AS d(day)
+            JOIN toggl_entry e ON e.start_date >= d.day AND e.start_date < d.day + 1
+            WHERE CAST(:workspace_id AS bigint) IS NULL OR e.workspace_id = :workspace_id
+            GROUP BY d.day, e.workspace_id, e.toggl_project_id, e.toggl_user_id""",
+    },
+    "toggl_daily_tag": {
+        "columns": ["day", "workspace_id", "toggl_tag_id", "entry_count", "duration_secs"],
+        "select_sql": """
+            SELECT d.day, e.workspace_id, et.toggl_tag_id, COUNT(*),
+                   CAST(COALESCE(SUM(EXTRACT(EPOCH FROM e.end_date - e.start_date)), 0) AS bigint)
+            FROM UNNEST(CAST(:days AS date[])) AS d(day)
+            JOIN toggl_entry e ON e.start_date >= d.day AND e.start_date < d.day + 1
+            JOIN toggl_entry_tag et ON et.toggl_entry_id = e.id
+            WHERE CAST(:workspace_id AS bigint) IS NULL OR e.workspace_id = :workspace_id
+            GROUP BY d.day, e.workspace_id, et.toggl_tag_id""",
+    },
+}
+
+# rollup tables and indexes for databases created from an older toggl_data.sql
+ROLLUP_SCHEMA_SQL = """
+CREATE INDEX IF NOT EXISTS "ix_toggl_entry_start_date" ON "toggl_entry" ("start_date");
+CREATE INDEX IF NOT EXISTS "ix_toggl_entry_project_start_date" ON "toggl_entry" ("toggl_project_id", "start_date");
+CREATE INDEX IF NOT EXISTS "ix_toggl_entry_user_start_date" ON "toggl_entry" ("toggl_user_id", "start_date");
+CREATE INDEX IF NOT EXISTS "ix_toggl_entry_task" ON "toggl_entry" ("toggl_task_id");
+CREATE INDEX IF NOT EXISTS "ix_toggl_entry_tag_tag" ON "toggl_entry_tag" ("toggl_tag_id");
+CREATE TABLE IF NOT EXISTS "toggl_daily_project_user" ("day" date, "workspace_id" bigint, "toggl_project_id" int,
+                                                      "toggl_user_id" int, "entry_count" int, "duration_secs" bigint);
+CREATE TABLE IF NOT EXISTS "toggl_daily_tag" ("day" date, "workspace_id" bigint, "toggl_tag_id" int,
+                                             "entry_count" int, "duration_secs" bigint);
+ALTER TABLE "toggl_daily_project_user" ADD COLUMN IF NOT EXISTS "workspace_id" bigint;
+ALTER TABLE "toggl_daily_tag" ADD COLUMN IF NOT EXISTS "workspace_id" bigint;
+CREATE INDEX IF NOT EXISTS "ix_toggl_daily_project_user_day"
+    ON "toggl_daily_project_user" ("day", "toggl_project_id", "toggl_user_id");
+CREATE INDEX IF NOT EXISTS "ix_toggl_daily_tag_day" ON "toggl_daily_tag" ("day", "toggl_tag_id");
+"""
+
+
+def create_rollup_tables(engine):
+    """Create the rollup tables and the toggl_entry indexes if they are missing
+
+    Args:
+        engine (SQLAlchemy engine object): SQLAlchemy engine object
+
+    Returns:
+        created (bool): True if the rollup tables or their workspace_id column had to be created, so they need a
+            rebuild_daily_rollups
+
+    """
+    with engine.begin() as conn:
+        # to_regclass resolves the table on the search path and is NULL while the table does not exist
+        missing = not conn.execute(text("SELECT EXISTS (SELECT 1 FROM pg_attribute "
+                                        "WHERE attrelid = to_regclass('toggl_daily_project_user') "
+                                        "AND attname = 'workspace_id' AND NOT attisdropped);")).scalar()
+        conn.execute(text(ROLLUP_SCHEMA_SQL))
+    return bool(missing)
+
+
+def entry_days(conn, entry_ids):
+    """Get the day each stored entry starts on, for example before the entries are updated so the days they move
+    away from are refreshed too
+
+    Args:
+        conn (SQLAlchemy connection object): Open connection
+        entry_ids (list): Entry ids
+
+    Returns:
+        day_dict (dict): Entry id -> date, for the entries that are stored
+
+    """
+    rows = conn.execute(text("SELECT id, CAST(start_date AS date) FROM toggl_entry WHERE id = ANY(:ids);"),
+                        {"ids": [int(entry_id) for entry_id in entry_ids]}).fetchall()
+    return {entry_id: day for entry_id, day in rows if day is not None}
+
+
+def refresh_daily_rollups(engine, days, conn=None, workspace_id=None):
+    """Rebuild the rollup rows of the given days from toggl_entry and toggl_entry_tag, in one transaction.
+    Days without entries any more lose their rows.
+
+    Args:
+        engine (SQLAlchemy engine object): SQLAlchemy engine object
+        days (iterable): Dates whose entries changed
+        conn (SQLAlchemy connection object, optional): Open connection inside the caller's transaction, the caller
+            commits. Defaults to a transaction of its own
+        workspace_id (int, optional): Only rebuild the rows of this workspace, so runs of other workspaces loading
+            the same days at the same time are left alone. Defaults to every workspace
+
+    Returns:
+        row_count (int): Number of rollup rows written
+
+    """
+    day_list = sorted(days)
+    if not day_list:
+        return 0
+
+    start_time = time.perf_counter()
+    with begin(engine, conn) as conn:
+        row_count = _refresh_days(conn, day_list, workspace_id)
+    print(f"Refreshed {row_count} rollup rows for {len(day_list)} days "
+          f"({time.perf_counter() - start_time:.2f} secs)")
+    return row_count
+
+
+def rebuild_daily_rollups(engine):
+    """Rebuild the rollup tables for every day with entries, in one transaction
+
+    Args:
+        engine (SQLAlchemy engine object): SQLAlchemy engine object
+
+    Returns:
+        row_count (int): Number of rollup rows written
+
+    """
+    start_time = time.perf_counter()
+    with engine.begin() as conn:
+        day_list = [row[0] for row in conn.execute(text("SELECT DISTINCT CAST(start_date AS date) FROM toggl_entry "
+                                                        "WHERE start_date IS NOT NULL ORDER BY 1;"))]
+        for table_name in ROLLUP_TABLES:
+            conn.execute(text(f"TRUNCATE {table_name};"))
+        row_count = _refresh_days(conn, day_list)
+    print(f"Rebuilt {row_count} rollup rows for {len(day_list)} days ({time.perf_counter() - start_time:.2f} secs)")
+    return row_count
+
+
+def _refresh_days(conn, day_list, workspace_id=None):
+    """Replace the rollup rows of the days in day_list of a workspace, or of every workspace, the caller commits"""
+    row_count = 0
+    params = {"days": day_list, "workspace_id": workspace_id}
+    for table_name, table in ROLLUP_TABLES.items():
+        conn.execute(text(f"DELETE FROM {table_name} WHERE day = ANY(CAST(:days AS date[])) "
+                          f"AND (CAST(:workspace_id AS bigint) IS NULL OR workspace_id = :workspace_id);"), params)
+        result = conn.execute(text(f"INSERT INTO {table_name} ({', '.join(table['columns'])}) "
+                                   f"{table['select_sql']};"), params)
+        row_count += result.rowcount
+    return row_count
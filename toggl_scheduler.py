@@ -0,0 +1,117 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import time
+
+# default number of stages run at once - the user, task and tag transforms are independent of each other
+DEFAULT_STAGE_WORKERS = 3
+
+
+class StageGraph():
+    def __init__(self, max_workers=DEFAULT_STAGE_WORKERS):
+        """Pipeline stages declared as a dependency graph. A stage starts as soon as every stage it depends on has
+        finished, so independent stages run at the same time on a thread pool. Stages that load tables either use
+        their own connection from the engine's connection pool, or share one connection - for example to load in one
+        transaction - and take turns on it behind a lock, in which case only the stages that do not load overlap.
+
+        Args:
+            max_workers (int, optional): Number of stages run at once, 1 runs them one after another in the order
+                they were added
+
+        Returns:
+
+        """
+        self.max_workers = max_workers
+        # stage name -> (function, list of names of the stages it depends on), in the order the stages were added
+        self.stages = {}
+        # stage name -> (start secs, end secs) of the last run, relative to the start of the run
+        self.timings = {}
+
+    def add(self, name, func, depends_on=()):
+        """Add a stage to the graph
+
+        Args:
+            name (str): Name of the stage, for example "task load"
+            func (function): Function run for the stage. It gets the dict of stage name -> return value of the
+                stages that finished so far, for example results["entry clean"]
+            depends_on (list, optional): Names of the stages that must finish before this stage starts, for example
+                the dimension loads a table has foreign keys to
+
+        Returns:
+
+        """
+        for dependency in depends_on:
+            if dependency not in self.stages:
+                # stages are added after their dependencies, so the graph can not have cycles
+                raise ValueError(f"Stage {name} depends on {dependency}, which has not been added")
+        self.stages[name] = (func, list(depends_on))
+
+    def run(self):
+        """Run every stage, each once all of its dependencies have finished. If a stage fails no new stages are
+        started, the running stages are waited for and the error is raised.
+
+        Args:
+
+        Returns:
+            results (dict): Stage name -> return value of the stage
+
+        """
+        results = {}
+        self.timings = {}
+        start_time = time.perf_counter()
+
+        pending = dict(self.stages)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                # start every stage whose dependencies have all finished, in the order the stages were added
+                for name, (func, depends_on) in list(pending.items()):
+                    if len(running) >= self.max_workers:
+                        break
+                    if all(dependency in results for dependency in depends_on):
+                        del pending[name]
+                        running[executor.submit(self._run_stage, name, func, results, start_time)] = name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        # let the running stages finish, their connections are returned to the pool
+                        wait(running)
+                        raise error
+                    results[name] = future.result()
+        return results
+
+    def critical_path(self):
+        """Find the chain of dependent stages that took the longest in the last run - the run can not finish faster
+        than this chain, however many stages run at once
+
+        Args:
+
+        Returns:
+            path_list (list): List of (stage name, secs) tuples, from the first stage of the chain to the last
+
+        """
+        # stage name -> (secs of the longest chain ending with the stage, previous stage of the chain)
+        chain_dict = {}
+        for name, (_, depends_on) in self.stages.items():
+            if name not in self.timings:
+                continue
+            secs = self.timings[name][1] - self.timings[name][0]
+            previous = max((dependency for dependency in depends_on if dependency in chain_dict),
+                           key=lambda dependency: chain_dict[dependency][0], default=None)
+            chain_dict[name] = (secs + (chain_dict[previous][0] if previous else 0.0), previous)
+
+        path_list = []
+        name = max(chain_dict, key=lambda stage_name: chain_dict[stage_name][0], default=None)
+        while name is not None:
+            path_list.append((name, self.timings[name][1] - self.timings[name][0]))
+            name = chain_dict[name][1]
+        return path_list[::-1]
+
+    def _run_stage(self, name, func, results, start_time):
+        """Run the function of a stage and record when it started and ended"""
+        stage_start_secs = time.perf_counter() - start_time
+        try:
+            return func(results)
+        finally:
+            self.timings[name] = (stage_start_secs, time.perf_counter() - start_time)
@@ -0,0 +1,179 @@
+from os import environ
+from os.path import join
+import sqlite3
+
+import pandas as pd
+
+# default location of the sqlite database
+SQLITE_FILE = join(environ["HOME"], "repos/toggl_api/toggl_api.sqlite")
+
+# rows sent per executemany call
+SQLITE_BATCH_SIZE = 5000
+
+# ids per IN (...) lookup - stays under the sqlite limit on bound variables
+SQLITE_LOOKUP_SIZE = 900
+
+# declared schema of the sqlite tables - columns the api returns that are not listed here are not stored
+SQLITE_TABLES = {
+    "toggl_projects": {
+        "columns": [("id", "INTEGER PRIMARY KEY"), ("wid", "INTEGER"), ("cid", "INTEGER"), ("name", "TEXT"),
+                    ("billable", "TEXT"), ("is_private", "TEXT"), ("active", "TEXT"), ("template", "TEXT"),
+                    ("template_id", "INTEGER"), ("at", "TEXT"), ("created_at", "TEXT"), ("color", "TEXT"),
+                    ("auto_estimates", "TEXT"), ("actual_hours", "INTEGER"), ("hex_color", "TEXT")],
+        # existing rows are only updated when this column changed
+        "change_column": "at",
+        "indexes": [],
+    },
+    "toggl_data": {
+        "columns": [("id", "INTEGER PRIMARY KEY"), ("pid", "INTEGER"), ("tid", "INTEGER"), ("uid", "INTEGER"),
+                    ("description", "TEXT"), ("start", "TEXT"), ("end", "TEXT"), ("updated", "TEXT"),
+                    ("dur", "INTEGER"), ("user", "TEXT"), ("use_stop", "TEXT"), ("client", "TEXT"),
+                    ("project", "TEXT"), ("project_color", "TEXT"), ("project_hex_color", "TEXT"), ("task", "TEXT"),
+                    ("billable", "REAL"), ("is_billable", "TEXT"), ("cur", "TEXT"), ("tags", "TEXT"),
+                    ("dur_secs", "REAL")],
+        "change_column": "updated",
+        "indexes": [("pid", "start"), ("uid", "start")],
+    },
+}
+
+
+def connect_sqlite(db_file):
+    """Open a sqlite database in WAL mode and create the declared tables and indexes that are missing
+
+    Args:
+        db_file (str): Full path to the sqlite database file
+
+    Returns:
+        conn (sqlite3 connection object): Open connection
+
+    """
+    conn = sqlite3.connect(db_file)
+    # readers are not blocked while a run writes, and commits only sync the write ahead log
+    conn.execute("PRAGMA journal_mode = WAL;")
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    for table_name in SQLITE_TABLES:
+        create_table(conn, table_name)
+    return conn
+
+
+def create_table(conn, table_name):
+    """Create a declared table and its indexes. A table written by DataFrame.to_sql without a primary key is
+    migrated to the declared schema, keeping its rows.
+
+    Args:
+        conn (sqlite3 connection object): Open connection
+        table_name (str): Name of a table in SQLITE_TABLES
+
+    Returns:
+
+    """
+    table = SQLITE_TABLES[table_name]
+    column_sql = ", ".join(f'"{col}" {col_type}' for col, col_type in table["columns"])
+
+    with conn:
+        existing_column_list = [row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}");')]
+        has_primary_key = any(row[5] for row in conn.execute(f'PRAGMA table_info("{table_name}");'))
+        if existing_column_list and not has_primary_key:
+            print(f"Migrating {table_name} table to the declared schema")
+            conn.execute(f'ALTER TABLE "{table_name}" RENAME TO "{table_name}_old";')
+            conn.execute(f'CREATE TABLE "{table_name}" ({column_sql});')
+            # copy the columns both tables have - the last copy of a duplicated id wins
+            copy_list = ", ".join(f'"{col}"' for col, _ in table["columns"] if col in existing_column_list)
+            conn.execute(f'INSERT OR REPLACE INTO "{table_name}" ({copy_list}) '
+                         f'SELECT {copy_list} FROM "{table_name}_old";')
+            conn.execute(f'DROP TABLE "{table_name}_old";')
+        else:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS "{table_name}" ({column_sql});')
+
+        for index_columns in table["indexes"]:
+            index_name = f"ix_{table_name}_{'_'.join(index_columns)}"
+            index_list = ", ".join(f'"{col}"' for col in index_columns)
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table_name}" ({index_list});')
+
+
+def upsert_rows(conn, table_name, dataframe_name, batch_size=SQLITE_BATCH_SIZE):
+    """Insert new rows and update changed rows of a declared table with batched INSERT ... ON CONFLICT DO UPDATE
+    in one transaction. Existing rows are only updated when their change column differs, so rerunning with the same
+    data writes nothing.
+
+    Args:
+        conn (sqlite3 connection object): Open connection
+        table_name (str): Name of a table in SQLITE_TABLES
+        dataframe_name (Pandas DataFrame object): Pandas DataFrame containing data to write to table. Columns not
+            in the declared schema are dropped
+        batch_size (int, optional): Number of rows sent per executemany call
+
+    Returns:
+        row_count (int): Number of rows inserted or updated
+
+    """
+    table = SQLITE_TABLES[table_name]
+    column_list = [col for col, _ in table["columns"]]
+    change_column = table["change_column"]
+
+    # declared columns only, dates as text and NaN as NULL
+    dataframe_name = dataframe_name.reindex(columns=column_list)
+    for col in column_list:
+        if pd.api.types.is_datetime64_any_dtype(dataframe_name[col]):
+            dataframe_name[col] = dataframe_name[col].dt.strftime("%Y-%m-%d %H:%M:%S")
+    row_list = dataframe_name.astype(object).where(dataframe_name.notnull(), None).values.tolist()
+
+    insert_list = ", ".join(f'"{col}"' for col in column_list)
+    value_list = ", ".join("?" for _ in column_list)
+    set_list = ", ".join(f'"{col}" = excluded."{col}"' for col in column_list[1:])
+    upsert_sql = (f'INSERT INTO "{table_name}" ({insert_list}) VALUES ({value_list}) '
+                  f'ON CONFLICT ("id") DO UPDATE SET {set_list} '
+                  f'WHERE "{table_name}"."{change_column}" IS NOT excluded."{change_column}";')
+
+    total_changes = conn.total_changes
+    with conn:
+        for batch_start in range(0, len(row_list), batch_size):
+            conn.executemany(upsert_sql, row_list[batch_start:batch_start + batch_size])
+    return conn.total_changes - total_changes
+
+
+def stored_entries(conn, entry_ids):
+    """Get the start day and updated timestamp of stored toggl_data entries, for example to tell which entries of a
+    pull are new or changed and which days they move away from
+
+    Args:
+        conn (sqlite3 connection object): Open connection
+        entry_ids (list): Entry ids
+
+    Returns:
+        entry_dict (dict): Entry id -> (ISO formatted start day, updated) for the entries that are stored
+
+    """
+    entry_id_list = [int(entry_id) for entry_id in entry_ids]
+    entry_dict = {}
+    for batch_start in range(0, len(entry_id_list), SQLITE_LOOKUP_SIZE):
+        batch = entry_id_list[batch_start:batch_start + SQLITE_LOOKUP_SIZE]
+        rows = conn.execute(f'SELECT id, substr("start", 1, 10), "updated" FROM toggl_data '
+                            f'WHERE id IN ({", ".join("?" for _ in batch)});', batch)
+        entry_dict.update((entry_id, (day, updated)) for entry_id, day, updated in rows)
+    return entry_dict
+
+
+def delete_entries(conn, entry_ids):
+    """Delete toggl_data entries, for example entries that were deleted in toggl
+
+    Args:
+        conn (sqlite3 connection object): Open connection
+        entry_ids (list): Entry ids
+
+    Returns:
+        day_set (set): ISO formatted days the deleted entries started on
+
+    """
+    entry_id_list = [int(entry_id) for entry_id in entry_ids]
+    day_set = set()
+    deleted_count = 0
+    with conn:
+        for batch_start in range(0, len(entry_id_list), SQLITE_LOOKUP_SIZE):
+            batch = entry_id_list[batch_start:batch_start + SQLITE_LOOKUP_SIZE]
+            id_sql = ", ".join("?" for _ in batch)
+            day_set |= {row[0] for row in conn.execute(f'SELECT DISTINCT substr("start", 1, 10) FROM toggl_data '
+                                                       f'WHERE id IN ({id_sql});', batch) if row[0] is not None}
+            deleted_count += conn.execute(f"DELETE FROM toggl_data WHERE id IN ({id_sql});", batch).rowcount
+    print(f"Deleted {deleted_count} rows from toggl_data table")
+    return day_set
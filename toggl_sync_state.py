@@ -0,0 +1,256 @@
+from datetime import date, datetime, timedelta
+import json
+from os import environ, getpid, replace
+from os.path import exists, join
+
+from toggl_config import locked_file
+
+# default location of the sync state file
+SYNC_STATE_FILE = join(environ["HOME"], "repos/toggl_api/sync_state.json")
+
+# the detailed report api only accepts date ranges up to one year long
+MAX_WINDOW_DAYS = 365
+
+# first year a full pull starts from
+BASE_YEAR = 2019
+
+
+class SyncState():
+    def __init__(self, workspace_id, pipeline, state_file=None, lookback_days=7):
+        """Load the sync state of a pipeline for a workspace. The state file keeps, per pipeline and project, the
+        latest "updated" timestamp that was loaded and the last date the project was synced up to. The file looks
+        like:
+            {
+                "pipeline": {
+                    "workspace_id": {
+                        "project_id": {
+                            "updated": "2020-06-30T10:12:45+02:00",
+                            "synced_until": "2020-06-30",
+                            "granularity": "month"
+                        }
+                    }
+                }
+            }
+
+        Each pipeline loads into its own store, so it keeps its own watermarks - an entry another pipeline already
+        loaded may still be missing from this one.
+
+        Args:
+            workspace_id (str): Toggl workspace id the state belongs to
+            pipeline (str): Name of the pipeline the state belongs to, for example "toggl_data_pull"
+            state_file (str, optional): Full path to the sync state json file
+            lookback_days (int, optional): Number of days before the last synced date to pull again, to pick up
+                entries that were edited shortly after the last sync
+
+        Returns:
+
+        """
+        self.workspace_id = str(workspace_id)
+        self.pipeline = pipeline
+        self.state_file = state_file or SYNC_STATE_FILE
+        self.lookback_days = lookback_days
+
+        self.data = {}
+        if exists(self.state_file):
+            with open(self.state_file) as json_data_file:
+                self.data = _pipeline_state(json.load(json_data_file))
+
+        self.projects = self.data.setdefault(self.pipeline, {}).setdefault(self.workspace_id, {})
+
+    def watermark(self, project_id):
+        """Get the latest "updated" timestamp loaded for a project
+
+        Args:
+            project_id (int): Project id
+
+        Returns:
+            updated (str): ISO formatted timestamp, None if the project has never been synced
+
+        """
+        return self.projects.get(str(project_id), {}).get("updated")
+
+    def watermarks(self):
+        """Get the latest "updated" timestamp loaded for every synced project
+
+        Args:
+
+        Returns:
+            watermark_dict (dict): Project id (int) to ISO formatted timestamp
+
+        """
+        return {int(project_id): project_state["updated"] for project_id, project_state in self.projects.items()
+                if project_state.get("updated")}
+
+    def granularities(self):
+        """Get the date range granularity remembered for every project that needed its date ranges split
+
+        Args:
+
+        Returns:
+            granularity_dict (dict): Project id (int) to granularity, for example "month"
+
+        """
+        return {int(project_id): project_state["granularity"] for project_id, project_state in self.projects.items()
+                if project_state.get("granularity")}
+
+    def set_granularity(self, project_id, granularity):
+        """Remember the granularity the date ranges of a project had to be split into
+
+        Args:
+            project_id (int): Project id
+            granularity (str): Granularity, for example "month"
+
+        Returns:
+
+        """
+        self.projects.setdefault(str(project_id), {})["granularity"] = granularity
+
+    def date_range_list(self, project_id, full_date_range_list, end_date=None):
+        """Get the date ranges to pull for a project
+
+        Projects that have never been synced get the full date range list. Synced projects get the date ranges
+        from their last synced date, minus the lookback days, up until end_date.
+
+        Args:
+            project_id (int): Project id
+            full_date_range_list (list): Nested list of date ranges used for a full pull
+            end_date (date, optional): Last date to pull, defaults to today
+
+        Returns:
+            date_range_list (list): Nested list of date ranges, for example:
+                [[datetime.date(2020, 6, 23), datetime.date(2020, 7, 1)]]
+
+        """
+        synced_until = self.projects.get(str(project_id), {}).get("synced_until")
+        if not synced_until:
+            return full_date_range_list
+
+        start_date = datetime.strptime(synced_until, "%Y-%m-%d").date() - timedelta(days=self.lookback_days)
+        return split_date_range(start_date, end_date or date.today())
+
+    def update(self, project_id, updated=None, synced_until=None):
+        """Move the watermark of a project forward
+
+        Args:
+            project_id (int): Project id
+            updated (str, optional): ISO formatted "updated" timestamp of the newest entry loaded
+            synced_until (date, optional): Date the project has been synced up to, defaults to today
+
+        Returns:
+
+        """
+        project_state = self.projects.setdefault(str(project_id), {})
+        # never move the watermark backwards
+        if updated and (not project_state.get("updated") or
+                        _parse_timestamp(updated) > _parse_timestamp(project_state["updated"])):
+            project_state["updated"] = updated
+        project_state["synced_until"] = (synced_until or date.today()).strftime("%Y-%m-%d")
+
+    def save(self):
+        """Write the sync state to the state file
+
+        Args:
+
+        Returns:
+
+        """
+        # runs of other workspaces save the same file - hold the lock from reading their state to replacing the file
+        with locked_file(self.state_file):
+            # runs of other workspaces and pipelines may have saved the file since it was read - keep their state
+            if exists(self.state_file):
+                with open(self.state_file) as json_data_file:
+                    self.data = _pipeline_state(json.load(json_data_file))
+                self.data.setdefault(self.pipeline, {})[self.workspace_id] = self.projects
+
+            # write to a temp file first so a crash never leaves a half written state file
+            temp_file = f"{self.state_file}.{getpid()}.tmp"
+            with open(temp_file, "w") as json_data_file:
+                json.dump(self.data, json_data_file, indent=4, sort_keys=True)
+            replace(temp_file, self.state_file)
+
+
+def split_date_range(start_date, end_date):
+    """Split a date range into consecutive date ranges the api accepts
+
+    Args:
+        start_date (date): First date of the range
+        end_date (date): Last date of the range
+
+    Returns:
+        date_range_list (list): Nested list of date ranges, each at most MAX_WINDOW_DAYS long
+
+    """
+    date_range_list = []
+    while start_date <= end_date:
+        window_end_date = min(start_date + timedelta(days=MAX_WINDOW_DAYS - 1), end_date)
+        date_range_list.append([start_date, window_end_date])
+        start_date = window_end_date + timedelta(days=1)
+    return date_range_list
+
+
+def add_years(dt, years):
+    """Takes date and adds years to it
+
+    Args:
+        dt (datetime): Date to increment years
+        years (int): How many years to increment the date
+
+    Returns:
+        Date plus how many years you want to increment
+    """
+    try:
+        # Return same day of the current year
+        return dt.replace(year=dt.year + years)
+    except ValueError:
+        # If not same day, it will return other, i.e.  February 29 to March 1 etc.
+        return dt + (date(dt.year + years, 1, 1) - date(dt.year, 1, 1))
+
+
+def build_date_range_list(base_year=BASE_YEAR):
+    """Build the list of yearly date ranges from the base year up until the current year, used for a full pull
+
+    Args:
+        base_year (int, optional): First year to pull
+
+    Returns:
+        date_range_list (list): Nested list of date ranges, for example:
+            [[datetime.date(2019, 1, 1), datetime.date(2019, 12, 31)]]
+
+    """
+    # create base_start_date as Jan 1st from base year
+    base_start_date = date(base_year, 1, 1)
+    # create base_end_date as Dec 31st from base year
+    base_end_date = date(base_year, 12, 31)
+
+    date_range_list = []
+    for i in range(0, datetime.today().year - base_start_date.year + 1):
+        date_range_list.append([add_years(base_start_date, i), add_years(base_end_date, i)])
+    return date_range_list
+
+
+def _pipeline_state(data):
+    """Drop the workspaces of a state file written before the state was kept per pipeline. Their watermarks were
+    moved forward by whichever pipeline ran last, so the pipelines pull every project once more instead.
+
+    Args:
+        data (dict): Contents of the state file
+
+    Returns:
+        data (dict): Pipeline name -> workspace id -> project id -> project state
+
+    """
+    # workspace ids are numbers, pipeline names are not
+    return {key: value for key, value in data.items() if not key.isdigit()}
+
+
+def _parse_timestamp(timestamp):
+    """Parse an ISO formatted timestamp from the api
+
+    Args:
+        timestamp (str): ISO formatted timestamp, for example "2020-06-30T10:12:45+02:00"
+
+    Returns:
+        datetime (datetime object): Timezone aware datetime
+
+    """
+    return datetime.fromisoformat(timestamp)
@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+import pytz
+
+# default number of entries transformed and loaded at once
+ENTRY_CHUNK_SIZE = 50000
+
+# columns of the raw entries holding the same few strings over and over - stored as categoricals
+CATEGORY_COLUMNS = ["user", "description", "project", "client", "project_color", "project_hex_color", "task",
+                    "cur"]
+
+# columns of the raw entries holding booleans
+BOOL_COLUMNS = ["use_stop", "is_billable"]
+
+# columns of the raw entries holding integer ids and counts - downcast to the smallest integer type that fits
+INTEGER_COLUMNS = ["id", "pid", "tid", "uid", "dur"]
+
+
+def convert_to_utc(datetime_obj):
+    """Convert datetime object to UTC. This datetime object must already have timezone specified.
+    
+    Args:
+        datetime_obj (datetime object): Date of the entry
+    
+    Returns:
+        utc_datetime (datetime object): Date coverted to UTC
+    
+    """
+    
+    # Convert to UTC
+    utc_datetime = datetime_obj.astimezone(pytz.utc).replace(tzinfo=None)
+    
+    return utc_datetime
+
+
+def convert_columns_to_utc(dataframe_name, column_list):
+    """Convert whole date columns to UTC without timezone. The columns can hold ISO formatted strings with an
+    offset (as returned by the api) or timezone aware datetimes, with mixed offsets.
+
+    Args:
+        dataframe_name (Pandas DataFrame object): Pandas DataFrame containing the date columns
+        column_list (list): List of date columns to convert
+
+    Returns:
+        dataframe_name (Pandas DataFrame object): Pandas DataFrame with the date columns in UTC
+
+    """
+    for col in column_list:
+        # Parse to timezone aware UTC, then drop the timezone
+        dataframe_name[col] = pd.to_datetime(dataframe_name[col], utc=True).dt.tz_localize(None)
+    return dataframe_name
+
+
+def iter_page_chunks(page_iter, chunk_size=ENTRY_CHUNK_SIZE):
+    """Group pages of toggl entries into dataframes of about chunk_size entries, so only one chunk is held in
+    memory at a time. Pages are never split, so a chunk can go over chunk_size by up to one page.
+
+    Args:
+        page_iter (iterable): Pages of toggl entries, each a list of dictionaries
+        chunk_size (int, optional): Number of entries per chunk
+
+    Yields:
+        chunk_df (Pandas DataFrame object): Pandas DataFrame of toggl entries
+
+    """
+    row_list = []
+    for page in page_iter:
+        row_list.extend(page)
+        if len(row_list) >= chunk_size:
+            yield pd.DataFrame(row_list)
+            row_list = []
+    if row_list:
+        yield pd.DataFrame(row_list)
+
+
+def explode_tags(dataframe_name, id_column="id", tag_column="tags"):
+    """Turn the tag lists of the entries into a tall dataframe with one row per entry and tag. The unique
+    tag_name values give the tag dimension and the rows give the entry tag bridge.
+
+    Args:
+        dataframe_name (Pandas DataFrame object): Pandas DataFrame of toggl entries, tags as lists
+        id_column (str, optional): Name of the entry id column
+        tag_column (str, optional): Name of the column holding the tag lists
+
+    Returns:
+        entry_tag_df (Pandas DataFrame object): Pandas DataFrame with the entry id column and a tag_name column
+
+    """
+    # One row per tag - entries without tags explode to a single NaN row
+    entry_tag_df = dataframe_name[[id_column, tag_column]].explode(tag_column)
+    entry_tag_df = entry_tag_df[entry_tag_df[tag_column].notnull()]
+    entry_tag_df = entry_tag_df.rename(columns={tag_column: "tag_name"})
+
+    # Strip whitespace and drop empty tags
+    entry_tag_df["tag_name"] = entry_tag_df["tag_name"].astype(str).str.strip()
+    entry_tag_df = entry_tag_df[entry_tag_df["tag_name"] != ""]
+
+    # a handful of tags repeated over every entry
+    entry_tag_df["tag_name"] = entry_tag_df["tag_name"].astype("category")
+    return entry_tag_df.drop_duplicates().reset_index(drop=True)
+
+
+def compact_entries(dataframe_name, columns=None):
+    """Store the raw entries in compact types - categoricals for repeated strings, booleans instead of objects and
+    the smallest integer type that fits for the ids. Columns not in the dataframe are skipped.
+
+    Args:
+        dataframe_name (Pandas DataFrame object): Pandas DataFrame of raw toggl entries
+        columns (list, optional): Columns to keep, all columns if not given
+
+    Returns:
+        dataframe_name (Pandas DataFrame object): Pandas DataFrame with the compact columns, a new dataframe so the
+            raw entries can be released
+
+    """
+    if columns is not None:
+        dataframe_name = dataframe_name[[col for col in columns if col in dataframe_name.columns]]
+    compact_dict = {}
+    for col in dataframe_name.columns:
+        if col in CATEGORY_COLUMNS:
+            compact_dict[col] = dataframe_name[col].astype("category")
+        elif col in BOOL_COLUMNS:
+            # entries missing the field get NA instead of turning the column back into objects
+            has_null = dataframe_name[col].isnull().any()
+            compact_dict[col] = dataframe_name[col].astype("boolean" if has_null else bool)
+        elif col in INTEGER_COLUMNS:
+            compact_dict[col] = downcast_ids(dataframe_name[col])
+        else:
+            compact_dict[col] = dataframe_name[col]
+    return pd.DataFrame(compact_dict, index=dataframe_name.index)
+
+
+def fill_missing_names(name_series, fill_value=""):
+    """Give the entries without a name, for example entries without a description, an empty name instead of NaN.
+    A NULL name never equals itself, so it could not be matched to its dimension row on the natural key.
+
+    Args:
+        name_series (Pandas Series object): Series of names, plain or categorical
+        fill_value (str, optional): Name of the entries without one
+
+    Returns:
+        name_series (Pandas Series object): Series of names without missing values
+
+    """
+    if not name_series.isnull().any():
+        return name_series
+    if isinstance(name_series.dtype, pd.CategoricalDtype) and fill_value not in name_series.cat.categories:
+        name_series = name_series.cat.add_categories([fill_value])
+    return name_series.fillna(fill_value)
+
+
+def downcast_ids(id_series):
+    """Downcast an integer column to the smallest integer type that fits. Columns with missing values, for example
+    entries without a task, use the nullable integer types instead of float.
+
+    Args:
+        id_series (Pandas Series object): Series of integers, can hold NaN
+
+    Returns:
+        id_series (Pandas Series object): Downcast Series
+
+    """
+    id_series = pd.to_numeric(id_series)
+    if not id_series.isnull().any():
+        return pd.to_numeric(id_series, downcast="integer")
+    max_id = id_series.abs().max()
+    # a column with no values at all, for example tid when no entry has a task, is stored as the smaller type
+    if pd.isnull(max_id) or max_id <= np.iinfo(np.int32).max:
+        return id_series.astype("Int32")
+    return id_series.astype("Int64")
+
+
+def memory_bytes(dataframe_name):
+    """Get the memory held by a dataframe, counting the strings and lists in object columns
+
+    Args:
+        dataframe_name (Pandas DataFrame object): Pandas DataFrame to measure
+
+    Returns:
+        byte_count (int): Bytes held by the dataframe and its index
+
+    """
+    return int(dataframe_name.memory_usage(index=True, deep=True).sum())
+
+
+def join_tags(tag_series, sep=", "):
+    """Join the tag lists of the entries into one string per entry, for tables that store tags as text
+
+    Args:
+        tag_series (Pandas Series object): Series of tag lists
+        sep (str, optional): Separator between the tags
+
+    Returns:
+        tag_series (Pandas Series object): Series of joined tags, NaN for entries without tags
+
+    """
+    tag_series = tag_series.str.join(sep)
+    return tag_series.where(tag_series.notnull() & (tag_series != ""), np.nan)
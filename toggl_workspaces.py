@@ -0,0 +1,126 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+import time
+
+from toggl_config import load_config, select_workspace, workspace_configs, workspace_file
+from toggl_query import QueryCache
+import toggl_relational_extract as tre
+
+DESCRIPTION = "Pull every workspace of the config at once, one process per workspace, into the postgres toggl_* tables"
+
+
+def add_arguments(parser):
+    """Add the command line arguments of the pipeline to an argument parser - the arguments of
+    toggl_relational_extract.py, used for the run of every workspace, and the workspaces to run
+
+    Args:
+        parser (ArgumentParser object): Parser of the pipeline or of its toggl_cli.py subcommand
+
+    Returns:
+
+    """
+    tre.add_arguments(parser)
+    parser.add_argument("--workspaces", nargs="+", default=None,
+                        help="Workspace ids of the config to pull, defaults to every workspace in the config")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Number of workspaces pulled at once, defaults to one process per workspace")
+
+
+def run_workspace(args, workspace_id):
+    """Run toggl_relational_extract.py for one workspace, in a worker process. The process has its own TogglApi, so
+    its own rate limiter and connection pool, and loads in a transaction of its own.
+
+    Args:
+        args (Namespace object): Parsed add_arguments arguments
+        workspace_id (str): Workspace id
+
+    Returns:
+        result (tuple): (entry_count, secs)
+
+    """
+    args = argparse.Namespace(**vars(args))
+    args.workspace_id = workspace_id
+    # each workspace reports its metrics to a file of its own
+    args.metrics_file = workspace_file(args.metrics_file, workspace_id)
+    args.prometheus_file = workspace_file(args.prometheus_file, workspace_id)
+
+    start_time = time.perf_counter()
+    entry_count = tre.run(args, schema_ready=True)
+    return entry_count, time.perf_counter() - start_time
+
+
+def run(args):
+    """Pull the workspaces of the config in parallel worker processes, all loading into the same toggl_* tables.
+    The schema is brought up to date once before the workers start, so they never wait on each other's DDL.
+
+    Args:
+        args (Namespace object): Parsed add_arguments arguments
+
+    Returns:
+        entry_count (int): Number of entries transformed and loaded across the workspaces
+
+    """
+    config = load_config(args.config_file)
+    toggl_config_list = workspace_configs(config)
+    workspace_id_list = args.workspaces or [str(toggl_config["workspace_id"]) for toggl_config in toggl_config_list]
+    for workspace_id in workspace_id_list:
+        # fail before any worker starts if a workspace is not in the config
+        select_workspace(config, workspace_id)
+
+    # rows loaded before the toggl_* tables were keyed by workspace belong to the first workspace of the config
+    engine = tre.build_engine(config["database_config"])
+    query_cache = QueryCache(config["toggl_config"].get("query_cache_file"))
+    tre.prepare_schema(engine, int(toggl_config_list[0]["workspace_id"]), query_cache,
+                       rebuild_rollups=args.rebuild_rollups)
+    engine.dispose()
+
+    start_time = time.perf_counter()
+    result_dict = {}
+    error_dict = {}
+    # spawn fresh interpreters - nothing of this process, like open connections, is shared with the workers
+    with ProcessPoolExecutor(max_workers=args.processes or len(workspace_id_list),
+                             mp_context=get_context("spawn")) as executor:
+        future_dict = {executor.submit(run_workspace, args, workspace_id): workspace_id
+                       for workspace_id in workspace_id_list}
+        for future in as_completed(future_dict):
+            workspace_id = future_dict[future]
+            try:
+                result_dict[workspace_id] = future.result()
+            except Exception as error:
+                # the run of the workspace was rolled back, the other workspaces carry on
+                error_dict[workspace_id] = error
+    total_secs = time.perf_counter() - start_time
+
+    print(f"{'workspace':>12} {'entries':>9} {'secs':>8}")
+    for workspace_id in workspace_id_list:
+        if workspace_id in result_dict:
+            entry_count, secs = result_dict[workspace_id]
+            print(f"{workspace_id:>12} {entry_count:9d} {secs:8.2f}")
+        else:
+            print(f"{workspace_id:>12} failed: {error_dict[workspace_id]}")
+    slowest_secs = max((secs for _, secs in result_dict.values()), default=0.0)
+    print(f"{len(workspace_id_list)} workspaces in {total_secs:.2f} secs, slowest workspace {slowest_secs:.2f} secs")
+
+    if error_dict:
+        raise RuntimeError(f"{len(error_dict)} of {len(workspace_id_list)} workspaces failed: "
+                           f"{', '.join(sorted(error_dict))}")
+    return sum(entry_count for entry_count, _ in result_dict.values())
+
+
+def main(argv=None):
+    """Run the pipeline from the command line
+
+    Args:
+        argv (list, optional): Command line arguments, defaults to sys.argv
+
+    Returns:
+
+    """
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()